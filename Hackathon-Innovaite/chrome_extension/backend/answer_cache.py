@@ -0,0 +1,303 @@
+# answer_cache.py
+# Two-tier answer cache placed in front of the RAG pipeline.
+#
+# - exact tier:    keyed on the normalized query text
+# - semantic tier: reuses a cached answer when the embedding of the new query
+#                  is within a cosine-similarity threshold of a cached query
+#
+# Entries are evicted LRU-first when the entry count or the memory cap is
+# exceeded, expire after a TTL, and the whole cache is dropped when the
+# ingested collection changes (see `CollectionVersion`).
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a user query so that trivially different spellings share a key.
+
+    Lowercases, drops punctuation and collapses whitespace:
+    "How does the Exchange work?? " -> "how does the exchange work"
+    """
+    text = query.strip().lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def write_collection_version(path: Path, collection_name: str) -> str:
+    """
+    Record that `collection_name` has just been (re-)ingested.
+
+    Called by the ingestion script; every cache that watches the same file
+    is invalidated on its next lookup.
+
+    Returns:
+        The new version string
+    """
+    version = f"{collection_name}:{time.time_ns()}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(version, encoding="utf-8")
+    return version
+
+
+class CollectionVersion:
+    """
+    Cheap watcher for the collection version file written by the ingestion script.
+
+    The file is stat'ed at most once every `check_interval` seconds, so it can be
+    called on every cache lookup.
+    """
+
+    def __init__(self, path: Path, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._last_check = 0.0
+        self._mtime = None
+        self._version = ""
+
+    def current(self) -> str:
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return self._version
+        self._last_check = now
+
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._version = None, ""
+            return self._version
+
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._version = self.path.read_text(encoding="utf-8").strip()
+        return self._version
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    answer: str
+    embedding: np.ndarray | None
+    created_at: float
+    size: int = field(default=0)
+
+
+class AnswerCache:
+    """
+    Thread-safe LRU/TTL answer cache with an exact and a semantic tier.
+
+    Args:
+        max_entries: Maximum number of cached answers
+        max_bytes: Approximate memory cap for answers + embeddings
+        ttl_seconds: Time after which an entry is considered stale
+        similarity_threshold: Minimum cosine similarity for a semantic hit
+        version: Optional `CollectionVersion`; the cache is cleared when it changes
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 3600.0,
+        similarity_threshold: float = 0.95,
+        version: CollectionVersion | None = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version = version
+
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._seen_version = version.current() if version else ""
+
+        # Normalized embeddings of the semantic tier, one row per entry: rows
+        # [0, _rows) are in use, _matrix_keys[row] is the key of a row and
+        # _row_of its inverse. Rows are written in place, never restacked
+        self._matrix: np.ndarray | None = None
+        self._rows = 0
+        self._matrix_keys: list[str] = []
+        self._row_of: dict[str, int] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # --- lookups -----------------------------------------------------------
+
+    def get(self, query: str) -> str | None:
+        """Exact-tier lookup on the normalized query."""
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.answer
+            if entry is not None:
+                self._remove(key)
+                self.expirations += 1
+            return None
+
+    def get_semantic(self, embedding) -> str | None:
+        """Semantic-tier lookup: closest cached query above the similarity threshold."""
+        query_vec = _as_unit_vector(embedding)
+        with self._lock:
+            self._check_version()
+            if not self._rows or self._matrix.shape[1] != query_vec.shape[0]:
+                return None
+            matrix = self._matrix[: self._rows]
+
+            scores = matrix @ query_vec
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+
+            key = self._matrix_keys[best]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return entry.answer
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    # --- updates -----------------------------------------------------------
+
+    def put(self, query: str, answer: str, embedding=None):
+        """Store an answer; `embedding` (of the raw query) enables the semantic tier."""
+        key = normalize_query(query)
+        vec = _as_unit_vector(embedding) if embedding is not None else None
+        size = len(key.encode("utf-8")) + len(answer.encode("utf-8"))
+        if vec is not None:
+            size += vec.nbytes
+
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._check_version()
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = CacheEntry(
+                key=key,
+                answer=answer,
+                embedding=vec,
+                created_at=time.monotonic(),
+                size=size,
+            )
+            self._bytes += size
+            if vec is not None:
+                self._add_row(key, vec)
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "collection_version": self._seen_version,
+            }
+
+    # --- internals (caller holds the lock) ---------------------------------
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if key in self._row_of:
+            self._drop_row(key)
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._matrix = None
+        self._rows = 0
+        self._matrix_keys = []
+        self._row_of = {}
+
+    def _check_version(self):
+        if self.version is None:
+            return
+        current = self.version.current()
+        if current != self._seen_version:
+            self._seen_version = current
+            self._clear()
+            self.invalidations += 1
+
+    def _add_row(self, key: str, vec: np.ndarray):
+        if self._matrix is None or self._matrix.shape[1] != vec.shape[0]:
+            # First embedding, or another embedding size: the old rows cannot be compared
+            self._matrix = np.empty((max(1, min(64, self.max_entries)), vec.shape[0]), dtype=np.float32)
+            self._rows = 0
+            self._matrix_keys = []
+            self._row_of = {}
+        elif self._rows == self._matrix.shape[0]:
+            grown = np.empty((min(2 * self._rows, self.max_entries + 1), vec.shape[0]), dtype=np.float32)
+            grown[: self._rows] = self._matrix[: self._rows]
+            self._matrix = grown
+        self._matrix[self._rows] = vec
+        self._matrix_keys.append(key)
+        self._row_of[key] = self._rows
+        self._rows += 1
+
+    def _drop_row(self, key: str):
+        # The last row takes the place of the dropped one
+        row = self._row_of.pop(key)
+        last = self._rows - 1
+        if row != last:
+            moved = self._matrix_keys[last]
+            self._matrix[row] = self._matrix[last]
+            self._matrix_keys[row] = moved
+            self._row_of[moved] = row
+        self._matrix_keys.pop()
+        self._rows -= 1
+
+
+def _as_unit_vector(embedding) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
@@ -0,0 +1,269 @@
+# fake_openai.py
+# Local stand-in for the OpenAI endpoints used by the backend, for offline load tests.
+#
+#   POST /v1/responses    Responses API, streaming (SSE) and non-streaming.
+#                         Requests with tools get a function call echoing the user
+#                         text (the ToolRewriter); prompts asking for JSON get a
+#                         {"subject", "body"} object (the escalation email).
+#   POST /v1/embeddings   Deterministic hashed bag-of-words vectors, so that texts
+#                         sharing words are close and retrieval stays meaningful.
+#   GET  /v1/models       One fake model (the API's startup warm-up lists the models).
+#
+# Latency model: `--latency-ms` before the first token, then `--tokens-per-second`.
+#
+# Usage (from the backend folder):
+#   python -m benchmarks.fake_openai --port 8081 --latency-ms 300 --tokens-per-second 50
+#   OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=fake uvicorn main:app
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+_WORD = re.compile(r"\w+")
+
+FILLER = (
+    "According to the official documents the procedure is handled by the student office "
+    "and the deadlines are published every semester on the university website so please "
+    "check the relevant page and contact the helpdesk for any specific case"
+).split()
+
+
+def fake_embedding(text: str, dimensions: int = 1536) -> np.ndarray:
+    """Signed feature hashing of the lowercased words, L2-normalized (float32)."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dimensions] += 1.0 if (value >> 63) & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm:
+        vector /= norm
+    else:
+        vector[0] = 1.0
+    return vector
+
+
+def _count_tokens(text: str) -> int:
+    # ~0.75 words per token, close enough for a load model
+    return max(1, int(len(text.split()) / 0.75))
+
+
+def _input_text(payload) -> str:
+    """Flatten the Responses API `input` (string or message list) to plain text."""
+    if isinstance(payload, str):
+        return payload
+    parts = []
+    for message in payload or []:
+        content = message.get("content", "") if isinstance(message, dict) else ""
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content if isinstance(block, dict))
+    return "\n".join(parts)
+
+
+def _last_user_text(payload) -> str:
+    if isinstance(payload, str):
+        return payload
+    for message in reversed(payload or []):
+        if isinstance(message, dict) and message.get("role") == "user":
+            return _input_text([message])
+    return _input_text(payload)
+
+
+class FakeModel:
+    """
+    Args:
+        latency_ms: Time before the first output token
+        tokens_per_second: Output rate after the first token (0 = instant)
+        answer_tokens: Length of the generated text answers
+        embed_latency_ms: Latency of an embeddings request
+        dimensions: Embedding size when the request does not ask for one
+    """
+
+    def __init__(
+        self,
+        latency_ms=300.0,
+        tokens_per_second=50.0,
+        answer_tokens=60,
+        embed_latency_ms=20.0,
+        dimensions=1536,
+    ):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.embed_latency = embed_latency_ms / 1000
+        self.dimensions = dimensions
+
+    def token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def output_for(self, body: dict) -> tuple[dict, str]:
+        """Return (output item, output text) for a Responses request."""
+        prompt = _input_text(body.get("input"))
+        tools = body.get("tools") or []
+
+        if tools:
+            tool = tools[0]
+            params = tool.get("parameters", {})
+            arg = (params.get("required") or list(params.get("properties", {})) or ["query"])[0]
+            arguments = json.dumps({arg: _last_user_text(body.get("input"))})
+            item = {
+                "type": "function_call",
+                "id": f"fc_{uuid.uuid4().hex}",
+                "call_id": f"call_{uuid.uuid4().hex}",
+                "name": tool["name"],
+                "arguments": arguments,
+                "status": "completed",
+            }
+            return item, arguments
+
+        if "JSON" in prompt:
+            text = json.dumps({
+                "subject": "Information request",
+                "body": "Dear Student Services Office,\n\n" + " ".join(FILLER[: self.answer_tokens]),
+            })
+        else:
+            words = (FILLER * (self.answer_tokens // len(FILLER) + 1))[: self.answer_tokens]
+            text = " ".join(words) + "."
+
+        item = {
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex}",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }
+        return item, text
+
+    def response(self, body: dict, item: dict, text: str, status: str = "completed") -> dict:
+        prompt_tokens = _count_tokens(_input_text(body.get("input")))
+        output_tokens = _count_tokens(text)
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", "fake"),
+            "status": status,
+            "output": [item] if status == "completed" else [],
+            "parallel_tool_calls": True,
+            "tool_choice": body.get("tool_choice", "auto"),
+            "tools": body.get("tools") or [],
+            "usage": {
+                "input_tokens": prompt_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": prompt_tokens + output_tokens,
+            },
+        }
+
+
+def create_app(model: FakeModel) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        dimensions = body.get("dimensions") or model.dimensions
+        base64_format = body.get("encoding_format") == "base64"
+
+        await asyncio.sleep(model.embed_latency)
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(text, dimensions)
+            embedding = base64.b64encode(vector.tobytes()).decode() if base64_format else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(_count_tokens(t) for t in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        body = await request.json()
+        item, text = model.output_for(body)
+
+        if not body.get("stream"):
+            # one output token per word, as in the streamed deltas
+            await asyncio.sleep(model.latency + model.token_delay() * len(text.split()))
+            return model.response(body, item, text)
+
+        async def events():
+            sequence = 0
+
+            def event(data: dict) -> str:
+                nonlocal sequence
+                data["sequence_number"] = sequence
+                sequence += 1
+                return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n"
+
+            yield event({"type": "response.created", "response": model.response(body, item, text, "in_progress")})
+            await asyncio.sleep(model.latency)
+
+            if item["type"] == "message":
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    yield event({
+                        "type": "response.output_text.delta",
+                        "item_id": item["id"],
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": word if i == 0 else " " + word,
+                        "logprobs": [],
+                    })
+                    await asyncio.sleep(model.token_delay())
+
+            yield event({"type": "response.completed", "response": model.response(body, item, text)})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    args = parser.parse_args()
+
+    model = FakeModel(
+        args.latency_ms,
+        args.tokens_per_second,
+        args.answer_tokens,
+        args.embed_latency_ms,
+        args.dimensions,
+    )
+    uvicorn.run(create_app(model), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
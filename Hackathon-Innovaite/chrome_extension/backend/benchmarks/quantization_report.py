@@ -0,0 +1,178 @@
+# quantization_report.py
+# Memory saved vs recall@k of shortened and quantized embeddings.
+#
+# Starts from the full-precision embeddings of the corpus and, for every
+# embedding size and quantization (EMBEDDING_DIMENSIONS, VECTOR_QUANTIZATION),
+# builds the compact index of vector_index.py and measures:
+#   - bytes per vector scanned by a query, and the memory saved vs float32 at full size
+#   - recall@k against exact search on the full-precision, full-size embeddings
+#   - query latency, with and without rescoring the candidates in float32
+#
+# Shortened embeddings are the full ones truncated and re-normalized: this is
+# what the API returns for `dimensions` with text-embedding-3 models, so the
+# corpus does not have to be embedded again for every size.
+#
+# Usage (from the backend folder):
+#   python -m benchmarks.quantization_report [--source qdrant|local] [--snapshot corpus.jsonl]
+#       [--queries queries.jsonl] [--dims 1536 1024 512 256] [--k 3]
+#
+# --source qdrant reads the collection of the Qdrant in .env, --source local the
+# embedded index (VECTORSTORE_LOCAL_PATH); the queries are embedded with the
+# configured model. --synthetic N runs offline on synthetic vectors and queries.
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.queries import load_queries
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    QDRANT_HOST,
+    QDRANT_PORT,
+    QDRANT_API_KEY,
+    COLLECTION_NAME,
+    EMBEDDING_MODEL,
+    VECTORSTORE_LOCAL_PATH,
+    VECTOR_RESCORE_OVERSAMPLING,
+)
+from vector_index import QUANTIZATIONS, IVFIndex, normalize
+
+
+def qdrant_vectors(vector_name: str = "embedding") -> np.ndarray:
+    from qdrant_client import QdrantClient
+
+    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, api_key=QDRANT_API_KEY, https=True)
+    vectors, offset = [], None
+    while True:
+        points, offset = client.scroll(
+            COLLECTION_NAME, limit=1024, offset=offset, with_payload=False, with_vectors=[vector_name]
+        )
+        vectors += [p.vector[vector_name] for p in points]
+        if offset is None:
+            return np.array(vectors, dtype=np.float32)
+
+
+def local_vectors() -> np.ndarray:
+    collection_dir = VECTORSTORE_LOCAL_PATH / COLLECTION_NAME
+    version = (collection_dir / "CURRENT").read_text().strip()
+    return np.array(IVFIndex.load(collection_dir / version).vectors)
+
+
+def snapshot_vectors(path: Path) -> np.ndarray:
+    with open(path, encoding="utf-8") as f:
+        return np.array([json.loads(line)["embedding"] for line in f if line.strip()], dtype=np.float32)
+
+
+def embed_queries(queries: list[dict], dims: int) -> np.ndarray:
+    from embedders import ShortenedOpenAIEmbedder
+
+    embedder = ShortenedOpenAIEmbedder(
+        api_key=OPENAI_API_KEY, model_name=EMBEDDING_MODEL, base_url=OPENAI_BASE_URL, dimensions=dims
+    )
+    return np.array(embedder.embed([q["query"] for q in queries]), dtype=np.float32)
+
+
+def shorten(vectors: np.ndarray, dims: int) -> np.ndarray:
+    return normalize(vectors[:, :dims])
+
+
+def evaluate(index: IVFIndex, order: np.ndarray, queries: np.ndarray, truth: list[set], args, rescore: bool) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows, _ = index.search(
+            query, args.k, nprobe=args.nprobe, oversampling=args.oversampling, rescore=rescore
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(set(order[rows].tolist()) & expected) / args.k)
+    return {
+        "recall": round(statistics.fmean(recalls), 4),
+        "p50_ms": round(statistics.median(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory vs recall of shortened / quantized embeddings")
+    parser.add_argument("--source", choices=["qdrant", "local"], default="qdrant")
+    parser.add_argument("--snapshot", type=Path, help="read the corpus from a memory-backend JSONL snapshot")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="offline: N synthetic vectors")
+    parser.add_argument("--queries", help="JSONL query file (default: the exchange questions)")
+    parser.add_argument("--dims", type=int, nargs="+", default=[1536, 1024, 768, 512, 256])
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--oversampling", type=float, default=VECTOR_RESCORE_OVERSAMPLING)
+    parser.add_argument("--lists", type=int, default=1, help="IVF lists (1 = flat scan, isolates the compression)")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--output", type=Path, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from benchmarks.vector_index_benchmark import make_queries, synthetic_vectors
+
+        rng = np.random.default_rng(0)
+        corpus = synthetic_vectors(args.synthetic, max(args.dims), 200, rng)
+        queries = make_queries(corpus, 200, rng)
+        print(
+            "synthetic vectors: the quantization rows are indicative, the shortened sizes are not "
+            "(only text-embedding-3 embeddings keep their meaning when truncated)"
+        )
+    else:
+        if args.snapshot:
+            corpus = snapshot_vectors(args.snapshot)
+        elif args.source == "local":
+            corpus = local_vectors()
+        else:
+            corpus = qdrant_vectors()
+        queries = embed_queries(load_queries(args.queries), corpus.shape[1])
+
+    full_dims = corpus.shape[1]
+    corpus, queries = normalize(corpus), normalize(queries)
+    truth = [set(np.argsort(-(corpus @ q))[: args.k].tolist()) for q in queries]
+    baseline_bytes = corpus.nbytes
+    print(f"{len(corpus)} vectors x {full_dims} dims, {len(queries)} queries, k={args.k}")
+
+    rows = []
+    for dims in sorted({d for d in args.dims if d <= full_dims}, reverse=True):
+        corpus_d, queries_d = shorten(corpus, dims), shorten(queries, dims)
+        for quantization in args.quantization:
+            index, order = IVFIndex.build(corpus_d, args.lists, quantization=quantization)
+            memory = {
+                "dims": dims,
+                "quantization": quantization,
+                "bytes_per_vector": round(index.scanned_bytes / len(corpus), 1),
+                "scanned_mb": round(index.scanned_bytes / 2**20, 2),
+                "saved_pct": round(100 * (1 - index.scanned_bytes / baseline_bytes), 1),
+            }
+            for rescore in ([True, False] if quantization != "none" else [True]):
+                rows.append({
+                    **memory,
+                    "rescore": rescore and quantization != "none",
+                    **evaluate(index, order, queries_d, truth, args, rescore),
+                })
+
+    print(
+        f"\n{'dims':>6} {'quant':>7} {'rescore':>8} {'B/vector':>9} {'scanned MB':>11} "
+        f"{'saved':>7} {'recall@' + str(args.k):>9} {'p50 ms':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['dims']:>6} {row['quantization']:>7} {'yes' if row['rescore'] else '-':>8} "
+            f"{row['bytes_per_vector']:>9} {row['scanned_mb']:>11} {row['saved_pct']:>6}% "
+            f"{row['recall']:>9} {row['p50_ms']:>8}"
+        )
+    print(
+        "\nRescored searches also read k * oversampling float32 vectors per query "
+        "from the memory-mapped index on disk."
+    )
+
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
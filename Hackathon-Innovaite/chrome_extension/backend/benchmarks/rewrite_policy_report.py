@@ -0,0 +1,140 @@
+# rewrite_policy_report.py
+# Per-mode latency and retrieval quality of the query rewriting policy.
+#
+# For every mode (always, never, adaptive, speculative) each query goes through
+# the rewriting stage and then through embedding + vector search, and we report:
+#   - latency of the rewriting stage and of rewrite + retrieval
+#   - mean top-1 similarity of the final retrieval
+#   - overlap@k with the results of the "always" mode (the previous behaviour)
+#   - hit@k against an expected source, when the query file provides one
+#   - first-pass searches: top-1 vector searches of the policy itself, on top
+#     of the retrieval (adaptive and speculative modes)
+#
+# Embeddings are requested without the disk embedding cache: the modes run one
+# after the other on the same queries, and the later ones would otherwise get
+# their embeddings from the cache filled by the earlier ones.
+#
+# Runs against the real OpenAI / Qdrant configured in .env.
+#
+# Usage (from the backend folder):
+#   python -m benchmarks.rewrite_policy_report [--queries queries.jsonl] [--k 3]
+#
+# queries.jsonl: one {"query": "...", "expected_source": "data/exchange1.pdf"} per line
+# ("expected_source" is optional).
+
+import argparse
+import statistics
+import time
+
+from config import (
+    COLLECTION_NAME,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    REWRITE_SCORE_THRESHOLD,
+)
+from benchmarks.queries import load_queries
+from embedders import ShortenedOpenAIEmbedder
+from retrieval_pipeline import query_rewriter, retriever
+from rewrite_policy import REWRITE_MODES, FirstPassEmbedder, RewritePolicy
+
+# Uncached: every mode pays for its own embeddings
+embedder = ShortenedOpenAIEmbedder(
+    api_key=OPENAI_API_KEY,
+    model_name=EMBEDDING_MODEL,
+    base_url=OPENAI_BASE_URL,
+    dimensions=EMBEDDING_DIMENSIONS,
+)
+
+
+def search_with_scores(query_vector, k: int):
+    hits = retriever.get_client().query_points(
+        collection_name=COLLECTION_NAME,
+        query=query_vector,
+        using="embedding",
+        limit=k,
+        with_payload=True,
+    )
+    return hits.points
+
+
+def run_mode(mode: str, queries: list[dict], k: int) -> tuple[list[dict], int]:
+    policy = RewritePolicy(
+        rewriter=query_rewriter,
+        embedder=embedder,
+        vectorstore=retriever,
+        collection_name=COLLECTION_NAME,
+        mode=mode,
+        score_threshold=REWRITE_SCORE_THRESHOLD,
+    )
+    # As in the DAG: the first-pass embedding of the kept query is reused
+    query_embedder = FirstPassEmbedder(embedder, policy)
+    rows = []
+    for item in queries:
+        start = time.perf_counter()
+        text = policy.rewrite(item["query"])
+        rewrite_ms = (time.perf_counter() - start) * 1000
+        points = search_with_scores(query_embedder.embed(text), k)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        sources = [p.payload.get("source") for p in points]
+        rows.append(
+            {
+                "query": item["query"],
+                "rewritten": text != item["query"],
+                "rewrite_ms": rewrite_ms,
+                "total_ms": total_ms,
+                "top_score": points[0].score if points else 0.0,
+                "ids": [str(p.id) for p in points],
+                "hit": item["expected_source"] in sources if item.get("expected_source") else None,
+            }
+        )
+    return rows, policy.stats()["first_pass_searches"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite policy latency/quality report")
+    parser.add_argument("--queries", help="JSONL file with the queries to evaluate")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(REWRITE_MODES))
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    runs = {mode: run_mode(mode, queries, args.k) for mode in args.modes}
+    results = {mode: rows for mode, (rows, _) in runs.items()}
+    baseline = results.get("always")
+
+    print(f"{len(queries)} queries, k={args.k}, score threshold={REWRITE_SCORE_THRESHOLD}")
+    print(
+        f"{'mode':<12}{'rewritten':>10}{'rw p50 ms':>11}{'rw p95 ms':>11}"
+        f"{'e2e p50 ms':>12}{'top score':>11}{'overlap@k':>11}{'hit@k':>8}"
+        f"{'1st-pass':>10}"
+    )
+    for mode, rows in results.items():
+        rewrite_ms = sorted(r["rewrite_ms"] for r in rows)
+        total_ms = sorted(r["total_ms"] for r in rows)
+        p95 = rewrite_ms[min(len(rewrite_ms) - 1, int(0.95 * len(rewrite_ms)))]
+
+        overlap = "-"
+        if baseline:
+            overlap = statistics.mean(
+                len(set(r["ids"]) & set(b["ids"])) / max(1, len(b["ids"]))
+                for r, b in zip(rows, baseline)
+            )
+            overlap = f"{overlap:.2f}"
+
+        labelled = [r["hit"] for r in rows if r["hit"] is not None]
+        hit = f"{sum(labelled) / len(labelled):.2f}" if labelled else "-"
+
+        print(
+            f"{mode:<12}{sum(r['rewritten'] for r in rows):>10}"
+            f"{statistics.median(rewrite_ms):>11.0f}{p95:>11.0f}"
+            f"{statistics.median(total_ms):>12.0f}"
+            f"{statistics.mean(r['top_score'] for r in rows):>11.3f}"
+            f"{overlap:>11}{hit:>8}{runs[mode][1]:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
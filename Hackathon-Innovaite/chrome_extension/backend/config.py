@@ -1,17 +1,229 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = Path(__file__).resolve().parent
+
+# Local state (caches, collection version marker, ...) lives here
+CACHE_DIR = Path(os.getenv("CACHE_DIR", str(BASE_DIR / ".cache")))
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# OpenAI-compatible endpoint (empty = api.openai.com); the load test points it to a local fake
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 
 QDRANT_HOST = os.getenv("QDRANT_HOST")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# gRPC transport for the Qdrant clients (REST otherwise)
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+
+# Connection pools shared by the OpenAI and Qdrant clients (http_pool.py): idle
+# connections are kept HTTP_KEEPALIVE_SECONDS; HTTP/2 needs the h2 package
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+# Startup warm-up (connections, indexes, models) before GET /ready reports ready,
+# retried every WARMUP_RETRY_SECONDS while a dependency is unreachable
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+# Admission control on the chat endpoints (admission.py), per worker process: at most
+# ADMISSION_MAX_CONCURRENT requests run at once (0 = no limit), ADMISSION_MAX_QUEUE
+# more wait up to ADMISSION_QUEUE_TIMEOUT_SECONDS for a slot; beyond, 429 + Retry-After.
+# In "thread" mode keep the limit within the default thread pool (min(32, cores + 4))
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+# Per-client token bucket: sustained requests per minute and burst. Opt-in (0 = no
+# limit): clients are told apart by address, so users behind one NAT or proxy share
+# a bucket; size it for the busiest address (e.g. 60 per minute, burst 20)
+ADMISSION_RATE_PER_MINUTE = float(os.getenv("ADMISSION_RATE_PER_MINUTE", "0"))
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "20"))
+# Header naming the client behind a reverse proxy (e.g. X-Forwarded-For, first
+# address); empty = the peer address. Only set it when the proxy overwrites it
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "")
 
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "my_documents")
 
+# Multi-tenant serving (tenants.py): universities registered in TENANTS_PATH, each
+# with its own collection, prompt, helpdesk address and answer cache. Requests
+# without a tenant ID use COLLECTION_NAME and HELPDESK_EMAIL
+TENANTS_PATH = Path(os.getenv("TENANTS_PATH", str(BASE_DIR / "tenants.json")))
+# Per-tenant BM25 index, collection version, ingestion manifest and checkpoint
+TENANTS_DIR = Path(os.getenv("TENANTS_DIR", str(CACHE_DIR / "tenants")))
+# Token for PUT/DELETE /api/tenants/{id} (X-Admin-Token header); unset = disabled
+TENANT_ADMIN_TOKEN = os.getenv("TENANT_ADMIN_TOKEN")
+
+# Vector store used by the API:
+# - "qdrant": the Qdrant instance above
+# - "memory": in-process numpy store loaded from VECTORSTORE_MEMORY_PATH (offline benchmarks)
+# - "local": embedded IVF index, memory-mapped from VECTORSTORE_LOCAL_PATH (no network
+#   round trip; the ingestion script writes it when this backend is selected)
+VECTORSTORE_BACKEND = os.getenv("VECTORSTORE_BACKEND", "qdrant").lower()
+VECTORSTORE_MEMORY_PATH = Path(
+    os.getenv("VECTORSTORE_MEMORY_PATH", str(CACHE_DIR / "memory_vectorstore.jsonl"))
+)
+VECTORSTORE_LOCAL_PATH = Path(
+    os.getenv("VECTORSTORE_LOCAL_PATH", str(CACHE_DIR / "vector_index"))
+)
+# IVF lists per collection (0 = about sqrt(number of chunks)) and lists scanned per query
+VECTORSTORE_IVF_LISTS = int(os.getenv("VECTORSTORE_IVF_LISTS", "0"))
+VECTORSTORE_IVF_NPROBE = int(os.getenv("VECTORSTORE_IVF_NPROBE", "8"))
+
+# Number of chunks retrieved for each question
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+
+# Retrieval: "hybrid" (vector search fused with BM25 on LEXICAL_INDEX_PATH) or "dense"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+# BM25 index of the chunks, written by the ingestion script next to the vector store
+LEXICAL_INDEX_PATH = Path(
+    os.getenv("LEXICAL_INDEX_PATH", str(CACHE_DIR / "lexical_index.json"))
+)
+# Candidates taken from each retriever before reciprocal rank fusion, and its constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Short keyword queries (course codes, office names) fully matched by the top BM25
+# chunk are answered from the lexical index: no rewrite, no embedding call
+KEYWORD_FAST_PATH = os.getenv("KEYWORD_FAST_PATH", "true").lower() == "true"
+KEYWORD_FAST_PATH_MAX_WORDS = int(os.getenv("KEYWORD_FAST_PATH_MAX_WORDS", "4"))
+
+# Cross-encoder reranking between the retriever and the prompt (reranker.py):
+# RERANK_CANDIDATES chunks are retrieved, the best RETRIEVAL_K are kept.
+# RERANK_BACKEND "onnx" (RERANK_MODEL is a directory with a .onnx model and
+# tokenizer.json; needs onnxruntime + tokenizers) or "sentence-transformers"
+# (RERANK_MODEL is a model name; needs sentence-transformers)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "onnx").lower()
+RERANK_MODEL = os.getenv("RERANK_MODEL", str(BASE_DIR / "models" / "ms-marco-MiniLM-L-6-v2"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Over this budget the stage keeps the retriever order
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+# ONNX Runtime threads (0: one per core)
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "0"))
+# Cached (question, chunk) scores
+RERANK_CACHE_ENTRIES = int(os.getenv("RERANK_CACHE_ENTRIES", "10000"))
+
+# Context packing before generation (context_packer.py): near-duplicate chunks are
+# dropped, adjacent chunks of a document merged, and the result fitted into
+# CONTEXT_MAX_TOKENS (0 = no budget)
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+# Share of a chunk's word 5-grams found in a more relevant chunk above which it is dropped
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+CONTEXT_MERGE_ADJACENT = os.getenv("CONTEXT_MERGE_ADJACENT", "true").lower() == "true"
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Sent to the API as `dimensions`: text-embedding-3 models return shortened
+# embeddings of any size up to their native one (changing it needs a new collection)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+
+# Compact vector storage: "none" (float32), "int8" (scalar) or "binary" quantization.
+# Searches scan the compact vectors and rescore the best k * VECTOR_RESCORE_OVERSAMPLING
+# candidates with the full-precision ones (Qdrant collections and the local index).
+# Binary codes lose more and need a larger oversampling (16-32): see
+# benchmarks/quantization_report.py
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+VECTOR_RESCORE_OVERSAMPLING = float(os.getenv("VECTOR_RESCORE_OVERSAMPLING", "4.0"))
+
+# POST /api/chat/batch: most questions per request, and answers generated at once
+# (the embeddings and the vector search are batched whatever the size)
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# How the API runs the RAG pipeline:
+# - "async":  async-native DAG (AsyncOpenAI + AsyncQdrantClient) on the event loop
+# - "thread": blocking DAG offloaded with asyncio.to_thread (previous behaviour)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "async").lower()
+
+# Query rewriting policy: always | never | adaptive | speculative (see rewrite_policy.py)
+REWRITE_MODE = os.getenv("REWRITE_MODE", "adaptive").lower()
+# Adaptive mode skips the rewrite when the raw query's top similarity reaches this score
+REWRITE_SCORE_THRESHOLD = float(os.getenv("REWRITE_SCORE_THRESHOLD", "0.55"))
+
 HELPDESK_EMAIL = os.getenv("HELPDESK_EMAIL")
 GMAIL_PASSWORD = os.getenv("GMAIL_PASSWORD")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
-SEND_REAL_EMAILS = os.getenv("SEND_REAL_EMAILS", "false").lower() == "true"
\ No newline at end of file
+SEND_REAL_EMAILS = os.getenv("SEND_REAL_EMAILS", "false").lower() == "true"
+# How /api/escalate writes the helpdesk email (a request can override it with "polish"):
+# - "template": deterministic template filled with the student fields, no LLM call
+# - "llm":      the LLM writes the email (falls back to the template on failure)
+ESCALATION_EMAIL_MODE = os.getenv("ESCALATION_EMAIL_MODE", "template").lower()
+
+# Answer cache in front of the RAG pipeline
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANSWER_CACHE_MAX_MB", "64"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Semantic tier: reuse an answer when cosine(query, cached query) >= threshold
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Precomputed FAQ answers (faq_index.py), looked up before the answer cache
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+FAQ_INDEX_PATH = Path(os.getenv("FAQ_INDEX_PATH", str(CACHE_DIR / "faq_index.json")))
+# Curated questions, with or without a vetted answer: [{"question": ..., "answer": ...}]
+FAQ_CURATED_PATH = Path(os.getenv("FAQ_CURATED_PATH", str(BASE_DIR / "faq_curated.json")))
+# Serve a canonical answer when cosine(query, canonical question) >= threshold
+FAQ_SIMILARITY = float(os.getenv("FAQ_SIMILARITY", "0.92"))
+# Serve only the curated answers; the generated ones stay in the index for review
+# until copied into FAQ_CURATED_PATH ("false": serve them too)
+FAQ_VETTED_ONLY = os.getenv("FAQ_VETTED_ONLY", "true").lower() == "true"
+# Builder: logged questions asked at least FAQ_MIN_COUNT times, FAQ_MAX_ENTRIES at most
+FAQ_MIN_COUNT = int(os.getenv("FAQ_MIN_COUNT", "3"))
+FAQ_MAX_ENTRIES = int(os.getenv("FAQ_MAX_ENTRIES", "200"))
+# Rebuild the FAQ index at the end of every ingestion that changed the collection
+FAQ_AUTO_REBUILD = os.getenv("FAQ_AUTO_REBUILD", "true").lower() == "true"
+# Questions received by the API, appended to QUERY_LOG_PATH for the FAQ builder.
+# Off by default: questions may contain personal data
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "false").lower() == "true"
+QUERY_LOG_PATH = Path(os.getenv("QUERY_LOG_PATH", str(CACHE_DIR / "query_log.jsonl")))
+
+# Disk-backed embedding cache shared by the uvicorn workers and the ingestion script
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = Path(
+    os.getenv("EMBEDDING_CACHE_PATH", str(CACHE_DIR / "embeddings.sqlite3"))
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Ingestion (ingestion_pipeline.py)
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+# Docling parser processes (parsing is CPU-bound)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", str(os.cpu_count() or 1)))
+# Chunks per embeddings request, across documents, and concurrent requests
+INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", "512"))
+INGESTION_EMBED_CONCURRENCY = int(os.getenv("INGESTION_EMBED_CONCURRENCY", "4"))
+# Points per Qdrant upsert request
+INGESTION_UPSERT_BATCH_SIZE = int(os.getenv("INGESTION_UPSERT_BATCH_SIZE", "256"))
+# Streaming mode: chunk batches buffered between two stages (bounds the memory)
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "4"))
+# Journal of the upserted chunks of the current run: an interrupted run resumes from it
+INGESTION_CHECKPOINT_PATH = Path(
+    os.getenv("INGESTION_CHECKPOINT_PATH", str(CACHE_DIR / "ingestion_checkpoint.jsonl"))
+)
+# Attempts for embedding / upsert requests failing with transient errors, and the
+# first backoff delay (doubled at every retry)
+INGESTION_RETRIES = int(os.getenv("INGESTION_RETRIES", "5"))
+INGESTION_RETRY_BACKOFF_SECONDS = float(os.getenv("INGESTION_RETRY_BACKOFF_SECONDS", "1.0"))
+# Seconds between two progress lines (0 disables them)
+INGESTION_PROGRESS_SECONDS = float(os.getenv("INGESTION_PROGRESS_SECONDS", "10"))
+# Maximum characters per chunk (NodeSplitter): changing it re-splits every file
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1000"))
+# Parsed Docling trees, keyed by file hash and parser version: a file is parsed
+# once per content version, re-splitting and re-embedding start from the cache
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "true").lower() == "true"
+PARSE_CACHE_DIR = Path(os.getenv("PARSE_CACHE_DIR", str(CACHE_DIR / "parsed")))
+# Per-file and per-chunk content hashes of the last ingestion (incremental re-ingestion)
+INGESTION_MANIFEST_PATH = Path(
+    os.getenv("INGESTION_MANIFEST_PATH", str(CACHE_DIR / "ingestion_manifest.json"))
+)
+
+# Written by the ingestion script, read by the caches to detect a re-ingested collection
+COLLECTION_VERSION_FILE = Path(
+    os.getenv("COLLECTION_VERSION_FILE", str(CACHE_DIR / "collection_version"))
+)
@@ -0,0 +1,62 @@
+# embedders.py
+
+import openai
+from datapizza.embedders.openai import OpenAIEmbedder
+
+from http_pool import openai_async_http_client, openai_http_client
+
+
+class ShortenedOpenAIEmbedder(OpenAIEmbedder):
+    """
+    OpenAIEmbedder that asks for `dimensions`-sized embeddings.
+
+    text-embedding-3 models shorten their embeddings server side (and return
+    them normalized): smaller vectors to transfer, store and search.
+
+    Args:
+        dimensions: Embedding size; None keeps the model's native size
+    """
+
+    def __init__(self, *, dimensions: int | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.dimensions = dimensions
+
+    # Embedding requests share the process-wide connection pools (http_pool.py)
+    def _set_client(self):
+        if not self.client:
+            self.client = openai.OpenAI(
+                api_key=self.api_key, base_url=self.base_url, http_client=openai_http_client()
+            )
+
+    def _set_a_client(self):
+        if not self.a_client:
+            self.a_client = openai.AsyncOpenAI(
+                api_key=self.api_key, base_url=self.base_url, http_client=openai_async_http_client()
+            )
+
+    def _create_kwargs(self) -> dict:
+        return {"dimensions": self.dimensions} if self.dimensions else {}
+
+    def embed(self, text: str | list[str], model_name: str | None = None):
+        model = model_name or self.model_name
+        if not model:
+            raise ValueError("Model name is required.")
+
+        texts = [text] if isinstance(text, str) else text
+        response = self._get_client().embeddings.create(
+            input=texts, model=model, **self._create_kwargs()
+        )
+        embeddings = [embedding.embedding for embedding in response.data]
+        return embeddings[0] if isinstance(text, str) else embeddings
+
+    async def a_embed(self, text: str | list[str], model_name: str | None = None):
+        model = model_name or self.model_name
+        if not model:
+            raise ValueError("Model name is required.")
+
+        texts = [text] if isinstance(text, str) else text
+        response = await self._get_a_client().embeddings.create(
+            input=texts, model=model, **self._create_kwargs()
+        )
+        embeddings = [embedding.embedding for embedding in response.data]
+        return embeddings[0] if isinstance(text, str) else embeddings
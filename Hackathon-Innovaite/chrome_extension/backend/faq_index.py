@@ -0,0 +1,411 @@
+# faq_index.py
+# Precomputed answers to the most frequent questions, served without any LLM call.
+#
+# Offline, build_faq_index (python faq_index.py [--tenant <id>]) collects the
+# canonical questions of a tenant:
+#   - curated ones, from its faq_curated_path (FAQ_CURATED_PATH for the default
+#     tenant): [{"question": "...", "answer": "..."}]. An entry with an answer is
+#     vetted and served as written; one without gets a generated answer
+#   - the frequent ones of the query log (QUERY_LOG_PATH, written by the API when
+#     QUERY_LOG_ENABLED): asked at least FAQ_MIN_COUNT times, FAQ_MAX_ENTRIES at most
+# answers the unanswered ones with the RAG pipeline on the ingested corpus
+# (retrieval_pipeline.a_answer_batch, caches bypassed), embeds every question
+# and writes the index, stamped with the collection version it was built on.
+#
+# Online, FaqIndex sits in front of the answer cache and the pipeline
+# (retrieval_pipeline.lookup_cached_answer): the exact normalized question, or
+# the closest canonical question above FAQ_SIMILARITY, is answered from the
+# index. Only vetted answers are served (FAQ_VETTED_ONLY): a generated answer is
+# written to the index for review, and served once someone promotes it by
+# copying it into the curated file. An index built for an older collection version is not served; the
+# ingestion script rebuilds it after every re-ingestion (FAQ_AUTO_REBUILD).
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+from answer_cache import CollectionVersion, _as_unit_vector, normalize_query
+from config import (
+    BATCH_CONCURRENCY,
+    EMBEDDING_MODEL,
+    FAQ_MAX_ENTRIES,
+    FAQ_MIN_COUNT,
+    QUERY_LOG_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+class QueryLog:
+    """
+    Append-only JSONL log of the questions received by the API, one
+    {"ts", "tenant", "query"} object per line. Read by the FAQ builder.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def record(self, tenant_id: str, query: str):
+        line = json.dumps({"ts": round(time.time(), 3), "tenant": tenant_id, "query": query})
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def frequent_questions(self, tenant_id: str, min_count: int, limit: int) -> list[tuple[str, int]]:
+        """
+        Most asked questions of a tenant.
+
+        Returns:
+            (question, count), most frequent first; spellings sharing a normalized
+            form count together, the most common spelling stands for them
+        """
+        counts: Counter[str] = Counter()
+        spellings: dict[str, Counter[str]] = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # line cut by a crash
+                    if row.get("tenant") != tenant_id or not row.get("query"):
+                        continue
+                    key = normalize_query(row["query"])
+                    counts[key] += 1
+                    spellings.setdefault(key, Counter())[row["query"].strip()] += 1
+        except FileNotFoundError:
+            return []
+        return [
+            (spellings[key].most_common(1)[0][0], count)
+            for key, count in counts.most_common(limit)
+            if count >= min_count
+        ]
+
+
+@dataclass
+class FaqEntry:
+    question: str
+    answer: str
+    # Written by a person (curated file), not generated
+    vetted: bool = False
+    # Times it was asked in the query log
+    count: int = 0
+
+
+class FaqIndex:
+    """
+    Canonical questions, their embeddings and their answers, reloaded when the
+    index file changes.
+
+    Args:
+        path: JSON file written by build_faq_index
+        version: `CollectionVersion` of the collection; an index built for
+            another version is stale and answers nothing
+        similarity_threshold: Minimum cosine similarity for a semantic hit
+        vetted_only: Serve only the curated answers (False: the generated ones too)
+        check_interval: Minimum seconds between two checks of the index file
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        version: CollectionVersion | None = None,
+        similarity_threshold: float = 0.92,
+        vetted_only: bool = True,
+        check_interval: float = 1.0,
+    ):
+        self.path = Path(path)
+        self.version = version
+        self.similarity_threshold = similarity_threshold
+        self.vetted_only = vetted_only
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._last_check = 0.0
+        self._entries: list[FaqEntry] = []
+        self._by_key: dict[str, FaqEntry] = {}
+        self._matrix: np.ndarray | None = None
+        self.collection_version = ""
+        self.built_at = None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stale_lookups = 0
+        self.reload_if_changed()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- lookups -----------------------------------------------------------
+
+    def get(self, query: str) -> str | None:
+        """Exact lookup on the normalized question (no embedding needed)."""
+        if not self._servable(count_stale=True):
+            return None
+        entry = self._by_key.get(normalize_query(query))
+        if entry is None:
+            return None
+        with self._lock:
+            self.exact_hits += 1
+        return entry.answer
+
+    def get_semantic(self, embedding) -> str | None:
+        """Answer of the closest canonical question above the similarity threshold."""
+        if not self._servable():
+            return None
+        matrix, entries = self._matrix, self._entries
+        query_vec = _as_unit_vector(embedding)
+        if matrix is None or matrix.shape[1] != query_vec.shape[0]:
+            return None
+        scores = matrix @ query_vec
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        with self._lock:
+            self.semantic_hits += 1
+        return entries[best].answer
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "entries": len(self._entries),
+                "vetted": sum(entry.vetted for entry in self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "stale_lookups": self.stale_lookups,
+                "collection_version": self.collection_version,
+                "built_at": self.built_at,
+            }
+
+    # --- persistence -------------------------------------------------------
+
+    def reload_if_changed(self):
+        """
+        Load the file if it was written since the last load (one stat call). A file
+        that fails to load is logged and skipped: the previous entries stay served.
+        """
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            rows = data.get("entries", []) if data.get("version") == INDEX_VERSION else []
+            if self.vetted_only:
+                rows = [row for row in rows if row.get("vetted")]
+            entries = [
+                FaqEntry(**{k: row[k] for k in ("question", "answer", "vetted", "count")}) for row in rows
+            ]
+            matrix = None
+            if rows:
+                matrix = np.stack([_as_unit_vector(row["embedding"]) for row in rows])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Error loading FAQ index {self.path}: {str(e)}")
+            # Not retried until the file changes again
+            self._mtime_ns = mtime_ns
+            return
+        with self._lock:
+            self._entries = entries
+            self._by_key = {normalize_query(entry.question): entry for entry in entries}
+            self._matrix = matrix
+            self.collection_version = data.get("collection_version", "")
+            self.built_at = data.get("built_at")
+            self._mtime_ns = mtime_ns
+
+    def _servable(self, count_stale: bool = False) -> bool:
+        # Throttled like CollectionVersion: at most one stat per check_interval
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self.reload_if_changed()
+        if not self._entries:
+            return False
+        if self.version is not None and self.version.current() != self.collection_version:
+            # Built on the previous corpus: wait for the rebuild. Counted once per
+            # question, by the exact tier that always runs first
+            if count_stale:
+                with self._lock:
+                    self.stale_lookups += 1
+            return False
+        return True
+
+
+def write_faq_index(
+    path: Path,
+    entries: list[FaqEntry],
+    embeddings: list,
+    collection_name: str,
+    collection_version: str,
+):
+    """Write an index file; write-then-rename, the API never reads a half-written index."""
+    rows = [
+        {**asdict(entry), "embedding": [round(float(v), 6) for v in embedding]}
+        for entry, embedding in zip(entries, embeddings)
+    ]
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(
+        json.dumps({
+            "version": INDEX_VERSION,
+            "collection": collection_name,
+            "collection_version": collection_version,
+            "embedding_model": EMBEDDING_MODEL,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "entries": rows,
+        }),
+        encoding="utf-8",
+    )
+    os.replace(tmp, path)
+
+
+def read_curated(path: Path) -> list[FaqEntry]:
+    """Curated questions; those with an answer are vetted."""
+    try:
+        rows = json.loads(Path(path).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return []
+    return [
+        FaqEntry(question=row["question"].strip(), answer=(row.get("answer") or "").strip(),
+                 vetted=bool((row.get("answer") or "").strip()))
+        for row in rows
+        if (row.get("question") or "").strip()
+    ]
+
+
+async def a_build_faq_index(
+    tenant,
+    query_log_path: Path = QUERY_LOG_PATH,
+    min_count: int = FAQ_MIN_COUNT,
+    max_entries: int = FAQ_MAX_ENTRIES,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> dict:
+    """
+    Build the FAQ index of a tenant (see the header of this file).
+
+    Args:
+        tenant: tenants.Tenant whose collection answers the questions
+        query_log_path: Query log to mine for frequent questions
+        min_count: Occurrences for a logged question to be included
+        max_entries: Logged questions included at most
+        concurrency: Answers generated at once
+
+    Returns:
+        Build report: entries, vetted, generated, failed, seconds
+    """
+    # The API process only needs the lookup side: the pipeline is imported here
+    import retrieval_pipeline
+    from http_pool import close_http_pools
+
+    start = time.perf_counter()
+    # Read before answering: a re-ingestion during the build leaves the index
+    # stale, and that re-ingestion rebuilds it
+    collection_version = CollectionVersion(tenant.collection_version_file).current()
+
+    entries = read_curated(tenant.faq_curated_path)
+    known = {normalize_query(entry.question) for entry in entries}
+    logged = QueryLog(query_log_path).frequent_questions(tenant.id, min_count, max_entries)
+    for question, count in logged:
+        key = normalize_query(question)
+        if key in known:
+            for entry in entries:
+                if normalize_query(entry.question) == key:
+                    entry.count = count
+            continue
+        known.add(key)
+        entries.append(FaqEntry(question=question, answer="", count=count))
+
+    try:
+        to_answer = [entry for entry in entries if not entry.vetted]
+        failed = 0
+        if to_answer:
+            questions = [entry.question for entry in to_answer]
+            async for index, result in retrieval_pipeline.a_answer_batch(
+                questions, tenant.id, concurrency, use_caches=False
+            ):
+                if "error" in result or not result["answer"].strip():
+                    failed += 1
+                    logger.warning(f"No FAQ answer for {questions[index]!r}: {result.get('error')}")
+                else:
+                    to_answer[index].answer = result["answer"].strip()
+        entries = [entry for entry in entries if entry.answer]
+
+        embeddings = []
+        if entries:
+            embeddings = await retrieval_pipeline.embedder.a_embed([e.question for e in entries])
+    finally:
+        await close_http_pools()
+
+    write_faq_index(
+        tenant.faq_index_path, entries, embeddings, tenant.collection_name, collection_version
+    )
+    vetted = sum(entry.vetted for entry in entries)
+    return {
+        "tenant": tenant.id,
+        "entries": len(entries),
+        "vetted": vetted,
+        "generated": len(entries) - vetted,
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+
+
+def build_faq_index(tenant, **kwargs) -> dict:
+    """Blocking variant of a_build_faq_index (CLI, ingestion script)."""
+    return asyncio.run(a_build_faq_index(tenant, **kwargs))
+
+
+def main():
+    from tenants import UnknownTenantError, tenant_registry
+
+    parser = argparse.ArgumentParser(description="Build the precomputed FAQ answer index")
+    parser.add_argument("--tenant", help="tenant whose index is built (default: the default tenant)")
+    parser.add_argument("--query-log", type=Path, default=QUERY_LOG_PATH)
+    parser.add_argument("--min-count", type=int, default=FAQ_MIN_COUNT)
+    parser.add_argument("--max-entries", type=int, default=FAQ_MAX_ENTRIES)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        tenant = tenant_registry.get(args.tenant)
+    except UnknownTenantError:
+        parser.error(f"unknown tenant {args.tenant!r}: register it in {tenant_registry.path}")
+
+    report = build_faq_index(
+        tenant,
+        query_log_path=args.query_log,
+        min_count=args.min_count,
+        max_entries=args.max_entries,
+        concurrency=args.concurrency,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
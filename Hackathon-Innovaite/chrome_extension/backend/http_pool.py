@@ -0,0 +1,119 @@
+# http_pool.py
+# Shared HTTP connection pools for the OpenAI and Qdrant clients.
+#
+# Every OpenAI client of the process (generator, rewriter, embedder, helpdesk
+# emails) goes through one sync and one async httpx pool, so a connection opened
+# by one of them is reused by the others. Idle connections are kept for
+# HTTP_KEEPALIVE_SECONDS (the SDK default is 5 s: the first request after a
+# quiet spell paid a new TLS handshake), and HTTP/2 multiplexes concurrent
+# requests on one connection when the h2 package is installed.
+#
+# The Qdrant REST client disables keep-alive unless it is given limits:
+# qdrant_client_options() gives it the same pool settings, or selects the gRPC
+# transport (QDRANT_PREFER_GRPC).
+
+import importlib.util
+import logging
+import threading
+
+import httpx
+import openai
+from datapizza.clients.openai import OpenAIClient
+
+from config import (
+    HTTP2_ENABLED,
+    HTTP_KEEPALIVE_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    QDRANT_GRPC_PORT,
+    QDRANT_PREFER_GRPC,
+)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_sync_client: httpx.Client | None = None
+_async_client: httpx.AsyncClient | None = None
+
+
+def http2_available() -> bool:
+    """HTTP/2 is requested and httpx can speak it (needs the h2 package)."""
+    if not HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed: using HTTP/1.1")
+        return False
+    return True
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+    )
+
+
+def openai_http_client() -> httpx.Client:
+    """Process-wide pool of the sync OpenAI clients."""
+    global _sync_client
+    with _lock:
+        if _sync_client is None or _sync_client.is_closed:
+            # DefaultHttpxClient keeps the SDK defaults (timeouts, redirects)
+            _sync_client = openai.DefaultHttpxClient(limits=http_limits(), http2=http2_available())
+        return _sync_client
+
+
+def openai_async_http_client() -> httpx.AsyncClient:
+    """Process-wide pool of the async OpenAI clients (used from the server's event loop)."""
+    global _async_client
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            _async_client = openai.DefaultAsyncHttpxClient(limits=http_limits(), http2=http2_available())
+        return _async_client
+
+
+async def close_http_pools():
+    """Close the shared pools (application shutdown)."""
+    global _sync_client, _async_client
+    with _lock:
+        sync_client, async_client = _sync_client, _async_client
+        _sync_client = _async_client = None
+    if sync_client is not None:
+        sync_client.close()
+    if async_client is not None:
+        await async_client.aclose()
+
+
+def qdrant_client_options() -> dict:
+    """Extra QdrantClient / AsyncQdrantClient arguments: transport and connection pool."""
+    options = {"limits": http_limits(), "http2": http2_available()}
+    if QDRANT_PREFER_GRPC:
+        # Searches and upserts go over gRPC, the REST pool only serves the rest
+        options.update(prefer_grpc=True, grpc_port=QDRANT_GRPC_PORT)
+    return options
+
+
+class PooledOpenAIClient(OpenAIClient):
+    """OpenAIClient whose sync and async clients use the shared pools."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("http_client", openai_http_client())
+        super().__init__(**kwargs)
+
+    def _set_a_client(self):
+        # OpenAIClient does not pass http_client to AsyncOpenAI
+        if not self.a_client:
+            self.a_client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                organization=self.organization,
+                project=self.project,
+                webhook_secret=self.webhook_secret,
+                websocket_base_url=self.websocket_base_url,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+                default_headers=self.default_headers,
+                default_query=self.default_query,
+                http_client=openai_async_http_client(),
+            )
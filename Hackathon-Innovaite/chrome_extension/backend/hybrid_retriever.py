@@ -0,0 +1,199 @@
+# hybrid_retriever.py
+# Retriever stage of the DAG: dense search on the vector store plus BM25 on the
+# lexical index, merged with reciprocal rank fusion.
+#
+# Keyword fast path: a short query without question words (a course code, an
+# office or form name) whose terms all occur in the best BM25 chunk is answered
+# from the lexical index alone, with no rewrite and no embedding call.
+#
+# BM25 scoring is CPU work: the async searches run it in a worker thread.
+
+import asyncio
+import re
+
+from datapizza.core.models import PipelineComponent
+from datapizza.type import Chunk
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from metrics import Counter
+
+RETRIEVAL_PATHS = Counter(
+    "rag_retrieval_path_total",
+    "Retrievals by path (keyword: BM25 fast path, hybrid: dense + BM25, dense: vector search only)",
+    ("path",),
+)
+
+# Questions and references to earlier context need the full pipeline
+_QUESTION_WORDS = re.compile(
+    r"\b(what|how|when|where|why|which|who|whom|can|could|should|do|does|is|are|"
+    r"it|this|that|they|them|"
+    r"come|quando|dove|cosa|perch[eé]|quale|quali|chi|posso)\b",
+    re.IGNORECASE,
+)
+
+
+def is_keyword_query(query: str, max_words: int = 4) -> bool:
+    """Cheap check: a handful of terms, no question mark, no question words."""
+    words = query.split()
+    return (
+        0 < len(words) <= max_words
+        and "?" not in query
+        and not _QUESTION_WORDS.search(query)
+        and bool(tokenize(query))
+    )
+
+
+class HybridRetriever(PipelineComponent):
+    """
+    Retriever stage: vector search fused with BM25.
+
+    Without a lexical index (or when it is empty) it is a plain vector search.
+    Each collection has its own index (one per tenant, see add_lexical_index);
+    calls without a collection name use `lexical_index`.
+
+    Args:
+        vectorstore: Vector store searched with the query embedding
+        lexical_index: BM25 index of the same chunks, or None
+        candidates: Results taken from each retriever before fusion
+        rrf_k: Reciprocal rank fusion constant
+        keyword_max_words: Longest query eligible for the keyword fast path
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        lexical_index: LexicalIndex | None = None,
+        candidates: int = 20,
+        rrf_k: int = 60,
+        keyword_max_words: int = 4,
+    ):
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.lexical_indexes: dict[str, LexicalIndex] = {}
+        if lexical_index is not None:
+            self.lexical_indexes[lexical_index.collection_name] = lexical_index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.keyword_max_words = keyword_max_words
+
+    def add_lexical_index(self, lexical_index: LexicalIndex):
+        """Use `lexical_index` for the searches on its collection (replaces the previous one)."""
+        self.lexical_indexes[lexical_index.collection_name] = lexical_index
+
+    def _lexical(self, collection_name: str | None = None) -> LexicalIndex | None:
+        if collection_name is None:
+            lexical = self.lexical_index
+        else:
+            lexical = self.lexical_indexes.get(collection_name)
+        if lexical is None:
+            return None
+        # Picks up a re-ingested corpus without a restart (loaded in the background)
+        lexical.reload_in_background()
+        return lexical if len(lexical) else None
+
+    def keyword_search(
+        self, query: str, k: int, collection_name: str | None = None
+    ) -> list[Chunk] | None:
+        """
+        Keyword fast path.
+
+        Returns:
+            The top-k BM25 chunks, or None when the query needs the full pipeline
+        """
+        lexical = self._lexical(collection_name)
+        if lexical is None or not is_keyword_query(query, self.keyword_max_words):
+            return None
+        hits = lexical.search(query, k)
+        if not hits or not lexical.covers(query, hits[0][0]):
+            return None
+        RETRIEVAL_PATHS.inc(path="keyword")
+        return [chunk for chunk, _ in hits]
+
+    def _fuse(self, lexical, dense: list[Chunk], query_text: str | None, k: int) -> list[Chunk]:
+        if lexical is None or not query_text:
+            RETRIEVAL_PATHS.inc(path="dense")
+            return dense[:k]
+        RETRIEVAL_PATHS.inc(path="hybrid")
+        sparse = [chunk for chunk, _ in lexical.search(query_text, self.candidates)]
+        return reciprocal_rank_fusion([dense, sparse], k, self.rrf_k)
+
+    def _dense_k(self, lexical, query_text: str | None, k: int) -> int:
+        # Fusion needs a deeper dense list than the final k
+        return max(k, self.candidates) if lexical is not None and query_text else k
+
+    def search(
+        self,
+        collection_name: str,
+        query_vector: list[float],
+        k: int = 10,
+        query_text: str | None = None,
+        **kwargs,
+    ) -> list[Chunk]:
+        lexical = self._lexical(collection_name)
+        dense = self.vectorstore.search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            k=self._dense_k(lexical, query_text, k),
+            **kwargs,
+        )
+        return self._fuse(lexical, dense, query_text, k)
+
+    async def a_search(
+        self,
+        collection_name: str,
+        query_vector: list[float],
+        k: int = 10,
+        query_text: str | None = None,
+        **kwargs,
+    ) -> list[Chunk]:
+        lexical = self._lexical(collection_name)
+        dense = await self.vectorstore.a_search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            k=self._dense_k(lexical, query_text, k),
+            **kwargs,
+        )
+        if lexical is None or not query_text:
+            return self._fuse(lexical, dense, query_text, k)
+        return await asyncio.to_thread(self._fuse, lexical, dense, query_text, k)
+
+    def search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        query_texts: list[str] | None = None,
+    ) -> list[list[Chunk]]:
+        """search() for many queries: one batched vector search, then BM25 and fusion per query."""
+        lexical = self._lexical(collection_name)
+        dense = self.vectorstore.search_batch(
+            collection_name=collection_name,
+            query_vectors=query_vectors,
+            k=self._dense_k(lexical, bool(query_texts), k),
+        )
+        texts = query_texts or [None] * len(dense)
+        return [self._fuse(lexical, hits, text, k) for hits, text in zip(dense, texts)]
+
+    async def a_search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        query_texts: list[str] | None = None,
+    ) -> list[list[Chunk]]:
+        lexical = self._lexical(collection_name)
+        dense = await self.vectorstore.a_search_batch(
+            collection_name=collection_name,
+            query_vectors=query_vectors,
+            k=self._dense_k(lexical, bool(query_texts), k),
+        )
+        texts = query_texts or [None] * len(dense)
+        return await asyncio.to_thread(
+            lambda: [self._fuse(lexical, hits, text, k) for hits, text in zip(dense, texts)]
+        )
+
+    def _run(self, **kwargs):
+        return self.search(**kwargs)
+
+    async def _a_run(self, **kwargs):
+        return await self.a_search(**kwargs)
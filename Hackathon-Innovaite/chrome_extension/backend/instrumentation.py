@@ -0,0 +1,129 @@
+# instrumentation.py
+# Per-stage metrics for the RAG pipeline: latency histograms, error counters and
+# LLM token counts for every DAG module (rewriter, embedder, retriever, prompt,
+# generator), plus the event-loop lag of the API process. Exported on GET /metrics
+# through metrics.py.
+
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+
+from datapizza.core.models import PipelineComponent
+
+from http_pool import PooledOpenAIClient
+from metrics import Counter, Histogram
+
+STAGE_LATENCY = Histogram(
+    "rag_stage_duration_seconds",
+    "Latency of each RAG pipeline stage",
+    ("stage",),
+)
+STAGE_ERRORS = Counter(
+    "rag_stage_errors_total",
+    "Exceptions raised by each RAG pipeline stage",
+    ("stage",),
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "LLM tokens used by each stage (kind: prompt, completion, cached)",
+    ("stage", "kind"),
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "rag_event_loop_lag_seconds",
+    "How late the event loop wakes up a periodic timer (blocking code on the loop)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+# Stage currently running in this context: lets the LLM client attribute its
+# token usage to the rewriter or to the generator although they share it
+_current_stage = contextvars.ContextVar("rag_stage", default="unknown")
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a block as one pipeline stage and count its exceptions."""
+    token = _current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+        _current_stage.reset(token)
+
+
+def record_tokens(response, stage: str | None = None):
+    """Add the token usage of a datapizza ClientResponse to the token counter."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    stage = stage or _current_stage.get()
+    for kind, value in (
+        ("prompt", usage.prompt_tokens),
+        ("completion", usage.completion_tokens),
+        ("cached", usage.cached_tokens),
+    ):
+        if value:
+            LLM_TOKENS.inc(value, stage=stage, kind=kind)
+
+
+class InstrumentedModule(PipelineComponent):
+    """DAG node wrapper that records the latency and the errors of the wrapped module."""
+
+    def __init__(self, stage: str, module: PipelineComponent):
+        self.stage = stage
+        self.module = module
+
+    def _run(self, **kwargs):
+        with stage_timer(self.stage):
+            return self.module(**kwargs)
+
+    async def _a_run(self, **kwargs):
+        with stage_timer(self.stage):
+            return await self.module.a_run(**kwargs)
+
+
+def instrument_pipeline(dag_pipeline):
+    """Wrap every node of a DagPipeline in an InstrumentedModule (in place)."""
+    for name, node in list(dag_pipeline.nodes.items()):
+        if not isinstance(node, InstrumentedModule):
+            dag_pipeline.nodes[name] = InstrumentedModule(name, node)
+    return dag_pipeline
+
+
+class MeteredOpenAIClient(PooledOpenAIClient):
+    """
+    OpenAIClient (on the shared connection pools) that records the token usage
+    of every non-streaming call under the stage that is currently running.
+
+    Streaming calls are metered by the caller (see retrieval_pipeline.stream_answer).
+    """
+
+    def _invoke(self, **kwargs):
+        response = super()._invoke(**kwargs)
+        record_tokens(response)
+        return response
+
+    async def _a_invoke(self, **kwargs):
+        response = await super()._a_invoke(**kwargs)
+        record_tokens(response)
+        return response
+
+
+async def monitor_event_loop_lag(interval: float = 0.05):
+    """
+    Measure event-loop lag until cancelled.
+
+    Sleeps `interval` seconds in a loop and records how much later than requested
+    the loop resumed it: anything blocking the loop (sync I/O in a handler,
+    CPU-heavy work) shows up here.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
@@ -1,15 +1,48 @@
 # FastAPI backend server for DataPizza RAG chatbot
 # Connects frontend to the retrieval pipeline for intelligent Q&A
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import asyncio
+import hmac
+import json
 import logging
-
-# Import the RAG pipeline
-from retrieval_pipeline import answer_question
-from email_utils import build_helpdesk_email
+import time
+
+from admission import AdmissionController, AdmissionMiddleware
+from answer_cache import normalize_query
+from config import (
+    ADMISSION_BURST,
+    ADMISSION_CLIENT_HEADER,
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ADMISSION_RATE_PER_MINUTE,
+    PIPELINE_MODE,
+    RETRIEVAL_K,
+    BATCH_CONCURRENCY,
+    BATCH_MAX_QUERIES,
+    ESCALATION_EMAIL_MODE,
+    QUERY_LOG_ENABLED,
+    QUERY_LOG_PATH,
+    TENANT_ADMIN_TOKEN,
+    WARMUP_ENABLED,
+    WARMUP_RETRY_SECONDS,
+)
+from email_utils import a_build_helpdesk_email, build_helpdesk_email_template
+from faq_index import QueryLog
+from metrics import (
+    Counter,
+    Histogram,
+    LatencyWindow,
+    Summary,
+    register_collector,
+    render_metrics,
+)
+from singleflight import SingleFlight
+from tenants import Tenant, UnknownTenantError, tenant_registry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +55,29 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Admission control on the endpoints that run the pipeline or call the LLM:
+# a spike is answered with fast 429s instead of piling up until upstream rate
+# limits fail it. Added before CORS so that the 429s carry the CORS headers.
+# A batch is admitted by its endpoint, weighted by its number of questions
+ADMITTED_ENDPOINTS = {
+    "/api/chat", "/api/chat/stream", "/ask-agent", "/api/escalate",
+}
+WEIGHTED_ENDPOINTS = {"/api/chat/batch"}
+admission = AdmissionController(
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    rate_per_minute=ADMISSION_RATE_PER_MINUTE,
+    burst=ADMISSION_BURST,
+)
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    paths=ADMITTED_ENDPOINTS,
+    weighted_paths=WEIGHTED_ENDPOINTS,
+    client_header=ADMISSION_CLIENT_HEADER,
+)
+
 # Enable CORS for frontend communication
 app.add_middleware(
     CORSMiddleware,
@@ -31,10 +87,244 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Concurrent identical questions share one pipeline execution
+answer_flights = SingleFlight()
+
+# Questions received, mined by the FAQ builder (faq_index.py)
+query_log = QueryLog(QUERY_LOG_PATH) if QUERY_LOG_ENABLED else None
+
+
+# The RAG pipeline (datapizza, OpenAI and Qdrant clients, the DAG) is imported
+# and built on first use, in a worker thread: uvicorn binds at once, and the
+# startup task loads it in the background (GET /ready waits for it)
+_pipeline = None
+
+
+def load_pipeline():
+    """retrieval_pipeline, imported (and its clients built) on the first call"""
+    global _pipeline
+    if _pipeline is None:
+        import retrieval_pipeline
+
+        _pipeline = retrieval_pipeline
+    return _pipeline
+
+
+async def a_load_pipeline():
+    """load_pipeline without blocking the event loop"""
+    if _pipeline is not None:
+        return _pipeline
+    return await asyncio.to_thread(load_pipeline)
+
+
+# Request metrics (exported on GET /metrics)
+INSTRUMENTED_ENDPOINTS = {
+    "/api/chat", "/api/chat/stream", "/api/chat/batch", "/ask-agent", "/api/escalate",
+}
+
+REQUEST_COUNT = Counter(
+    "http_requests_total",
+    "HTTP requests by endpoint and status code",
+    ("endpoint", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by endpoint (streaming: until the response starts)",
+    ("endpoint",),
+)
+REQUEST_LATENCY = Summary(
+    "http_request_latency_seconds",
+    "HTTP request latency quantiles by endpoint (streaming: until the response starts)",
+    ("endpoint",),
+)
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Record count and latency of the chat endpoints"""
+    endpoint = request.url.path
+    if endpoint not in INSTRUMENTED_ENDPOINTS:
+        return await call_next(request)
+
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUEST_COUNT.inc(endpoint=endpoint, status=status)
+        REQUEST_DURATION.observe(elapsed, endpoint=endpoint)
+        REQUEST_LATENCY.observe(elapsed, endpoint=endpoint)
+
+# Escalation email latency per generation path: template | llm | llm_fallback
+ESCALATION_PATHS = ("template", "llm", "llm_fallback")
+ESCALATION_LATENCY = Summary(
+    "rag_escalation_duration_seconds",
+    "Helpdesk email generation latency by path (template, llm, llm_fallback)",
+    ("path",),
+)
+escalation_windows = {path: LatencyWindow() for path in ESCALATION_PATHS}
+
+
+@register_collector
+def collect_component_stats():
+    """Export the counters of the caches, the single-flight group and the rewrite policy"""
+    families = []
+    pipeline = _pipeline
+
+    # One answer cache per tenant
+    caches = []
+    if pipeline is not None:
+        caches = [
+            (state.tenant.id, state.answer_cache.stats())
+            for state in pipeline.tenant_states()
+            if state.answer_cache is not None
+        ]
+    if caches:
+        families.append((
+            "rag_answer_cache_requests_total", "counter",
+            "Answer cache lookups by tenant and result (exact hit, semantic hit, miss)",
+            [
+                ({"tenant": tenant, "result": result}, stats[key])
+                for tenant, stats in caches
+                for result, key in (
+                    ("exact_hit", "exact_hits"),
+                    ("semantic_hit", "semantic_hits"),
+                    ("miss", "misses"),
+                )
+            ],
+        ))
+        families.append((
+            "rag_answer_cache_entries", "gauge",
+            "Answers currently cached, by tenant",
+            [({"tenant": tenant}, stats["entries"]) for tenant, stats in caches],
+        ))
+
+    # One FAQ index per tenant
+    faqs = []
+    if pipeline is not None:
+        faqs = [
+            (state.tenant.id, state.faq_index.stats())
+            for state in pipeline.tenant_states()
+            if state.faq_index is not None
+        ]
+    if faqs:
+        families.append((
+            "rag_faq_requests_total", "counter",
+            "FAQ index lookups by tenant and result (exact hit, semantic hit, miss, stale)",
+            [
+                ({"tenant": tenant, "result": result}, stats[key])
+                for tenant, stats in faqs
+                for result, key in (
+                    ("exact_hit", "exact_hits"),
+                    ("semantic_hit", "semantic_hits"),
+                    ("miss", "misses"),
+                    ("stale", "stale_lookups"),
+                )
+            ],
+        ))
+        families.append((
+            "rag_faq_entries", "gauge",
+            "Canonical questions in the FAQ index, by tenant",
+            [({"tenant": tenant}, stats["entries"]) for tenant, stats in faqs],
+        ))
+
+    if pipeline is not None and pipeline.embedding_cache is not None:
+        stats = pipeline.embedding_cache.stats()
+        families.append((
+            "rag_embedding_cache_requests_total", "counter",
+            "Embedding cache lookups by result",
+            [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])],
+        ))
+        families.append((
+            "rag_embedding_cache_entries", "gauge",
+            "Embeddings currently stored in the cache",
+            [({}, stats["entries"])],
+        ))
+
+    flights = answer_flights.stats()
+    families.append((
+        "rag_singleflight_requests_total", "counter",
+        "Chat requests that started a pipeline run (leader) or joined one (coalesced)",
+        [
+            ({"role": "leader"}, flights["executions"]),
+            ({"role": "coalesced"}, flights["coalesced_requests"]),
+        ],
+    ))
+    families.append((
+        "rag_singleflight_in_flight", "gauge",
+        "Pipeline runs currently shared by the single-flight group",
+        [({}, flights["in_flight"])],
+    ))
+
+    if pipeline is not None:
+        rewrite = pipeline.rewrite_policy.stats()
+        families.append((
+            "rag_rewrite_decisions_total", "counter",
+            "Rewrite policy decisions",
+            [
+                ({"mode": rewrite["mode"], "decision": decision}, count)
+                for decision, count in rewrite["decisions"].items()
+            ],
+        ))
+    return families
+
+
+async def _execute_answer(query: str, tenant: Tenant) -> str:
+    """
+    Answer a query with the configured PIPELINE_MODE
+
+    - "async": async-native pipeline, no thread pinned per request
+    - "thread": blocking pipeline offloaded to the default thread pool
+    """
+    pipeline = await a_load_pipeline()
+    if PIPELINE_MODE == "thread":
+        return await asyncio.to_thread(pipeline.answer_question, query, tenant.id)
+    return await pipeline.a_answer_question(query, tenant.id)
+
+
+async def run_answer(query: str, tenant: Tenant) -> str:
+    """
+    Answer a query, coalescing concurrent requests for the same normalized
+    question (same tenant and k) into a single pipeline run
+    """
+    log_query(query, tenant)
+    key = (normalize_query(query), tenant.id, RETRIEVAL_K)
+    return await answer_flights.do(key, lambda: _execute_answer(query, tenant))
+
+
+def log_query(query: str, tenant: Tenant):
+    """Append a question to the query log (QUERY_LOG_ENABLED); never fails a request"""
+    if query_log is None:
+        return
+    try:
+        query_log.record(tenant.id, query)
+    except OSError as e:
+        logger.error(f"Error writing the query log: {str(e)}")
+
+
+def resolve_tenant(tenant_id: str | None) -> Tenant:
+    """
+    Tenant of a request (the default tenant when no ID is given)
+
+    Raises:
+        HTTPException: 404 if no tenant is registered with this ID
+    """
+    try:
+        return tenant_registry.get(tenant_id)
+    except UnknownTenantError:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {tenant_id}")
+
+
 # Request/Response models
 class QueryRequest(BaseModel):
     """Chat query request model"""
     query: str
+    # University the question is about (TENANTS_PATH); None = default tenant
+    tenant_id: str | None = None
 
 
 class QueryResponse(BaseModel):
@@ -42,6 +332,14 @@ class QueryResponse(BaseModel):
     answer: str
 
 
+class BatchQueryRequest(BaseModel):
+    """Batch chat request model"""
+    queries: list[str]
+    tenant_id: str | None = None
+    # Stream the answers as Server-Sent Events as they complete
+    stream: bool = False
+
+
 @app.get("/", tags=["Health"])
 async def root():
     """Root endpoint - health check"""
@@ -50,6 +348,14 @@ async def root():
         "service": "DataPizza RAG API",
         "endpoints": {
             "chat": "POST /api/chat",
+            "chat_stream": "POST /api/chat/stream",
+            "chat_batch": "POST /api/chat/batch",
+            "ready": "GET /ready",
+            "tenants": "GET /api/tenants",
+            "cache_stats": "GET /api/cache/stats",
+            "faq_stats": "GET /api/faq/stats",
+            "admission_stats": "GET /api/admission/stats",
+            "metrics": "GET /metrics",
             "docs": "/docs",
         },
     }
@@ -61,6 +367,149 @@ async def health_check():
     return {"status": "healthy", "service": "DataPizza RAG API"}
 
 
+@app.get("/ready", tags=["Health"])
+async def readiness_check():
+    """Readiness: 200 once the pipeline is loaded and warm, 503 until then"""
+    if app.state.ready:
+        return {"status": "ready", "warmup_ms": app.state.warmup_ms}
+    return JSONResponse(
+        status_code=503,
+        content={"status": "warming_up", "error": app.state.warmup_error},
+    )
+
+
+@app.get("/api/cache/stats", tags=["Health"])
+async def cache_stats():
+    """
+    Hit/miss counters of the answer caches and of the query-embedding cache
+
+    `answers` is the cache of the default tenant, `tenants` the caches of
+    every tenant served so far
+    """
+    pipeline = await a_load_pipeline()
+    answer_caches = {
+        state.tenant.id: state.answer_cache.stats()
+        for state in pipeline.tenant_states()
+        if state.answer_cache is not None
+    }
+    default = tenant_registry.default.id
+    return {
+        "answers": (
+            {"enabled": True, **answer_caches[default]}
+            if default in answer_caches
+            else {"enabled": False}
+        ),
+        "tenants": answer_caches,
+        "embeddings": (
+            {"enabled": True, **pipeline.embedding_cache.stats()}
+            if pipeline.embedding_cache is not None
+            else {"enabled": False}
+        ),
+    }
+
+
+@app.get("/api/admission/stats", tags=["Health"])
+async def admission_stats():
+    """Admission control: requests running, waiting, admitted and turned away"""
+    return admission.stats()
+
+
+@app.get("/api/faq/stats", tags=["Health"])
+async def faq_stats():
+    """Precomputed FAQ answers per tenant served so far: entries, hits, staleness"""
+    pipeline = await a_load_pipeline()
+    return {
+        state.tenant.id: state.faq_index.stats()
+        for state in pipeline.tenant_states()
+        if state.faq_index is not None
+    }
+
+
+@app.get("/metrics", tags=["Health"])
+async def metrics_endpoint():
+    """Prometheus metrics: request latency, per-stage latency, tokens, caches"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/singleflight/stats", tags=["Health"])
+async def singleflight_stats():
+    """How many chat requests were coalesced into an already running pipeline"""
+    return answer_flights.stats()
+
+
+@app.get("/api/rewrite/stats", tags=["Health"])
+async def rewrite_stats():
+    """Rewrite policy decisions and latency of the rewriting stage"""
+    pipeline = await a_load_pipeline()
+    return pipeline.rewrite_policy.stats()
+
+
+@app.get("/api/context/stats", tags=["Health"])
+async def context_stats():
+    """Context packing: tokens retrieved, sent to the generator and saved"""
+    pipeline = await a_load_pipeline()
+    if pipeline.context_packer is None:
+        return {"enabled": False}
+    return {"enabled": True, **pipeline.context_packer.stats()}
+
+
+@app.get("/api/tenants", tags=["Tenants"])
+async def list_tenants():
+    """Registered tenants; `loaded` tells whether one has served a request yet"""
+    loaded = set()
+    if _pipeline is not None:
+        loaded = {state.tenant.id for state in _pipeline.tenant_states()}
+    return {
+        "default": tenant_registry.default.id,
+        "tenants": [
+            {**tenant.to_dict(), "loaded": tenant.id in loaded}
+            for tenant in tenant_registry.tenants()
+        ],
+    }
+
+
+def require_admin_token(token: str | None):
+    """Guard of the tenant registration endpoints (TENANT_ADMIN_TOKEN)"""
+    if not TENANT_ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail="Tenant registration is disabled: set TENANT_ADMIN_TOKEN",
+        )
+    if not hmac.compare_digest((token or "").encode(), TENANT_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.put("/api/tenants/{tenant_id}", tags=["Tenants"])
+async def register_tenant(
+    tenant_id: str, record: dict, x_admin_token: str | None = Header(default=None)
+):
+    """
+    Add or update a tenant in TENANTS_PATH, no restart needed (the other
+    workers reload the file within a second)
+
+    Body: the tenant record without `id` (see tenants.py); at least
+    `collection_name`
+    """
+    require_admin_token(x_admin_token)
+    try:
+        tenant = Tenant.from_dict({**record, "id": tenant_id})
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tenant_registry.register(tenant)
+    logger.info(f"Registered tenant {tenant.id} (collection {tenant.collection_name})")
+    return tenant.to_dict()
+
+
+@app.delete("/api/tenants/{tenant_id}", tags=["Tenants"])
+async def remove_tenant(tenant_id: str, x_admin_token: str | None = Header(default=None)):
+    """Remove a tenant from TENANTS_PATH (its collection is left untouched)"""
+    require_admin_token(x_admin_token)
+    if not tenant_registry.remove(tenant_id.lower()):
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {tenant_id}")
+    logger.info(f"Removed tenant {tenant_id}")
+    return {"removed": tenant_id}
+
+
 @app.post("/api/chat", response_model=QueryResponse, tags=["Chat"])
 async def chat_endpoint(request: QueryRequest):
     """
@@ -77,12 +526,12 @@ async def chat_endpoint(request: QueryRequest):
     """
     if not request.query or not request.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+    tenant = resolve_tenant(request.tenant_id)
 
     try:
-        logger.info(f"Processing query: {request.query[:50]}...")
+        logger.info(f"Processing query ({tenant.id}): {request.query[:50]}...")
 
-        # Run the blocking RAG pipeline in a thread pool
-        answer = await asyncio.to_thread(answer_question, request.query)
+        answer = await run_answer(request.query, tenant)
 
         logger.info("Query processed successfully")
         return QueryResponse(answer=answer)
@@ -95,13 +544,157 @@ async def chat_endpoint(request: QueryRequest):
         )
 
 
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat/stream", tags=["Chat"])
+async def chat_stream_endpoint(request: QueryRequest):
+    """
+    Streaming chat endpoint (Server-Sent Events)
+
+    Emits, in order:
+    - `retrieval`: the retrieved sources, as soon as the vector search returns
+    - `token`: one event per generator delta
+    - `done`: the full answer plus time-to-first-token and total time (ms)
+    - `error`: if the pipeline fails after the stream has started
+
+    Args:
+        request: QueryRequest containing the user's question
+    """
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    tenant = resolve_tenant(request.tenant_id)
+
+    logger.info(f"Streaming query ({tenant.id}): {request.query[:50]}...")
+    log_query(request.query, tenant)
+    pipeline = await a_load_pipeline()
+
+    async def a_event_stream():
+        try:
+            async for event, data in pipeline.a_stream_answer(request.query, tenant.id):
+                yield sse_event(event, data)
+            logger.info("Streaming query completed")
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+
+    def event_stream():
+        # Sync generator: Starlette iterates it in the thread pool
+        try:
+            for event, data in pipeline.stream_answer(request.query, tenant.id):
+                yield sse_event(event, data)
+            logger.info("Streaming query completed")
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream() if PIPELINE_MODE == "thread" else a_event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/chat/batch", tags=["Chat"])
+async def chat_batch_endpoint(request: BatchQueryRequest, http_request: Request):
+    """
+    Batch chat endpoint - answers up to BATCH_MAX_QUERIES questions in one call
+
+    The questions are embedded with one embeddings request and searched with
+    one batched vector search; repeated questions are answered once and the
+    answers are generated BATCH_CONCURRENCY at a time. Admission control charges
+    the client one rate-limit token per question and holds one slot per
+    generation running at once (429 + Retry-After when not admitted).
+
+    Returns `{"results": [...], "total_ms": ...}` with one result per question,
+    in order: `{"index", "query", "answer", "cached", "path"}`, or
+    `{"index", "query", "error"}` if that answer failed. With `"stream": true`
+    the results are sent as Server-Sent Events as they complete instead:
+    - `result`: one result (see above)
+    - `done`: number of results and errors, total time (ms)
+    - `error`: if the batch fails as a whole (embedding or search)
+
+    Args:
+        request: BatchQueryRequest with the questions
+        http_request: The HTTP request, holding the admission lease
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries: {len(request.queries)}, at most {BATCH_MAX_QUERIES}",
+        )
+    empty = [i for i, query in enumerate(request.queries) if not query or not query.strip()]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Empty queries at positions {empty}")
+    tenant = resolve_tenant(request.tenant_id)
+    await http_request.state.admission.acquire(
+        cost=len(request.queries),
+        slots=min(BATCH_CONCURRENCY, len(request.queries)),
+    )
+
+    logger.info(f"Processing a batch of {len(request.queries)} queries ({tenant.id})")
+    pipeline = await a_load_pipeline()
+    start = time.perf_counter()
+
+    def total_ms():
+        return round((time.perf_counter() - start) * 1000, 1)
+
+    if request.stream:
+        async def event_stream():
+            count = errors = 0
+            try:
+                async for index, result in pipeline.a_answer_batch(request.queries, tenant.id):
+                    count += 1
+                    errors += "error" in result
+                    yield sse_event("result", {"index": index, **result})
+                yield sse_event("done", {"count": count, "errors": errors, "total_ms": total_ms()})
+                logger.info("Batch completed")
+            except Exception as e:
+                logger.error(f"Error processing batch: {str(e)}")
+                yield sse_event("error", {"detail": f"Error processing batch: {str(e)}"})
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        results = [None] * len(request.queries)
+        async for index, result in pipeline.a_answer_batch(request.queries, tenant.id):
+            results[index] = {"index": index, **result}
+        logger.info("Batch completed")
+        return {"results": results, "total_ms": total_ms()}
+
+    except Exception as e:
+        logger.error(f"Error processing batch: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing batch: {str(e)}",
+        )
+
+
+@app.get("/api/chat/stream/stats", tags=["Health"])
+async def chat_stream_stats():
+    """Time-to-first-token and total latency of the streaming endpoint"""
+    pipeline = await a_load_pipeline()
+    return {
+        "ttft": pipeline.ttft_window.snapshot(),
+        "total": pipeline.stream_total_window.snapshot(),
+    }
+
+
 @app.post("/ask-agent", response_model=QueryResponse, tags=["Chat"])
 async def ask_agent_endpoint(request: dict):
     """
     Legacy endpoint for frontend compatibility - accepts question and returns answer
 
     Args:
-        request: Dictionary with 'question' key
+        request: Dictionary with 'question' key (and optionally 'tenant_id')
 
     Returns:
         QueryResponse with the generated answer
@@ -111,12 +704,12 @@ async def ask_agent_endpoint(request: dict):
 
     if not question or not str(question).strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
+    tenant = resolve_tenant(request.get("tenant_id"))
 
     try:
         logger.info(f"Processing question: {question[:50]}...")
 
-        # Run the blocking RAG pipeline in a thread pool
-        answer = await asyncio.to_thread(answer_question, question)
+        answer = await run_answer(question, tenant)
 
         # Clean the answer - extract text from ClientResponse object
         answer_text = clean_answer(answer)
@@ -216,8 +809,15 @@ async def escalate_endpoint(request: dict):
         "name": "student name",
         "surname": "student surname",
         "student_id": "student ID",
-        "email": "student email (optional)"
+        "email": "student email (optional)",
+        "rag_answer": "chatbot answer (optional)",
+        "polish": true/false (optional, default from ESCALATION_EMAIL_MODE),
+        "tenant_id": "university (optional): selects the helpdesk address"
     }
+
+    The email is built from a template (no LLM call) unless polishing is
+    requested; the LLM path is async and falls back to the template on error.
+    The response carries `generated_by`: "template" or "llm".
     """
     try:
         # Extract form fields
@@ -229,20 +829,44 @@ async def escalate_endpoint(request: dict):
 
         if not query:
             raise HTTPException(status_code=400, detail="Missing original query")
+        tenant = resolve_tenant(request.get("tenant_id"))
 
         logger.info(f"Generating helpdesk email for {name} {surname} ({student_id})")
 
-        # Generate email payload using the LLM (email_utils) - this does NOT send
-        email_payload = build_helpdesk_email(
+        polish = request.get("polish")
+        if polish is None:
+            polish = ESCALATION_EMAIL_MODE == "llm"
+
+        fields = dict(
             first_name=name,
             last_name=surname,
             student_id=student_id,
             student_email=student_email,
             user_question=query,
-            rag_answer=request.get("rag_answer", ""),
+            rag_answer=request.get("rag_answer") or "",
+            helpdesk_email=tenant.helpdesk_email,
         )
 
+        # Generate email payload (email_utils) - this does NOT send
+        start = time.perf_counter()
+        if polish:
+            try:
+                email_payload = await a_build_helpdesk_email(**fields)
+                path = "llm"
+            except Exception as e:
+                logger.warning(f"LLM email generation failed, using the template: {str(e)}")
+                email_payload = build_helpdesk_email_template(**fields)
+                path = "llm_fallback"
+        else:
+            email_payload = build_helpdesk_email_template(**fields)
+            path = "template"
+
+        elapsed = time.perf_counter() - start
+        ESCALATION_LATENCY.observe(elapsed, path=path)
+        escalation_windows[path].observe(elapsed * 1000)
+
         # Return the generated payload to the frontend for preview
+        email_payload["generated_by"] = "llm" if path == "llm" else "template"
         return email_payload
 
     except HTTPException:
@@ -255,10 +879,57 @@ async def escalate_endpoint(request: dict):
         )
 
 
+@app.get("/api/escalate/stats", tags=["Health"])
+async def escalate_stats():
+    """Helpdesk email generation latency per path (template, llm, llm_fallback)"""
+    return {
+        "default_mode": ESCALATION_EMAIL_MODE,
+        **{path: window.snapshot() for path, window in escalation_windows.items()},
+    }
+
+
+app.state.ready = False
+app.state.warmup_ms = None
+app.state.warmup_error = None
+app.state.lag_monitor = None
+
+
+async def start_pipeline():
+    """
+    Load the pipeline, then prime its connections, indexes and models (when
+    WARMUP_ENABLED), retrying while a dependency is unreachable; GET /ready
+    reports ready afterwards
+    """
+    while True:
+        try:
+            start = time.perf_counter()
+            pipeline = await a_load_pipeline()
+            timings = {"load": round((time.perf_counter() - start) * 1000, 1)}
+            if app.state.lag_monitor is None:
+                # Loaded with the pipeline; event-loop lag is exported on /metrics
+                from instrumentation import monitor_event_loop_lag
+
+                app.state.lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+            if WARMUP_ENABLED:
+                timings.update(await pipeline.a_warm_up(async_clients=PIPELINE_MODE != "thread"))
+            break
+        except Exception as e:
+            app.state.warmup_error = str(e)
+            logger.error(f"Warm-up failed, retrying in {WARMUP_RETRY_SECONDS}s: {str(e)}")
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    app.state.warmup_ms = timings
+    app.state.warmup_error = None
+    app.state.ready = True
+    logger.info(f"Pipeline ready: {timings}")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Run on application startup"""
     logger.info("DataPizza RAG API starting...")
+    logger.info(f"Pipeline mode: {PIPELINE_MODE}")
+    # In the background: the server binds and /health answers at once, /ready once warm
+    app.state.warmup = asyncio.create_task(start_pipeline())
     logger.info("Backend ready for frontend connections")
 
 
@@ -266,6 +937,13 @@ async def startup_event():
 async def shutdown_event():
     """Run on application shutdown"""
     logger.info("DataPizza RAG API shutting down...")
+    app.state.warmup.cancel()
+    if app.state.lag_monitor is not None:
+        app.state.lag_monitor.cancel()
+    if _pipeline is not None:
+        from http_pool import close_http_pools
+
+        await close_http_pools()
 
 
 if __name__ == "__main__":
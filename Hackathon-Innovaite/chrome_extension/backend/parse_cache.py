@@ -0,0 +1,122 @@
+# parse_cache.py
+# On-disk cache of parsed documents, keyed by file hash and parser version.
+#
+# Docling is by far the slowest ingestion step. The node tree it returns is
+# stored as gzipped JSON under <directory>/<parser version key>/<file sha256>.json.gz,
+# so a file is parsed once per content version: splitter or embedding model
+# experiments (and --full re-ingestions) re-split the cached trees instead.
+#
+# A new parser (class, Docling or datapizza version, or CACHE_FORMAT) gets a new
+# version key, and the entries of the previous one are never read again.
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+from importlib import metadata
+from pathlib import Path
+
+from datapizza.type import Node, NodeType
+
+logger = logging.getLogger(__name__)
+
+# Bump when the serialized layout below changes
+CACHE_FORMAT = 1
+
+# Distributions whose upgrade can change the parsed trees
+PARSER_PACKAGES = ("docling", "docling-core", "datapizza-ai", "datapizza-ai-parsers-docling")
+
+
+def parser_version(parser_cls: type, packages: tuple[str, ...] = PARSER_PACKAGES) -> str:
+    """Parser class, versions of the packages behind it and cache format, as one string."""
+    parts = [f"{parser_cls.__module__}.{parser_cls.__qualname__}", f"format={CACHE_FORMAT}"]
+    for package in packages:
+        try:
+            parts.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            continue
+    return ";".join(parts)
+
+
+def node_to_dict(node: Node) -> dict:
+    """Compact form of a node tree: empty fields are left out."""
+    data = {"t": node.node_type.value}
+    if node.is_leaf and node._content:
+        data["c"] = node._content
+    if node.metadata:
+        data["m"] = node.metadata
+    if node.children:
+        data["k"] = [node_to_dict(child) for child in node.children]
+    return data
+
+
+def node_from_dict(data: dict) -> Node:
+    return Node(
+        children=[node_from_dict(child) for child in data.get("k", [])],
+        metadata=data.get("m"),
+        node_type=NodeType(data["t"]),
+        content=data.get("c"),
+    )
+
+
+class ParseCache:
+    """
+    Parsed node trees of one parser version.
+
+    Args:
+        directory: Root of the cache (one subdirectory per parser version)
+        version: Parser version string (see parser_version)
+    """
+
+    def __init__(self, directory: Path, version: str):
+        self.root = Path(directory)
+        self.version = version
+        self.key = hashlib.sha256(version.encode("utf-8")).hexdigest()[:16]
+        self.directory = self.root / self.key
+
+    def _path(self, file_hash: str) -> Path:
+        return self.directory / f"{file_hash}.json.gz"
+
+    def get(self, file_hash: str) -> Node | None:
+        try:
+            with gzip.open(self._path(file_hash), "rt", encoding="utf-8") as f:
+                return node_from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            # Truncated or foreign entry: parse again and overwrite it
+            logger.warning(f"Ignoring unreadable parse cache entry {file_hash}: {str(e)}")
+            return None
+
+    def put(self, file_hash: str, node: Node):
+        # Write-then-rename: parser processes may write the same entry concurrently
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(file_hash)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(node_to_dict(node), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def prune(self, keep: set[str]) -> int:
+        """
+        Delete the entries of files that are no longer in the corpus (hashes not in
+        `keep`) and the directories of the other parser versions.
+
+        Returns:
+            Number of files deleted
+        """
+        deleted = 0
+        if not self.root.exists():
+            return deleted
+        for directory in self.root.iterdir():
+            if directory.is_dir() and directory != self.directory:
+                deleted += sum(1 for f in directory.iterdir())
+                shutil.rmtree(directory, ignore_errors=True)
+        if self.directory.exists():
+            for path in self.directory.iterdir():
+                if path.name.split(".", 1)[0] not in keep:
+                    path.unlink(missing_ok=True)
+                    deleted += 1
+        return deleted
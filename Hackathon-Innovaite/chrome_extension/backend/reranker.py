@@ -0,0 +1,283 @@
+# reranker.py
+# Optional cross-encoder reranking stage between the retriever and the prompt.
+#
+# The retriever fetches RERANK_CANDIDATES chunks instead of RETRIEVAL_K; a small
+# cross-encoder (e.g. ms-marco-MiniLM-L-6-v2) scores every (question, chunk)
+# pair on CPU, in batches, and the best RETRIEVAL_K go into the prompt.
+#
+# - Backends: ONNX Runtime (a quantized model.onnx + tokenizer.json, no torch) or
+#   sentence-transformers. Both are optional dependencies, imported on first use.
+# - Scores are cached per (question, chunk text): repeated and coalesced
+#   questions are not scored again.
+# - Latency budget: when scoring the uncached pairs is expected to exceed
+#   RERANK_BUDGET_MS (or does, batch after batch), the stage returns the
+#   chunks in retriever order.
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from datapizza.core.models import PipelineComponent
+from datapizza.type import Chunk
+
+from metrics import Counter
+
+RERANK_OUTCOMES = Counter(
+    "rag_rerank_total",
+    "Rerank stage runs by outcome (reranked, cached: all scores cached, over_budget: retriever order kept)",
+    ("outcome",),
+)
+
+# Model files looked up in an ONNX model directory, best first
+ONNX_MODEL_FILES = (
+    "model_quantized.onnx",
+    "model_int8.onnx",
+    "model.onnx",
+    "onnx/model_quantized.onnx",
+    "onnx/model_int8.onnx",
+    "onnx/model.onnx",
+)
+
+
+class OnnxCrossEncoder:
+    """
+    Cross-encoder run with ONNX Runtime on CPU.
+
+    Args:
+        model_dir: Directory with the .onnx model (see ONNX_MODEL_FILES) and tokenizer.json
+        max_length: Tokens per (question, chunk) pair; the chunk is truncated
+        threads: ONNX Runtime intra-op threads (0: one per core)
+    """
+
+    def __init__(self, model_dir: Path, max_length: int = 256, threads: int = 0):
+        self.model_dir = Path(model_dir)
+        self.max_length = max_length
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self._input_names: set[str] = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            try:
+                import onnxruntime as ort
+                from tokenizers import Tokenizer
+            except ImportError as e:
+                raise RuntimeError(
+                    "RERANK_BACKEND=onnx needs the onnxruntime and tokenizers packages"
+                ) from e
+
+            model_path = next(
+                (self.model_dir / name for name in ONNX_MODEL_FILES if (self.model_dir / name).exists()),
+                None,
+            )
+            if model_path is None:
+                raise FileNotFoundError(f"No ONNX model in {self.model_dir} (expected one of {ONNX_MODEL_FILES})")
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+            tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=self.max_length, strategy="only_second")
+            tokenizer.enable_padding()
+
+            self._input_names = {i.name for i in session.get_inputs()}
+            self._tokenizer = tokenizer
+            self._session = session
+
+    def score(self, query: str, texts: list[str]) -> np.ndarray:
+        self.load()
+        encodings = self._tokenizer.encode_batch([(query, text) for text in texts])
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self._input_names:
+            feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        logits = self._session.run(None, feed)[0].reshape(len(texts), -1)
+        # One relevance logit, or (irrelevant, relevant) logits
+        return logits[:, -1]
+
+
+class SentenceTransformersCrossEncoder:
+    """
+    Cross-encoder run with sentence-transformers on CPU.
+
+    Args:
+        model_name: Hugging Face model name or local path
+        max_length: Tokens per (question, chunk) pair
+    """
+
+    def __init__(self, model_name: str, max_length: int = 256):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError as e:
+                raise RuntimeError(
+                    "RERANK_BACKEND=sentence-transformers needs the sentence-transformers package"
+                ) from e
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+
+    def score(self, query: str, texts: list[str]) -> np.ndarray:
+        self.load()
+        return np.asarray(
+            self._model.predict(
+                [(query, text) for text in texts],
+                batch_size=len(texts),
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        ).reshape(len(texts))
+
+
+class ScoreCache:
+    """Thread-safe LRU of cross-encoder scores keyed by (question, chunk text)."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._scores: OrderedDict[tuple[str, bytes], float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query: str, text: str) -> tuple[str, bytes]:
+        return query, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key) -> float | None:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def put(self, key, score: float):
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+
+class CrossEncoderReranker(PipelineComponent):
+    """
+    Rerank stage of the DAG: chunks (retriever order) -> best k by cross-encoder score.
+
+    Args:
+        scorer: OnnxCrossEncoder or SentenceTransformersCrossEncoder
+        budget_ms: Latency budget of the stage; over it the retriever order is kept
+        batch_size: Pairs per forward pass
+        cache: Score cache (None: no caching)
+    """
+
+    def __init__(
+        self,
+        scorer,
+        budget_ms: float = 150.0,
+        batch_size: int = 16,
+        cache: ScoreCache | None = None,
+    ):
+        self.scorer = scorer
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.cache = cache
+        # Moving average of the cost of one pair, to skip runs that cannot fit
+        self._ms_per_pair: float | None = None
+
+    def warm_up(self):
+        """Load the model and run one batch (first inferences are slow)."""
+        self.scorer.load()
+        self.scorer.score("warm up", ["warm up"] * min(self.batch_size, 4))
+
+    def rerank(self, query: str, chunks: list[Chunk], k: int) -> list[Chunk]:
+        if len(chunks) <= 1:
+            return chunks[:k]
+        # Loading the model is not part of the budget (see warm_up)
+        self.scorer.load()
+        start = time.perf_counter()
+
+        keys = [ScoreCache.key(query, chunk.text) for chunk in chunks]
+        scores: list[float | None] = [
+            self.cache.get(key) if self.cache is not None else None for key in keys
+        ]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        if missing and self._ms_per_pair is not None and self._ms_per_pair * len(missing) > self.budget_ms:
+            # Decayed on every skip, so that a slow spell does not disable the stage for good
+            self._ms_per_pair *= 0.95
+            RERANK_OUTCOMES.inc(outcome="over_budget")
+            return chunks[:k]
+
+        for offset in range(0, len(missing), self.batch_size):
+            batch = missing[offset : offset + self.batch_size]
+            t0 = time.perf_counter()
+            batch_scores = self.scorer.score(query, [chunks[i].text for i in batch])
+            self._observe((time.perf_counter() - t0) * 1000 / len(batch))
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                if self.cache is not None:
+                    self.cache.put(keys[i], scores[i])
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            remaining = len(missing) - offset - len(batch)
+            if remaining and elapsed_ms + self._ms_per_pair * remaining > self.budget_ms:
+                # The scores computed so far stay cached for the next time
+                RERANK_OUTCOMES.inc(outcome="over_budget")
+                return chunks[:k]
+
+        RERANK_OUTCOMES.inc(outcome="reranked" if missing else "cached")
+        # Stable sort: ties keep the retriever order
+        order = sorted(range(len(chunks)), key=lambda i: -scores[i])
+        return [chunks[i] for i in order[:k]]
+
+    def _observe(self, ms_per_pair: float):
+        if self._ms_per_pair is None:
+            self._ms_per_pair = ms_per_pair
+        else:
+            self._ms_per_pair = 0.8 * self._ms_per_pair + 0.2 * ms_per_pair
+
+    def _run(self, query: str, chunks: list[Chunk], k: int = 3):
+        return self.rerank(query, chunks, k)
+
+    async def _a_run(self, query: str, chunks: list[Chunk], k: int = 3):
+        # CPU-bound: keep it off the event loop
+        return await asyncio.to_thread(self.rerank, query, chunks, k)
+
+
+def build_reranker(
+    backend: str,
+    model: str,
+    budget_ms: float,
+    batch_size: int,
+    cache_entries: int,
+    max_length: int = 256,
+    threads: int = 0,
+) -> CrossEncoderReranker:
+    """Reranker for RERANK_BACKEND ("onnx" or "sentence-transformers")."""
+    if backend == "onnx":
+        scorer = OnnxCrossEncoder(Path(model), max_length=max_length, threads=threads)
+    elif backend == "sentence-transformers":
+        scorer = SentenceTransformersCrossEncoder(model, max_length=max_length)
+    else:
+        raise ValueError(f"Unknown RERANK_BACKEND {backend!r}, expected 'onnx' or 'sentence-transformers'")
+    return CrossEncoderReranker(
+        scorer,
+        budget_ms=budget_ms,
+        batch_size=batch_size,
+        cache=ScoreCache(cache_entries) if cache_entries > 0 else None,
+    )
@@ -1,21 +1,77 @@
-from datapizza.clients.openai import OpenAIClient
-from datapizza.embedders.openai import OpenAIEmbedder
 from datapizza.modules.prompt import ChatPromptTemplate
 from datapizza.modules.rewriters import ToolRewriter
 from datapizza.pipeline import DagPipeline
-from datapizza.vectorstores.qdrant import QdrantVectorstore
 
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+
+from answer_cache import AnswerCache, CollectionVersion, normalize_query
 from config import (
     OPENAI_API_KEY,
-    QDRANT_HOST,
-    QDRANT_PORT,
-    QDRANT_API_KEY,
+    OPENAI_BASE_URL,
     COLLECTION_NAME,   # es. "my_documents"
+    RETRIEVAL_K,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_SEMANTIC,
+    ANSWER_CACHE_SIMILARITY,
+    REWRITE_MODE,
+    REWRITE_SCORE_THRESHOLD,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    RETRIEVAL_MODE,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    KEYWORD_FAST_PATH,
+    KEYWORD_FAST_PATH_MAX_WORDS,
+    RERANK_ENABLED,
+    RERANK_BACKEND,
+    RERANK_MODEL,
+    RERANK_CANDIDATES,
+    RERANK_BUDGET_MS,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_THREADS,
+    RERANK_CACHE_ENTRIES,
+    CONTEXT_PACKING,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_DUPLICATE_THRESHOLD,
+    CONTEXT_MERGE_ADJACENT,
+    BATCH_CONCURRENCY,
+    FAQ_ENABLED,
+    FAQ_SIMILARITY,
+    FAQ_VETTED_ONLY,
+)
+from context_packer import ContextPacker
+from embedders import ShortenedOpenAIEmbedder
+from embedding_cache import CachedEmbedder, EmbeddingCache
+from faq_index import FaqIndex
+from hybrid_retriever import HybridRetriever
+from instrumentation import (
+    STAGE_LATENCY,
+    MeteredOpenAIClient,
+    instrument_pipeline,
+    record_tokens,
+    stage_timer,
 )
+from lexical_index import LexicalIndex
+from metrics import Counter, LatencyWindow, Summary
+from reranker import build_reranker
+from rewrite_policy import FirstPassEmbedder, RewritePolicy
+from tenants import Tenant, tenant_registry
+from vectorstores import build_vectorstore
 
-openai_client = OpenAIClient(
-    model="gpt-4o-mini",
-    api_key=OPENAI_API_KEY
+# Records the token usage of the rewriter and the generator on /metrics
+GENERATOR_MODEL = "gpt-4o-mini"
+openai_client = MeteredOpenAIClient(
+    model=GENERATOR_MODEL,
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
 )
 
 query_rewriter = ToolRewriter(
@@ -23,20 +79,72 @@ query_rewriter = ToolRewriter(
     system_prompt="Rewrite the user’s query to maximize retrieval accuracy while preserving its meaning. Clarify intent, expand important keywords, and avoid adding new assumptions."
 )
 
-embedder = OpenAIEmbedder(
+embedder = ShortenedOpenAIEmbedder(
     api_key=OPENAI_API_KEY,
-    model_name="text-embedding-3-small"
+    model_name=EMBEDDING_MODEL,
+    base_url=OPENAI_BASE_URL,
+    dimensions=EMBEDDING_DIMENSIONS,
 )
 
-# Use the same qdrant of ingestion (prefer host and port instead of location when possible)
-retriever = QdrantVectorstore(
-    host=QDRANT_HOST,
-    port=QDRANT_PORT,
-    api_key=QDRANT_API_KEY,
-    https=True,   # importante perché l’endpoint è https
+# Query embeddings are cached on disk and shared with the other workers
+if EMBEDDING_CACHE_ENABLED:
+    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+    embedder = CachedEmbedder(embedder, embedding_cache, dimensions=EMBEDDING_DIMENSIONS)
+else:
+    embedding_cache = None
+
+# Qdrant, or the in-memory store for offline runs (VECTORSTORE_BACKEND)
+retriever = build_vectorstore()
+
+# Vector search fused with the BM25 index of each tenant (see TenantState)
+hybrid_retriever = HybridRetriever(
+    vectorstore=retriever,
+    candidates=HYBRID_CANDIDATES,
+    rrf_k=RRF_K,
+    keyword_max_words=KEYWORD_FAST_PATH_MAX_WORDS,
 )
 
+# Optional cross-encoder over a wider candidate set (the model is loaded on first use)
+reranker = (
+    build_reranker(
+        RERANK_BACKEND,
+        RERANK_MODEL,
+        budget_ms=RERANK_BUDGET_MS,
+        batch_size=RERANK_BATCH_SIZE,
+        cache_entries=RERANK_CACHE_ENTRIES,
+        max_length=RERANK_MAX_LENGTH,
+        threads=RERANK_THREADS,
+    )
+    if RERANK_ENABLED
+    else None
+)
+# Chunks fetched by the retriever: the reranker keeps the best RETRIEVAL_K
+RETRIEVER_K = max(RERANK_CANDIDATES, RETRIEVAL_K) if reranker is not None else RETRIEVAL_K
 
+# Deduplicates, merges and fits the chunks into the prompt token budget
+context_packer = (
+    ContextPacker(
+        max_tokens=CONTEXT_MAX_TOKENS,
+        duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD,
+        merge_adjacent=CONTEXT_MERGE_ADJACENT,
+        model=GENERATOR_MODEL,
+    )
+    if CONTEXT_PACKING
+    else None
+)
+
+# Rewriting policy in front of the LLM rewriter: skips the extra round trip
+# for queries that already retrieve well
+rewrite_policy = RewritePolicy(
+    rewriter=query_rewriter,
+    embedder=embedder,
+    vectorstore=retriever,
+    collection_name=COLLECTION_NAME,
+    mode=REWRITE_MODE,
+    score_threshold=REWRITE_SCORE_THRESHOLD,
+)
+# Embeds the query chosen by the policy, reusing its first-pass embedding
+query_embedder = FirstPassEmbedder(embedder, rewrite_policy)
 
 prompt_template = ChatPromptTemplate(
     user_prompt_template="User question: {{user_prompt}}\n:",
@@ -44,17 +152,135 @@ prompt_template = ChatPromptTemplate(
 )
 
 dag_pipeline = DagPipeline()
-dag_pipeline.add_module("rewriter", query_rewriter)
-dag_pipeline.add_module("embedder", embedder)
-dag_pipeline.add_module("retriever", retriever)
+dag_pipeline.add_module("rewriter", rewrite_policy)
+dag_pipeline.add_module("embedder", query_embedder)
+dag_pipeline.add_module("retriever", hybrid_retriever)
 dag_pipeline.add_module("prompt", prompt_template)
 dag_pipeline.add_module("generator", openai_client)
 
 dag_pipeline.connect("rewriter", "embedder", target_key="text")
 dag_pipeline.connect("embedder", "retriever", target_key="query_vector")
-dag_pipeline.connect("retriever", "prompt", target_key="chunks")
+# retriever -> [reranker] -> [packer] -> prompt
+chunks_node = "retriever"
+if reranker is not None:
+    dag_pipeline.add_module("reranker", reranker)
+    dag_pipeline.connect(chunks_node, "reranker", target_key="chunks")
+    chunks_node = "reranker"
+if context_packer is not None:
+    dag_pipeline.add_module("packer", context_packer)
+    dag_pipeline.connect(chunks_node, "packer", target_key="chunks")
+    chunks_node = "packer"
+dag_pipeline.connect(chunks_node, "prompt", target_key="chunks")
 dag_pipeline.connect("prompt", "generator", target_key="memory")
 
+# Per-stage latency and error metrics
+instrument_pipeline(dag_pipeline)
+
+
+@dataclass
+class TenantState:
+    """
+    Per-tenant resources in front of the shared pipeline: the BM25 index of the
+    tenant's collection, its precomputed FAQ answers and its answer cache (both
+    ignored once the collection is re-ingested), sized by the tenant record.
+    """
+
+    tenant: Tenant
+    lexical_index: LexicalIndex | None
+    answer_cache: AnswerCache | None
+    faq_index: FaqIndex | None = None
+
+
+_tenant_states: dict[str, TenantState] = {}
+_tenant_lock = threading.Lock()
+
+
+def _build_tenant_state(tenant: Tenant) -> TenantState:
+    # BM25 index written by the ingestion script, fused with the vector search
+    lexical_index = None
+    if RETRIEVAL_MODE == "hybrid":
+        lexical_index = LexicalIndex(tenant.lexical_index_path, tenant.collection_name)
+        hybrid_retriever.add_lexical_index(lexical_index)
+
+    answer_cache = None
+    if ANSWER_CACHE_ENABLED:
+        answer_cache = AnswerCache(
+            max_entries=tenant.answer_cache_entries,
+            max_bytes=int(tenant.answer_cache_mb * 1024 * 1024),
+            ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=ANSWER_CACHE_SIMILARITY,
+            version=CollectionVersion(tenant.collection_version_file),
+        )
+
+    # Canonical questions answered offline (python faq_index.py --tenant <id>)
+    faq_index = None
+    if FAQ_ENABLED:
+        faq_index = FaqIndex(
+            tenant.faq_index_path,
+            version=CollectionVersion(tenant.collection_version_file),
+            similarity_threshold=FAQ_SIMILARITY,
+            vetted_only=FAQ_VETTED_ONLY,
+        )
+    return TenantState(
+        tenant=tenant, lexical_index=lexical_index, answer_cache=answer_cache, faq_index=faq_index
+    )
+
+
+def tenant_state(tenant_id: str | None = None) -> TenantState:
+    """
+    Resources of a tenant (None: the default tenant), built on its first request
+    and rebuilt when its record in TENANTS_PATH changes.
+
+    Raises:
+        UnknownTenantError: No tenant is registered with this ID
+    """
+    tenant = tenant_registry.get(tenant_id)
+    state = _tenant_states.get(tenant.id)
+    if state is not None and state.tenant == tenant:
+        return state
+    with _tenant_lock:
+        state = _tenant_states.get(tenant.id)
+        if state is None or state.tenant != tenant:
+            state = _build_tenant_state(tenant)
+            _tenant_states[tenant.id] = state
+    return state
+
+
+async def a_tenant_state(tenant_id: str | None = None) -> TenantState:
+    """tenant_state; loading the BM25 index of a new tenant does not block the event loop."""
+    tenant = tenant_registry.get(tenant_id)
+    state = _tenant_states.get(tenant.id)
+    if state is not None and state.tenant == tenant:
+        return state
+    return await asyncio.to_thread(tenant_state, tenant_id)
+
+
+def tenant_states() -> list[TenantState]:
+    """States of the tenants served so far; those removed from the registry are dropped."""
+    registered = {tenant.id for tenant in tenant_registry.tenants()}
+    with _tenant_lock:
+        for tenant_id in set(_tenant_states) - registered:
+            del _tenant_states[tenant_id]
+        return list(_tenant_states.values())
+
+
+# The default tenant (COLLECTION_NAME) is ready before the first request
+tenant_state()
+
+# Streaming latencies: time-to-first-token and full answer time (ms)
+ttft_window = LatencyWindow()
+stream_total_window = LatencyWindow()
+TTFT_SECONDS = Summary(
+    "rag_stream_time_to_first_token_seconds",
+    "Time to first token of the streaming endpoint",
+    ("cached",),
+)
+BATCH_QUERIES = Counter(
+    "rag_batch_queries_total",
+    "Questions of the batch API by outcome (duplicate, cached, keyword, retrieved, error)",
+    ("outcome",),
+)
+
 from email_utils import build_helpdesk_email
 
 def clean_response_with_slicing(response_str: str) -> str:
@@ -79,22 +305,604 @@ def clean_response_with_slicing(response_str: str) -> str:
 
 
 
-def answer_question(query: str) -> str:
-    result = dag_pipeline.run(
-        {
-            "rewriter": {"user_prompt": query},
-            "prompt": {"user_prompt": query},
-            "retriever": {
-                "collection_name": COLLECTION_NAME,
-                "k": 3,
-            },
-            "generator": {"input": query},
-        }
-    )
+async def a_warm_up(async_clients: bool = True) -> dict:
+    """
+    Prime the pipeline before the first request: OpenAI and vector store
+    connections, BM25 index, vector index pages and the reranker model.
+
+    Args:
+        async_clients: Prime the async clients (PIPELINE_MODE "async") instead
+            of the blocking ones
+
+    Returns:
+        {step: milliseconds}; the first failing step raises
+    """
+    timings = {}
+
+    async def step(name, awaitable):
+        start = time.perf_counter()
+        await awaitable
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    # Any cheap request opens a connection of the shared pool (TLS included)
+    if async_clients:
+        await step("openai", openai_client._get_a_client().models.list())
+    else:
+        await step("openai", asyncio.to_thread(openai_client._get_client().models.list))
+
+    # One search: connection (Qdrant) or index files (local) ready, collection present
+    state = tenant_state()
+    collection_name = state.tenant.collection_name
+    probe = [1.0] + [0.0] * (EMBEDDING_DIMENSIONS - 1)
+    if async_clients:
+        await step("vectorstore", retriever.a_search(collection_name, probe, 1))
+    else:
+        await step("vectorstore", asyncio.to_thread(retriever.search, collection_name, probe, 1))
+
+    if state.lexical_index is not None:
+        await step("lexical_index", asyncio.to_thread(state.lexical_index.reload_if_changed))
+    if reranker is not None:
+        await step("reranker", asyncio.to_thread(reranker.warm_up))
+    return timings
+
+
+def _dag_inputs(query: str, tenant: Tenant) -> dict:
+    inputs = {
+        "rewriter": {"user_prompt": query, "collection_name": tenant.collection_name},
+        "prompt": {"user_prompt": query},
+        "retriever": {
+            "collection_name": tenant.collection_name,
+            "k": RETRIEVER_K,
+            "query_text": query,
+        },
+        "generator": {"input": query, "system_prompt": tenant.system_prompt},
+    }
+    if reranker is not None:
+        inputs["reranker"] = {"query": query, "k": RETRIEVAL_K}
+    return inputs
+
+
+def run_pipeline(query: str, tenant: Tenant | None = None) -> str:
+    tenant = tenant or tenant_registry.default
+    result = dag_pipeline.run(_dag_inputs(query, tenant))
+    response_str = str(result["generator"])
+    clean_text = clean_response_with_slicing(response_str)
+    return clean_text
+
+
+async def a_run_pipeline(query: str, tenant: Tenant | None = None) -> str:
+    """
+    Async-native run of the same DAG: AsyncOpenAI for the rewriter and the
+    generator, AsyncQdrantClient for the search. No thread is pinned while
+    waiting on the network.
+    """
+    tenant = tenant or tenant_registry.default
+    result = await dag_pipeline.a_run(_dag_inputs(query, tenant))
     response_str = str(result["generator"])
     clean_text = clean_response_with_slicing(response_str)
     return clean_text
 
+
+def keyword_chunks(query: str, tenant: Tenant):
+    """
+    Keyword fast path: chunks answering a short keyword query from the BM25
+    index of the tenant alone, or None when the query needs the full pipeline.
+    """
+    if not KEYWORD_FAST_PATH:
+        return None
+    with stage_timer("keyword_retriever"):
+        return hybrid_retriever.keyword_search(query, RETRIEVAL_K, tenant.collection_name)
+
+
+async def a_keyword_chunks(query: str, tenant: Tenant):
+    """keyword_chunks in a worker thread: BM25 scoring stays off the event loop."""
+    if not KEYWORD_FAST_PATH:
+        return None
+    return await asyncio.to_thread(keyword_chunks, query, tenant)
+
+
+def pack_context(chunks):
+    """
+    Context packing outside the DAG (keyword fast path, streaming).
+
+    Returns:
+        (packed chunks, PackStats), or (chunks, None) when packing is disabled
+    """
+    if context_packer is None:
+        return chunks, None
+    with stage_timer("packer"):
+        return context_packer.pack(chunks)
+
+
+async def a_pack_context(chunks):
+    """pack_context in a worker thread: packing is CPU work, kept off the event loop."""
+    if context_packer is None:
+        return chunks, None
+    return await asyncio.to_thread(pack_context, chunks)
+
+
+def generate_answer(query: str, chunks, tenant: Tenant) -> str:
+    """
+    Packing, prompt and generator on already retrieved chunks (keyword fast
+    path, batch API): no rewrite, no embedding.
+    """
+    chunks, _ = pack_context(chunks)
+    with stage_timer("prompt"):
+        memory = prompt_template.format(user_prompt=query, chunks=chunks)
+    with stage_timer("generator"):
+        response = openai_client.invoke(
+            input=query, memory=memory, system_prompt=tenant.system_prompt
+        )
+    return clean_response_with_slicing(str(response))
+
+
+async def a_generate_answer(query: str, chunks, tenant: Tenant) -> str:
+    """Async variant of generate_answer."""
+    chunks, _ = await a_pack_context(chunks)
+    with stage_timer("prompt"):
+        memory = prompt_template.format(user_prompt=query, chunks=chunks)
+    with stage_timer("generator"):
+        response = await openai_client.a_invoke(
+            input=query, memory=memory, system_prompt=tenant.system_prompt
+        )
+    return clean_response_with_slicing(str(response))
+
+
+def lookup_cached_answer(query: str, state: TenantState, semantic: bool = True):
+    """
+    Look the query up in the FAQ index and the answer cache of a tenant: exact
+    tiers first (FAQ, then cache), then the semantic tiers on one query embedding.
+
+    Args:
+        state: The tenant state (its FAQ index and answer cache may be None)
+        semantic: Also try the semantic tiers (False on the keyword fast path,
+            which must not call the embedding API)
+
+    Returns:
+        (cached_answer or None, query_embedding or None). The embedding is reused
+        to store the answer once the pipeline has produced it.
+    """
+    cached = _exact_lookup(query, state)
+    if cached is not None:
+        return cached, None
+
+    # Semantic tiers: one embedding call instead of two LLM calls
+    query_embedding = None
+    if semantic and _semantic_enabled(state):
+        query_embedding = embedder.embed(query)
+        cached = _semantic_lookup(query_embedding, state)
+        if cached is not None:
+            return cached, query_embedding
+
+    _record_miss(state)
+    return None, query_embedding
+
+
+async def a_lookup_cached_answer(query: str, state: TenantState, semantic: bool = True):
+    """Async variant of lookup_cached_answer."""
+    cached = _exact_lookup(query, state)
+    if cached is not None:
+        return cached, None
+
+    query_embedding = None
+    if semantic and _semantic_enabled(state):
+        query_embedding = await embedder.a_embed(query)
+        cached = _semantic_lookup(query_embedding, state)
+        if cached is not None:
+            return cached, query_embedding
+
+    _record_miss(state)
+    return None, query_embedding
+
+
+def _exact_lookup(query: str, state: TenantState) -> str | None:
+    if state.faq_index is not None:
+        answer = state.faq_index.get(query)
+        if answer is not None:
+            return answer
+    if state.answer_cache is not None:
+        return state.answer_cache.get(query)
+    return None
+
+
+def _semantic_enabled(state: TenantState) -> bool:
+    return (state.faq_index is not None and len(state.faq_index) > 0) or (
+        state.answer_cache is not None and ANSWER_CACHE_SEMANTIC
+    )
+
+
+def _semantic_lookup(query_embedding, state: TenantState) -> str | None:
+    if state.faq_index is not None:
+        answer = state.faq_index.get_semantic(query_embedding)
+        if answer is not None:
+            return answer
+    if state.answer_cache is not None and ANSWER_CACHE_SEMANTIC:
+        return state.answer_cache.get_semantic(query_embedding)
+    return None
+
+
+def _record_miss(state: TenantState):
+    if state.faq_index is not None:
+        state.faq_index.record_miss()
+    if state.answer_cache is not None:
+        state.answer_cache.record_miss()
+
+
+def answer_question(query: str, tenant_id: str | None = None) -> str:
+    state = tenant_state(tenant_id)
+    tenant, answer_cache = state.tenant, state.answer_cache
+    chunks = keyword_chunks(query, tenant)
+    with stage_timer("answer_cache"):
+        cached, query_embedding = lookup_cached_answer(query, state, semantic=chunks is None)
+    if cached is not None:
+        return cached
+
+    if chunks is not None:
+        answer = generate_answer(query, chunks, tenant)
+    else:
+        answer = run_pipeline(query, tenant)
+    if answer_cache is not None:
+        answer_cache.put(query, answer, query_embedding)
+    return answer
+
+
+async def a_answer_question(query: str, tenant_id: str | None = None) -> str:
+    state = await a_tenant_state(tenant_id)
+    tenant, answer_cache = state.tenant, state.answer_cache
+    chunks = await a_keyword_chunks(query, tenant)
+    with stage_timer("answer_cache"):
+        cached, query_embedding = await a_lookup_cached_answer(
+            query, state, semantic=chunks is None
+        )
+    if cached is not None:
+        return cached
+
+    if chunks is not None:
+        answer = await a_generate_answer(query, chunks, tenant)
+    else:
+        answer = await a_run_pipeline(query, tenant)
+    if answer_cache is not None:
+        answer_cache.put(query, answer, query_embedding)
+    return answer
+
+
+async def a_answer_batch(
+    queries: list[str],
+    tenant_id: str | None = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    use_caches: bool = True,
+):
+    """
+    Answer many questions at once (POST /api/chat/batch), amortizing the
+    per-question work of a_answer_question:
+
+    - repeated questions (same normalized text) are answered once
+    - exact FAQ / answer-cache hits and keyword fast path questions are not embedded
+    - the other questions are embedded with one embeddings request and
+      searched with one batched vector search
+    - reranking, packing and generation run for `concurrency` questions at a time
+
+    The rewrite stage is skipped: batch questions have no chat history to
+    resolve, and a rewrite costs one LLM call and one more embedding each.
+
+    Args:
+        use_caches: Look up and fill the FAQ index and the answer cache (the FAQ
+            builder turns it off: it must answer from the collection itself)
+
+    Yields:
+        (index in `queries`, result) as the answers complete; result is
+        {"query", "answer", "cached", "path": "cache" | "keyword" | "hybrid" | "dense"}
+        or {"query", "error"} when the generation of that answer failed
+    """
+    state = await a_tenant_state(tenant_id)
+    tenant = state.tenant
+    lookups = state if use_caches else TenantState(tenant, state.lexical_index, None)
+    answer_cache = lookups.answer_cache
+
+    groups: dict[str, list[int]] = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(normalize_query(query), []).append(index)
+    BATCH_QUERIES.inc(len(queries) - len(groups), outcome="duplicate")
+
+    def results(indices: list[int], result: dict) -> list[tuple[int, dict]]:
+        return [(index, {"query": queries[index], **result}) for index in indices]
+
+    # 1) exact FAQ / cache tiers and keyword fast path: no embedding needed
+    done, keyword, to_embed = [], [], []
+    with stage_timer("answer_cache"):
+        for indices in groups.values():
+            query = queries[indices[0]]
+            cached = _exact_lookup(query, lookups)
+            if cached is not None:
+                done += results(indices, {"answer": cached, "cached": True, "path": "cache"})
+                continue
+            chunks = await a_keyword_chunks(query, tenant)
+            if chunks is not None:
+                keyword.append((indices, chunks))
+                _record_miss(lookups)
+            else:
+                to_embed.append(indices)
+    BATCH_QUERIES.inc(len(done), outcome="cached")
+
+    # 2) one embeddings request for the rest, then the semantic FAQ / cache tiers
+    embeddings = []
+    if to_embed:
+        with stage_timer("embedder"):
+            embeddings = await embedder.a_embed([queries[indices[0]] for indices in to_embed])
+    to_search = []
+    for indices, embedding in zip(to_embed, embeddings):
+        cached = _semantic_lookup(embedding, lookups)
+        if cached is not None:
+            BATCH_QUERIES.inc(outcome="cached")
+            done += results(indices, {"answer": cached, "cached": True, "path": "cache"})
+        else:
+            _record_miss(lookups)
+            to_search.append((indices, embedding))
+
+    for item in done:
+        yield item
+
+    # 3) one batched vector search (BM25 and fusion per question)
+    retrieved = []
+    if to_search:
+        with stage_timer("retriever"):
+            chunk_lists = await hybrid_retriever.a_search_batch(
+                collection_name=tenant.collection_name,
+                query_vectors=[embedding for _, embedding in to_search],
+                k=RETRIEVER_K,
+                query_texts=[queries[indices[0]] for indices, _ in to_search],
+            )
+        path = "hybrid" if state.lexical_index is not None else "dense"
+        retrieved = [
+            (indices, chunks, embedding, path)
+            for (indices, embedding), chunks in zip(to_search, chunk_lists)
+        ]
+
+    # 4) generation, `concurrency` answers at a time
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(indices, chunks, embedding, path):
+        query = queries[indices[0]]
+        async with semaphore:
+            try:
+                if path != "keyword" and reranker is not None:
+                    with stage_timer("reranker"):
+                        chunks = await reranker.a_run(query=query, chunks=chunks, k=RETRIEVAL_K)
+                answer = await a_generate_answer(query, chunks, tenant)
+            except Exception as e:
+                BATCH_QUERIES.inc(outcome="error")
+                return results(indices, {"error": str(e)})
+        if answer_cache is not None:
+            answer_cache.put(query, answer, embedding)
+        BATCH_QUERIES.inc(outcome="keyword" if path == "keyword" else "retrieved")
+        return results(indices, {"answer": answer, "cached": False, "path": path})
+
+    tasks = [
+        asyncio.ensure_future(generate(indices, chunks, None, "keyword"))
+        for indices, chunks in keyword
+    ]
+    tasks += [asyncio.ensure_future(generate(*item)) for item in retrieved]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for item in await next_done:
+                yield item
+    finally:
+        # The client went away: no more answers to generate
+        for task in tasks:
+            task.cancel()
+
+
+def _sources_payload(chunks) -> list[dict]:
+    return [
+        {"source": chunk.metadata.get("source"), "text": chunk.text[:200]}
+        for chunk in chunks
+    ]
+
+
+def _retrieval_event(chunks, retrieval_ms: float, path: str, packing) -> dict:
+    event = {
+        "sources": _sources_payload(chunks),
+        "retrieval_ms": round(retrieval_ms, 1),
+        "path": path,
+    }
+    if packing is not None:
+        event["context"] = packing.to_dict()
+    return event
+
+
+def stream_answer(query: str, tenant_id: str | None = None):
+    """
+    Streaming variant of answer_question.
+
+    Runs the DAG modules one by one so that the retrieved chunks can be sent as
+    soon as they are ready and the generator tokens as soon as OpenAIClient
+    produces them.
+
+    Yields:
+        (event, data) tuples:
+        - ("retrieval", {"sources": [...], "path": "keyword" | "hybrid" | "dense",
+          "context": packer stats (tokens_saved, ...) when packing is enabled})
+        - ("token", {"delta": "..."})
+        - ("done", {"answer": ..., "cached": ..., "ttft_ms": ..., "total_ms": ...})
+    """
+    start = time.perf_counter()
+
+    def elapsed_ms():
+        return (time.perf_counter() - start) * 1000
+
+    state = tenant_state(tenant_id)
+    tenant, answer_cache = state.tenant, state.answer_cache
+    chunks = keyword_chunks(query, tenant)
+    with stage_timer("answer_cache"):
+        cached, query_embedding = lookup_cached_answer(query, state, semantic=chunks is None)
+    if cached is not None:
+        ttft_ms = elapsed_ms()
+        ttft_window.observe(ttft_ms)
+        TTFT_SECONDS.observe(ttft_ms / 1000, cached="true")
+        yield "token", {"delta": cached}
+        total_ms = elapsed_ms()
+        stream_total_window.observe(total_ms)
+        yield "done", {
+            "answer": cached,
+            "cached": True,
+            "ttft_ms": round(ttft_ms, 1),
+            "total_ms": round(total_ms, 1),
+        }
+        return
+
+    path = "keyword"
+    if chunks is None:
+        path = "hybrid" if state.lexical_index is not None else "dense"
+        with stage_timer("rewriter"):
+            rewritten_query = rewrite_policy.rewrite(query, collection_name=tenant.collection_name)
+        with stage_timer("embedder"):
+            query_vector = query_embedder.embed(rewritten_query)
+        with stage_timer("retriever"):
+            chunks = hybrid_retriever.search(
+                collection_name=tenant.collection_name,
+                query_vector=query_vector,
+                k=RETRIEVER_K,
+                query_text=query,
+            )
+        if reranker is not None:
+            with stage_timer("reranker"):
+                chunks = reranker.rerank(query, chunks, RETRIEVAL_K)
+    chunks, packing = pack_context(chunks)
+    yield "retrieval", _retrieval_event(chunks, elapsed_ms(), path, packing)
+
+    with stage_timer("prompt"):
+        memory = prompt_template.format(user_prompt=query, chunks=chunks)
+
+    # The generator stage spans the yields to the client, so it is timed by hand
+    # instead of with stage_timer
+    generator_start = time.perf_counter()
+    parts = []
+    ttft_ms = None
+    for response in openai_client.stream_invoke(
+        input=query, memory=memory, system_prompt=tenant.system_prompt
+    ):
+        record_tokens(response, "generator")
+        delta = response.delta
+        # The final (completed) response carries the whole text and no delta:
+        # only use it if the model did not stream anything before
+        if not delta and not parts and response.text:
+            delta = response.text
+        if not delta:
+            continue
+
+        if ttft_ms is None:
+            ttft_ms = elapsed_ms()
+            ttft_window.observe(ttft_ms)
+            TTFT_SECONDS.observe(ttft_ms / 1000, cached="false")
+        parts.append(delta)
+        yield "token", {"delta": delta}
+
+    STAGE_LATENCY.observe(time.perf_counter() - generator_start, stage="generator")
+
+    answer = "".join(parts).strip()
+    if answer_cache is not None and answer:
+        answer_cache.put(query, answer, query_embedding)
+
+    total_ms = elapsed_ms()
+    stream_total_window.observe(total_ms)
+    yield "done", {
+        "answer": answer,
+        "cached": False,
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+        "total_ms": round(total_ms, 1),
+    }
+
+async def a_stream_answer(query: str, tenant_id: str | None = None):
+    """Async variant of stream_answer (same events)."""
+    start = time.perf_counter()
+
+    def elapsed_ms():
+        return (time.perf_counter() - start) * 1000
+
+    state = await a_tenant_state(tenant_id)
+    tenant, answer_cache = state.tenant, state.answer_cache
+    chunks = await a_keyword_chunks(query, tenant)
+    with stage_timer("answer_cache"):
+        cached, query_embedding = await a_lookup_cached_answer(
+            query, state, semantic=chunks is None
+        )
+    if cached is not None:
+        ttft_ms = elapsed_ms()
+        ttft_window.observe(ttft_ms)
+        TTFT_SECONDS.observe(ttft_ms / 1000, cached="true")
+        yield "token", {"delta": cached}
+        total_ms = elapsed_ms()
+        stream_total_window.observe(total_ms)
+        yield "done", {
+            "answer": cached,
+            "cached": True,
+            "ttft_ms": round(ttft_ms, 1),
+            "total_ms": round(total_ms, 1),
+        }
+        return
+
+    path = "keyword"
+    if chunks is None:
+        path = "hybrid" if state.lexical_index is not None else "dense"
+        with stage_timer("rewriter"):
+            rewritten_query = await rewrite_policy.a_rewrite(
+                query, collection_name=tenant.collection_name
+            )
+        with stage_timer("embedder"):
+            query_vector = await query_embedder.a_embed(rewritten_query)
+        with stage_timer("retriever"):
+            chunks = await hybrid_retriever.a_search(
+                collection_name=tenant.collection_name,
+                query_vector=query_vector,
+                k=RETRIEVER_K,
+                query_text=query,
+            )
+        if reranker is not None:
+            with stage_timer("reranker"):
+                chunks = await reranker.a_run(query=query, chunks=chunks, k=RETRIEVAL_K)
+    chunks, packing = await a_pack_context(chunks)
+    yield "retrieval", _retrieval_event(chunks, elapsed_ms(), path, packing)
+
+    with stage_timer("prompt"):
+        memory = prompt_template.format(user_prompt=query, chunks=chunks)
+
+    # The generator stage spans the yields to the client, so it is timed by hand
+    # instead of with stage_timer
+    generator_start = time.perf_counter()
+    parts = []
+    ttft_ms = None
+    async for response in openai_client.a_stream_invoke(
+        input=query, memory=memory, system_prompt=tenant.system_prompt
+    ):
+        record_tokens(response, "generator")
+        delta = response.delta
+        if not delta and not parts and response.text:
+            delta = response.text
+        if not delta:
+            continue
+
+        if ttft_ms is None:
+            ttft_ms = elapsed_ms()
+            ttft_window.observe(ttft_ms)
+            TTFT_SECONDS.observe(ttft_ms / 1000, cached="false")
+        parts.append(delta)
+        yield "token", {"delta": delta}
+
+    STAGE_LATENCY.observe(time.perf_counter() - generator_start, stage="generator")
+
+    answer = "".join(parts).strip()
+    if answer_cache is not None and answer:
+        answer_cache.put(query, answer, query_embedding)
+
+    total_ms = elapsed_ms()
+    stream_total_window.observe(total_ms)
+    yield "done", {
+        "answer": answer,
+        "cached": False,
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+        "total_ms": round(total_ms, 1),
+    }
+
 '''# Test veloce
 if __name__ == "__main__":
     # 1) simulate user question
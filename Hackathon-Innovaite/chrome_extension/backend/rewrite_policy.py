@@ -0,0 +1,295 @@
+# rewrite_policy.py
+# Decides whether the user's query goes through the LLM rewriter before retrieval.
+#
+# Modes:
+# - "always":      every query is rewritten (original behaviour)
+# - "never":       the raw query is embedded directly
+# - "adaptive":    skip the rewrite when a cheap heuristic, or the top score of a
+#                  first-pass retrieval on the raw query, says it is already good enough
+# - "speculative": rewrite in parallel with a retrieval on the raw query and keep
+#                  whichever query text retrieves with the better top score
+#
+# The first-pass retrieval costs one embedding and one top-1 vector search. When
+# the raw query is kept, FirstPassEmbedder (the "embedder" node after this stage)
+# reuses its embedding; the top-1 search is not reused (the retriever needs the
+# top-k fused with BM25) and is counted in stats()["first_pass_searches"].
+
+import asyncio
+import contextvars
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from datapizza.core.embedder import BaseEmbedder
+from datapizza.core.modules.rewriter import Rewriter
+from datapizza.memory import Memory
+
+from metrics import LatencyWindow
+
+REWRITE_MODES = ("always", "never", "adaptive", "speculative")
+
+# References to earlier context ("how do I apply for it?") need the rewriter
+_VAGUE_WORDS = re.compile(
+    r"\b(it|this|that|these|those|they|them|there|he|she)\b", re.IGNORECASE
+)
+# Course codes, form ids, years and acronyms are strong retrieval anchors
+_SPECIFIC_TOKENS = re.compile(r"\b([A-Z]{2,}[-_ ]?\d{2,}|\d{4,}|[A-Z]{3,})\b")
+
+
+def is_precise_query(query: str) -> bool:
+    """
+    Cheap heuristic: True when the raw query is likely to retrieve well as-is.
+
+    Very short or context-dependent queries are never considered precise;
+    otherwise the query must contain a specific anchor or be reasonably long.
+    """
+    words = query.split()
+    if len(words) < 3:
+        return False
+    if _VAGUE_WORDS.search(query):
+        return False
+    return bool(_SPECIFIC_TOKENS.search(query)) or len(words) >= 8
+
+
+class RewritePolicy(Rewriter):
+    """
+    Rewriter stage for the DAG that wraps the LLM rewriter with a rewriting policy.
+
+    Args:
+        rewriter: The LLM rewriter (ToolRewriter)
+        embedder: Embedder used for the first-pass retrieval
+        vectorstore: Vector store used for the first-pass retrieval
+        collection_name: Collection searched by the first-pass retrieval (a call
+            can pass another one, e.g. the collection of a tenant)
+        mode: One of REWRITE_MODES
+        score_threshold: Minimum top similarity for the raw query to skip the rewrite
+        vector_name: Name of the dense vector in the collection
+    """
+
+    def __init__(
+        self,
+        rewriter: Rewriter,
+        embedder,
+        vectorstore,
+        collection_name: str,
+        mode: str = "adaptive",
+        score_threshold: float = 0.55,
+        vector_name: str = "embedding",
+    ):
+        if mode not in REWRITE_MODES:
+            raise ValueError(f"Unknown rewrite mode {mode!r}, expected one of {REWRITE_MODES}")
+
+        self.rewriter = rewriter
+        self.embedder = embedder
+        self.vectorstore = vectorstore
+        self.collection_name = collection_name
+        self.mode = mode
+        self.score_threshold = score_threshold
+        self.vector_name = vector_name
+
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rewrite")
+        self._lock = threading.Lock()
+        self.decisions = {"rewritten": 0, "skipped_heuristic": 0, "skipped_score": 0, "raw_kept": 0}
+        self.first_pass_searches = 0
+        self.latency = LatencyWindow()
+        # Embeddings of the first-pass retrievals, by query text, until the
+        # embedder node takes them (bounded: a failed request never takes its own)
+        self._first_pass_vectors: OrderedDict[str, list] = OrderedDict()
+
+    # --- sync --------------------------------------------------------------
+
+    def rewrite(
+        self, user_prompt: str, memory: Memory | None = None, collection_name: str | None = None
+    ) -> str:
+        start = time.perf_counter()
+        try:
+            return self._rewrite(user_prompt, memory, collection_name or self.collection_name)
+        finally:
+            self.latency.observe((time.perf_counter() - start) * 1000)
+
+    def _rewrite(self, user_prompt: str, memory: Memory | None, collection_name: str) -> str:
+        if self.mode == "never":
+            return self._decide("raw_kept", user_prompt)
+
+        if self.mode == "always":
+            return self._decide("rewritten", self.rewriter.rewrite(user_prompt, memory))
+
+        if self.mode == "adaptive":
+            if is_precise_query(user_prompt):
+                return self._decide("skipped_heuristic", user_prompt)
+            vector = self.embedder.embed(user_prompt)
+            score = self._top_score(vector, collection_name)
+            if score >= self.score_threshold:
+                self._keep_vector(user_prompt, vector)
+                return self._decide("skipped_score", user_prompt)
+            return self._decide("rewritten", self.rewriter.rewrite(user_prompt, memory))
+
+        # speculative: the rewrite and the raw retrieval overlap. The context is
+        # copied so the rewrite's token usage stays attributed to this stage
+        rewrite_future = self._executor.submit(
+            contextvars.copy_context().run, self.rewriter.rewrite, user_prompt, memory
+        )
+        raw_vector = self.embedder.embed(user_prompt)
+        raw_score = self._top_score(raw_vector, collection_name)
+        rewritten = rewrite_future.result()
+        if rewritten == user_prompt:
+            self._keep_vector(user_prompt, raw_vector)
+            return self._decide("raw_kept", user_prompt)
+        rewritten_vector = self.embedder.embed(rewritten)
+        rewritten_score = self._top_score(rewritten_vector, collection_name)
+        if rewritten_score > raw_score:
+            self._keep_vector(rewritten, rewritten_vector)
+            return self._decide("rewritten", rewritten)
+        self._keep_vector(user_prompt, raw_vector)
+        return self._decide("raw_kept", user_prompt)
+
+    def _top_score(self, query_vector, collection_name: str) -> float:
+        self._count_search()
+        hits = self.vectorstore.get_client().query_points(**self._top1_query(query_vector, collection_name))
+        return hits.points[0].score if hits.points else 0.0
+
+    def _top1_query(self, query_vector, collection_name: str) -> dict:
+        query = {
+            "collection_name": collection_name,
+            "query": query_vector,
+            "using": self.vector_name,
+            "limit": 1,
+        }
+        # Same scores as the retriever node: a quantized collection is searched
+        # with the rescoring parameters of its vector store
+        search_params = getattr(self.vectorstore, "search_params", None)
+        if search_params is not None:
+            query["search_params"] = search_params
+        return query
+
+    # --- async -------------------------------------------------------------
+
+    async def a_rewrite(
+        self, user_prompt: str, memory: Memory | None = None, collection_name: str | None = None
+    ) -> str:
+        start = time.perf_counter()
+        try:
+            return await self._a_rewrite(
+                user_prompt, memory, collection_name or self.collection_name
+            )
+        finally:
+            self.latency.observe((time.perf_counter() - start) * 1000)
+
+    async def _a_rewrite(
+        self, user_prompt: str, memory: Memory | None, collection_name: str
+    ) -> str:
+        if self.mode == "never":
+            return self._decide("raw_kept", user_prompt)
+
+        if self.mode == "always":
+            rewritten = await self.rewriter.a_rewrite(user_prompt, memory)
+            return self._decide("rewritten", rewritten)
+
+        if self.mode == "adaptive":
+            if is_precise_query(user_prompt):
+                return self._decide("skipped_heuristic", user_prompt)
+            vector = await self.embedder.a_embed(user_prompt)
+            score = await self._a_top_score(vector, collection_name)
+            if score >= self.score_threshold:
+                self._keep_vector(user_prompt, vector)
+                return self._decide("skipped_score", user_prompt)
+            rewritten = await self.rewriter.a_rewrite(user_prompt, memory)
+            return self._decide("rewritten", rewritten)
+
+        async def raw_retrieval():
+            vector = await self.embedder.a_embed(user_prompt)
+            return vector, await self._a_top_score(vector, collection_name)
+
+        rewritten, (raw_vector, score) = await asyncio.gather(
+            self.rewriter.a_rewrite(user_prompt, memory), raw_retrieval()
+        )
+        if rewritten == user_prompt:
+            self._keep_vector(user_prompt, raw_vector)
+            return self._decide("raw_kept", user_prompt)
+        rewritten_vector = await self.embedder.a_embed(rewritten)
+        rewritten_score = await self._a_top_score(rewritten_vector, collection_name)
+        if rewritten_score > score:
+            self._keep_vector(rewritten, rewritten_vector)
+            return self._decide("rewritten", rewritten)
+        self._keep_vector(user_prompt, raw_vector)
+        return self._decide("raw_kept", user_prompt)
+
+    async def _a_top_score(self, query_vector, collection_name: str) -> float:
+        self._count_search()
+        hits = await self.vectorstore._get_a_client().query_points(
+            **self._top1_query(query_vector, collection_name)
+        )
+        return hits.points[0].score if hits.points else 0.0
+
+    # --- first-pass embeddings ---------------------------------------------
+
+    # Enough for the requests in flight; older vectors belong to failed requests
+    MAX_KEPT_VECTORS = 256
+
+    def _keep_vector(self, text: str, vector):
+        with self._lock:
+            self._first_pass_vectors[text] = vector
+            while len(self._first_pass_vectors) > self.MAX_KEPT_VECTORS:
+                self._first_pass_vectors.popitem(last=False)
+
+    def take_vector(self, text: str):
+        """Embedding of `text` computed by a first-pass retrieval, or None (taken once)."""
+        with self._lock:
+            return self._first_pass_vectors.pop(text, None)
+
+    # --- reporting ---------------------------------------------------------
+
+    def _count_search(self):
+        with self._lock:
+            self.first_pass_searches += 1
+
+    def _decide(self, decision: str, query: str) -> str:
+        with self._lock:
+            self.decisions[decision] += 1
+        return query
+
+    def stats(self) -> dict:
+        with self._lock:
+            decisions = dict(self.decisions)
+            first_pass_searches = self.first_pass_searches
+        return {
+            "mode": self.mode,
+            "decisions": decisions,
+            "first_pass_searches": first_pass_searches,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class FirstPassEmbedder(BaseEmbedder):
+    """
+    Embedder node after the RewritePolicy stage: the query text chosen by the
+    policy was usually embedded already by its first-pass retrieval, that
+    embedding is reused instead of a second embeddings request.
+
+    Args:
+        embedder: The wrapped embedder, for the texts the policy did not embed
+        policy: The RewritePolicy of the same DAG
+    """
+
+    def __init__(self, embedder: BaseEmbedder, policy: RewritePolicy):
+        self.embedder = embedder
+        self.policy = policy
+        self.model_name = embedder.model_name
+        self.client = None
+        self.a_client = None
+
+    def embed(self, text: str | list[str], model_name: str | None = None):
+        if isinstance(text, str) and model_name is None:
+            vector = self.policy.take_vector(text)
+            if vector is not None:
+                return vector
+        return self.embedder.embed(text, model_name)
+
+    async def a_embed(self, text: str | list[str], model_name: str | None = None):
+        if isinstance(text, str) and model_name is None:
+            vector = self.policy.take_vector(text)
+            if vector is not None:
+                return vector
+        return await self.embedder.a_embed(text, model_name)
@@ -0,0 +1,57 @@
+# singleflight.py
+# Request coalescing: concurrent calls with the same key share one execution.
+
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """
+    Async single-flight group.
+
+    The first caller for a key (the leader) starts the work as a separate task;
+    callers arriving while it is still running attach to the same task and all
+    receive its result (or its exception). The task is shielded, so a client
+    disconnecting does not cancel the work for the others.
+    """
+
+    def __init__(self):
+        self._inflight: dict[object, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        Run `fn()` (a coroutine function) once per key among concurrent callers.
+
+        Args:
+            key: Hashable key identifying identical work
+            fn: Zero-argument coroutine function doing the work
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+            with self._lock:
+                self.leaders += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "in_flight": len(self._inflight),
+                "executions": self.leaders,
+                "coalesced_requests": self.coalesced,
+                "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,253 @@
+# tenants.py
+# Universities (tenants) served by one backend.
+#
+# Every tenant has its own collection, BM25 index, generator prompt, helpdesk
+# address and answer cache; the clients, the DAG, the reranker and the context
+# packer are shared (see retrieval_pipeline.tenant_state).
+#
+# Tenants are read from TENANTS_PATH, re-read when the file changes (checked at
+# most once a second), so registering a university needs no restart:
+#
+#   {"tenants": [
+#       {"id": "bocconi", "collection_name": "bocconi_docs",
+#        "name": "Bocconi University", "helpdesk_email": "help@unibocconi.it",
+#        "system_prompt": "...", "answer_cache_entries": 500, "answer_cache_mb": 16}
+#   ]}
+#
+# Only `id` and `collection_name` are required. The tenant state (BM25 index,
+# collection version marker, ingestion manifest and checkpoint, parse cache, FAQ
+# index and curated FAQ) lives under TENANTS_DIR/<id>/; a tenant's collection is ingested with
+#   python ingestion_pipeline.py --tenant <id> --data-dir <its PDFs>
+#
+# Requests without a tenant ID use the "default" tenant: COLLECTION_NAME,
+# HELPDESK_EMAIL and the single-tenant paths of config.py.
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from config import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_MAX_MB,
+    COLLECTION_NAME,
+    COLLECTION_VERSION_FILE,
+    FAQ_CURATED_PATH,
+    FAQ_INDEX_PATH,
+    HELPDESK_EMAIL,
+    INGESTION_CHECKPOINT_PATH,
+    INGESTION_MANIFEST_PATH,
+    LEXICAL_INDEX_PATH,
+    PARSE_CACHE_DIR,
+    TENANTS_DIR,
+    TENANTS_PATH,
+)
+
+DEFAULT_TENANT = "default"
+
+# Used in file paths and cache keys
+_TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class UnknownTenantError(KeyError):
+    """No tenant is registered with this ID."""
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """
+    One university served by the backend.
+
+    Args:
+        id: Tenant ID sent by the frontend (lowercase letters, digits, "-", "_")
+        collection_name: Collection holding the tenant's documents
+        name: Display name
+        helpdesk_email: Recipient of the escalation emails
+        system_prompt: Generator system prompt (None: the shared default)
+        answer_cache_entries, answer_cache_mb: Size of the tenant's answer cache
+        lexical_index_path, collection_version_file, manifest_path, checkpoint_path:
+            Tenant state written by the ingestion script
+        parse_cache_dir: Parsed documents of the tenant (parse_cache.py), pruned
+            by the ingestion script to the tenant's current files
+        faq_index_path, faq_curated_path: Precomputed FAQ answers (faq_index.py)
+    """
+
+    id: str
+    collection_name: str
+    name: str = ""
+    helpdesk_email: str | None = None
+    system_prompt: str | None = None
+    answer_cache_entries: int = ANSWER_CACHE_MAX_ENTRIES
+    answer_cache_mb: float = ANSWER_CACHE_MAX_MB
+    lexical_index_path: Path | None = None
+    collection_version_file: Path | None = None
+    manifest_path: Path | None = None
+    checkpoint_path: Path | None = None
+    parse_cache_dir: Path | None = None
+    faq_index_path: Path | None = None
+    faq_curated_path: Path | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Tenant":
+        """Build a tenant from its TENANTS_PATH record, filling in the default paths."""
+        tenant_id = str(data.get("id", "")).strip().lower()
+        if not _TENANT_ID.match(tenant_id):
+            raise ValueError(f"Invalid tenant id {data.get('id')!r}")
+        if not data.get("collection_name"):
+            raise ValueError(f"Tenant {tenant_id!r} has no collection_name")
+
+        state_dir = TENANTS_DIR / tenant_id
+        paths = {
+            "lexical_index_path": state_dir / "lexical_index.json",
+            "collection_version_file": state_dir / "collection_version",
+            "manifest_path": state_dir / "ingestion_manifest.json",
+            "checkpoint_path": state_dir / "ingestion_checkpoint.jsonl",
+            "parse_cache_dir": state_dir / "parsed",
+            "faq_index_path": state_dir / "faq_index.json",
+            "faq_curated_path": state_dir / "faq_curated.json",
+        }
+        for key in paths:
+            if data.get(key):
+                paths[key] = Path(data[key])
+
+        return cls(
+            id=tenant_id,
+            collection_name=str(data["collection_name"]),
+            name=str(data.get("name") or ""),
+            helpdesk_email=data.get("helpdesk_email") or None,
+            system_prompt=data.get("system_prompt") or None,
+            answer_cache_entries=int(data.get("answer_cache_entries") or ANSWER_CACHE_MAX_ENTRIES),
+            answer_cache_mb=float(data.get("answer_cache_mb") or ANSWER_CACHE_MAX_MB),
+            **paths,
+        )
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        for key, value in data.items():
+            if isinstance(value, Path):
+                data[key] = str(value)
+        return data
+
+
+def default_tenant() -> Tenant:
+    """The single-tenant setup of config.py."""
+    return Tenant(
+        id=DEFAULT_TENANT,
+        collection_name=COLLECTION_NAME,
+        helpdesk_email=HELPDESK_EMAIL,
+        lexical_index_path=LEXICAL_INDEX_PATH,
+        collection_version_file=COLLECTION_VERSION_FILE,
+        manifest_path=INGESTION_MANIFEST_PATH,
+        checkpoint_path=INGESTION_CHECKPOINT_PATH,
+        parse_cache_dir=PARSE_CACHE_DIR,
+        faq_index_path=FAQ_INDEX_PATH,
+        faq_curated_path=FAQ_CURATED_PATH,
+    )
+
+
+class TenantRegistry:
+    """
+    Tenants of TENANTS_PATH, reloaded when the file changes.
+
+    The file is stat'ed at most once every `check_interval` seconds, so it can be
+    called on every request. A file that fails to parse is logged by the caller
+    (the exception propagates) and the previous tenants stay in use.
+
+    Args:
+        path: JSON file of the tenants
+        default: Tenant used for requests without a tenant ID; a record with the
+            same ID in the file replaces it
+    """
+
+    def __init__(self, path: Path, default: Tenant | None = None, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.default = default or default_tenant()
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._tenants: dict[str, Tenant] = {self.default.id: self.default}
+        self._mtime_ns = None
+        self._last_check = 0.0
+
+    # --- lookups -----------------------------------------------------------
+
+    def get(self, tenant_id: str | None = None) -> Tenant:
+        """
+        Resolve a tenant ID (None or "" for the default tenant).
+
+        Raises:
+            UnknownTenantError: No tenant is registered with this ID
+        """
+        self.reload_if_changed()
+        key = (tenant_id or DEFAULT_TENANT).strip().lower()
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            raise UnknownTenantError(tenant_id)
+        return tenant
+
+    def tenants(self) -> list[Tenant]:
+        self.reload_if_changed()
+        return list(self._tenants.values())
+
+    # --- persistence -------------------------------------------------------
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                mtime_ns = self.path.stat().st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+            if mtime_ns == self._mtime_ns:
+                return
+            tenants = self._read() if mtime_ns is not None else []
+            self._tenants = {self.default.id: self.default}
+            self._tenants.update((tenant.id, tenant) for tenant in tenants)
+            self._mtime_ns = mtime_ns
+
+    def register(self, tenant: Tenant):
+        """Add or replace a tenant and persist the file (the other workers reload it)."""
+        with self._lock:
+            records = [t for t in self._read_records() if str(t.get("id", "")).lower() != tenant.id]
+            records.append(tenant.to_dict())
+            self._write(records)
+
+    def remove(self, tenant_id: str) -> bool:
+        """Remove a tenant from the file (removing "default" restores the one of config.py)."""
+        with self._lock:
+            records = self._read_records()
+            kept = [t for t in records if str(t.get("id", "")).lower() != tenant_id]
+            if len(kept) == len(records):
+                return False
+            self._write(kept)
+            return True
+
+    # --- internals ---------------------------------------------------------
+
+    def _read_records(self) -> list[dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return []
+        return list(data.get("tenants", []))
+
+    def _read(self) -> list[Tenant]:
+        return [Tenant.from_dict(record) for record in self._read_records()]
+
+    def _write(self, records: list[dict]):
+        # Readers never see a half-written file
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"tenants": records}, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+        # Picked up on the next lookup
+        self._last_check = 0.0
+
+
+# Shared by the API and the ingestion script
+tenant_registry = TenantRegistry(TENANTS_PATH)
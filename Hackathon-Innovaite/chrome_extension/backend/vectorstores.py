@@ -0,0 +1,803 @@
+# vectorstores.py
+# Vector store backends for the API, selected with VECTORSTORE_BACKEND:
+#
+# - "qdrant": QdrantVectorstore on the configured Qdrant instance
+# - "memory": InMemoryVectorstore, brute-force cosine search with numpy over
+#   chunks loaded from a JSONL snapshot. Used to run the API offline (load tests);
+#   it also answers `get_client().query_points(...)` like a Qdrant client, so the
+#   rewrite policy works unchanged on top of it.
+# - "local": LocalVectorstore, an IVF index (vector_index.py) memory-mapped from
+#   disk. Same interface as "memory", plus the Qdrant client calls the ingestion
+#   script makes, so the whole corpus can live in-process without a Qdrant server.
+#
+# With VECTOR_QUANTIZATION set, the Qdrant collection and the local index both
+# search compact (int8 / binary) vectors and rescore the best candidates with the
+# full-precision ones.
+#
+# Every backend also has search_batch / a_search_batch: many query vectors in one
+# call (one matrix product in process, one query_batch_points request on Qdrant).
+#
+# The in-process backends search with numpy over (memory-mapped) arrays and may
+# reload the index published by the ingestion script: their async methods run
+# the search in a worker thread, never on the event loop.
+
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from datapizza.core.vectorstore import Vectorstore
+from datapizza.type import Chunk, DenseEmbedding
+from datapizza.vectorstores.qdrant import QdrantVectorstore
+from qdrant_client.http import models
+
+from config import (
+    QDRANT_HOST,
+    QDRANT_PORT,
+    QDRANT_API_KEY,
+    VECTORSTORE_BACKEND,
+    VECTORSTORE_MEMORY_PATH,
+    VECTORSTORE_LOCAL_PATH,
+    VECTORSTORE_IVF_LISTS,
+    VECTORSTORE_IVF_NPROBE,
+    VECTOR_QUANTIZATION,
+    VECTOR_RESCORE_OVERSAMPLING,
+)
+from http_pool import qdrant_client_options
+from vector_index import QUANTIZATIONS, IVFIndex, normalize
+
+VECTORSTORE_BACKENDS = ("qdrant", "memory", "local")
+
+
+class _Collection:
+    def __init__(self):
+        self.chunks: list[Chunk] = []
+        self.vectors: list[np.ndarray] = []
+        self._matrix: np.ndarray | None = None
+
+    def matrix(self) -> np.ndarray:
+        # Rows are L2-normalized, so a dot product is the cosine similarity
+        if self._matrix is None or len(self._matrix) != len(self.vectors):
+            if self.vectors:
+                matrix = np.vstack(self.vectors).astype(np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                self._matrix = matrix / np.maximum(norms, 1e-12)
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._matrix
+
+
+class InMemoryVectorstore(Vectorstore):
+    """
+    In-process vector store (cosine similarity, exact search).
+
+    Args:
+        snapshot_path: Optional JSONL file to load; one chunk per line with
+            `collection`, `id`, `text`, `metadata` and `embedding`
+        vector_name: Name of the dense embedding read from the chunks
+    """
+
+    def __init__(self, snapshot_path: Path | None = None, vector_name: str = "embedding"):
+        self.vector_name = vector_name
+        self._collections: dict[str, _Collection] = {}
+        self._lock = threading.Lock()
+        if snapshot_path is not None and Path(snapshot_path).exists():
+            self.load(snapshot_path)
+
+    # --- snapshot ----------------------------------------------------------
+
+    def load(self, path: Path):
+        by_collection: dict[str, list[Chunk]] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                chunk = Chunk(
+                    id=str(row["id"]),
+                    text=row["text"],
+                    metadata=row.get("metadata", {}),
+                    embeddings=[DenseEmbedding(name=self.vector_name, vector=row["embedding"])],
+                )
+                by_collection.setdefault(row["collection"], []).append(chunk)
+        for collection_name, chunks in by_collection.items():
+            self.add(chunks, collection_name)
+
+    def save(self, path: Path):
+        with self._lock, open(path, "w", encoding="utf-8") as f:
+            for collection_name, collection in self._collections.items():
+                for chunk, vector in zip(collection.chunks, collection.vectors):
+                    f.write(json.dumps({
+                        "collection": collection_name,
+                        "id": chunk.id,
+                        "text": chunk.text,
+                        "metadata": chunk.metadata,
+                        "embedding": vector.tolist(),
+                    }) + "\n")
+
+    # --- Vectorstore interface ---------------------------------------------
+
+    def add(self, chunk: Chunk | list[Chunk], collection_name: str | None = None):
+        chunks = [chunk] if isinstance(chunk, Chunk) else list(chunk)
+        with self._lock:
+            collection = self._collections.setdefault(collection_name, _Collection())
+            for c in chunks:
+                collection.chunks.append(c)
+                collection.vectors.append(np.asarray(self._dense_vector(c), dtype=np.float32))
+
+    async def a_add(self, chunk: Chunk | list[Chunk], collection_name: str | None = None):
+        self.add(chunk, collection_name)
+
+    def update(self, collection_name: str, payload: dict, points: list, **kwargs):
+        ids = {str(p) for p in points}
+        with self._lock:
+            for chunk in self._collection(collection_name).chunks:
+                if chunk.id in ids:
+                    chunk.metadata.update(payload)
+
+    def remove(self, collection_name: str, ids: list[str], **kwargs):
+        ids = {str(i) for i in ids}
+        with self._lock:
+            collection = self._collection(collection_name)
+            keep = [i for i, c in enumerate(collection.chunks) if c.id not in ids]
+            collection.chunks = [collection.chunks[i] for i in keep]
+            collection.vectors = [collection.vectors[i] for i in keep]
+            collection._matrix = None
+
+    def retrieve(self, collection_name: str, ids: list[str], **kwargs) -> list[Chunk]:
+        ids = {str(i) for i in ids}
+        return [c for c in self._collection(collection_name).chunks if c.id in ids]
+
+    def search(
+        self,
+        collection_name: str,
+        query_vector: list[float],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[Chunk]:
+        return [chunk for chunk, _ in self._top_k(collection_name, query_vector, k)]
+
+    async def a_search(
+        self,
+        collection_name: str,
+        query_vector: list[float],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[Chunk]:
+        return await asyncio.to_thread(
+            self.search, collection_name, query_vector, k, vector_name, **kwargs
+        )
+
+    def search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[list[Chunk]]:
+        """search() for many query vectors, with one matrix product."""
+        collection = self._collection(collection_name)
+        with self._lock:
+            matrix = collection.matrix()
+            chunks = list(collection.chunks)
+        if not chunks:
+            return [[] for _ in query_vectors]
+
+        scores = matrix @ normalize(np.asarray(query_vectors)).T
+        k = min(k, len(chunks))
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            results.append([chunks[i] for i in top[np.argsort(-column[top])]])
+        return results
+
+    async def a_search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[list[Chunk]]:
+        return await asyncio.to_thread(
+            self.search_batch, collection_name, query_vectors, k, vector_name, **kwargs
+        )
+
+    def count(self, collection_name: str) -> int:
+        return len(self._collection(collection_name).chunks)
+
+    # --- Qdrant-compatible subset (used by the rewrite policy) ---------------
+
+    def get_client(self):
+        return self
+
+    def _get_a_client(self):
+        return _AsyncClient(self)
+
+    def query_points(self, collection_name: str, query, using: str | None = None, limit: int = 10, **kwargs):
+        points = [
+            models.ScoredPoint(id=chunk.id, version=0, score=score, payload=chunk.metadata)
+            for chunk, score in self._top_k(collection_name, query, limit)
+        ]
+        return models.QueryResponse(points=points)
+
+    # --- internals ---------------------------------------------------------
+
+    def _collection(self, collection_name: str) -> _Collection:
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection {collection_name!r} not found")
+        return collection
+
+    def _top_k(self, collection_name: str, query_vector, k: int) -> list[tuple[Chunk, float]]:
+        collection = self._collection(collection_name)
+        with self._lock:
+            matrix = collection.matrix()
+            chunks = list(collection.chunks)
+        if not chunks:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(chunks[i], float(scores[i])) for i in top]
+
+    def _dense_vector(self, chunk: Chunk) -> list[float]:
+        dense = [e for e in chunk.embeddings if isinstance(e, DenseEmbedding)]
+        if not dense:
+            raise ValueError(f"Chunk {chunk.id} has no dense embedding")
+        for embedding in dense:
+            if embedding.name == self.vector_name:
+                return embedding.vector
+        return dense[0].vector
+
+
+class _AsyncClient:
+    """Awaitable facade of a `query_points` implementation (AsyncQdrantClient subset)."""
+
+    def __init__(self, store):
+        self._store = store
+
+    async def query_points(self, **kwargs):
+        return await asyncio.to_thread(self._store.query_points, **kwargs)
+
+
+# --- embedded IVF index -------------------------------------------------------
+
+CHUNKS_FILE = "chunks.jsonl"
+CURRENT_FILE = "CURRENT"
+
+
+class _LocalCollection:
+    """The index of one collection on disk, plus the writes made since it was built."""
+
+    def __init__(self):
+        self.version: str | None = None
+        self.index: IVFIndex | None = None
+        self.rows: list[Chunk] = []             # chunk of every index row (without vectors)
+        self.row_of: dict[str, int] = {}
+        self.deleted = np.zeros(0, dtype=bool)
+        self.n_deleted = 0
+        self.pending: dict[str, tuple[Chunk, np.ndarray]] = {}
+        self._pending_matrix: np.ndarray | None = None
+        self.dirty = False
+
+    def discard(self, chunk_id: str):
+        if self.pending.pop(chunk_id, None) is not None:
+            self._pending_matrix = None
+        row = self.row_of.pop(chunk_id, None)
+        if row is not None:
+            self.deleted[row] = True
+            self.n_deleted += 1
+
+    def chunks(self) -> list[Chunk]:
+        return [self.rows[i] for i in self.row_of.values()] + [c for c, _ in self.pending.values()]
+
+    def pending_snapshot(self) -> tuple[list[Chunk], np.ndarray | None]:
+        if not self.pending:
+            return [], None
+        if self._pending_matrix is None:
+            self._pending_matrix = np.vstack([v for _, v in self.pending.values()])
+        return [c for c, _ in self.pending.values()], self._pending_matrix
+
+
+class LocalVectorstore(Vectorstore):
+    """
+    Embedded vector store: one IVF index per collection, memory-mapped from disk.
+
+    Writes (add, remove, update) are kept in memory and searched exhaustively
+    next to the index; flush() rebuilds the index of the modified collections
+    and publishes it as a new version. A reader checks for a new version at
+    most once every `check_interval` seconds per collection, so the API sees a
+    re-ingested corpus without a restart and searches read no file.
+
+    Layout: <path>/<collection>/CURRENT names the live version directory, which
+    holds the index .npy files and chunks.jsonl (id, text, metadata per row).
+
+    Args:
+        path: Root directory of the indexes
+        vector_name: Name of the dense embedding read from the chunks
+        n_lists: IVF lists of a rebuilt index (0 = about sqrt(number of chunks))
+        nprobe: Lists scanned per query
+        quantization: Codes of a rebuilt index: "none", "int8" or "binary"
+        oversampling: Candidates rescored per result on a quantized index
+        check_interval: Minimum seconds between two reads of the CURRENT file
+            of a loaded collection
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        vector_name: str = "embedding",
+        n_lists: int = 0,
+        nprobe: int = 8,
+        quantization: str = "none",
+        oversampling: float = 4.0,
+        check_interval: float = 1.0,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.path = Path(path)
+        self.vector_name = vector_name
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.oversampling = oversampling
+        self.check_interval = check_interval
+        self._collections: dict[str, _LocalCollection] = {}
+        # Last read of the CURRENT file of each collection (time.monotonic)
+        self._checked_at: dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    # --- collections -------------------------------------------------------
+
+    def create_collection(self, collection_name: str, vector_config=None, **kwargs):
+        self._get(collection_name, create=True)
+
+    def flush(self):
+        """
+        Rebuild and write the index of every collection modified since the last
+        flush, or quantized differently from `quantization`.
+        """
+        with self._lock:
+            for collection_name, collection in list(self._collections.items()):
+                requantize = collection.index is not None and collection.index.quantization != self.quantization
+                if collection.dirty or requantize:
+                    self._write(collection_name, collection)
+
+    def dimensions(self, collection_name: str) -> int | None:
+        """Size of the stored vectors (None for an empty collection)."""
+        with self._lock:
+            collection = self._get(collection_name)
+            _, pending_matrix = collection.pending_snapshot()
+            if pending_matrix is not None:
+                return pending_matrix.shape[1]
+            if collection.index is not None and len(collection.index):
+                return collection.index.vectors.shape[1]
+            return None
+
+    # --- Vectorstore interface ---------------------------------------------
+
+    def add(self, chunk: Chunk | list[Chunk], collection_name: str | None = None):
+        chunks = [chunk] if isinstance(chunk, Chunk) else list(chunk)
+        with self._lock:
+            collection = self._get(collection_name, create=True)
+            for c in chunks:
+                collection.discard(c.id)
+                row = Chunk(id=str(c.id), text=c.text, metadata=dict(c.metadata))
+                collection.pending[row.id] = (row, normalize(self._dense_vector(c)))
+            collection._pending_matrix = None
+            collection.dirty = True
+
+    async def a_add(self, chunk: Chunk | list[Chunk], collection_name: str | None = None):
+        self.add(chunk, collection_name)
+
+    def update(self, collection_name: str, payload: dict, points: list, **kwargs):
+        ids = {str(p) for p in points}
+        with self._lock:
+            collection = self._get(collection_name)
+            for chunk in collection.chunks():
+                if chunk.id in ids:
+                    chunk.metadata.update(payload)
+            collection.dirty = True
+
+    def remove(self, collection_name: str, ids: list[str], **kwargs):
+        with self._lock:
+            collection = self._get(collection_name)
+            for chunk_id in ids:
+                collection.discard(str(chunk_id))
+            collection.dirty = True
+
+    def retrieve(self, collection_name: str, ids: list[str], **kwargs) -> list[Chunk]:
+        ids = {str(i) for i in ids}
+        with self._lock:
+            return [c for c in self._get(collection_name).chunks() if c.id in ids]
+
+    def search(
+        self,
+        collection_name: str,
+        query_vector: list[float],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[Chunk]:
+        return [chunk for chunk, _ in self._top_k(collection_name, query_vector, k)]
+
+    async def a_search(
+        self,
+        collection_name: str,
+        query_vector: list[float],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[Chunk]:
+        return await asyncio.to_thread(
+            self.search, collection_name, query_vector, k, vector_name, **kwargs
+        )
+
+    def search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[list[Chunk]]:
+        """search() for many query vectors: every probed list is scanned once."""
+        return [
+            [chunk for chunk, _ in results]
+            for results in self._top_k_batch(collection_name, query_vectors, k)
+        ]
+
+    async def a_search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        vector_name: str | None = None,
+        **kwargs,
+    ) -> list[list[Chunk]]:
+        return await asyncio.to_thread(
+            self.search_batch, collection_name, query_vectors, k, vector_name, **kwargs
+        )
+
+    def count(self, collection_name: str) -> int:
+        with self._lock:
+            collection = self._get(collection_name)
+            return len(collection.row_of) + len(collection.pending)
+
+    def get_client(self):
+        return _LocalClient(self)
+
+    def _get_a_client(self):
+        return _AsyncClient(self.get_client())
+
+    # --- internals ---------------------------------------------------------
+
+    def _current_version(self, collection_name: str) -> str | None:
+        try:
+            return (self.path / collection_name / CURRENT_FILE).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _get(self, collection_name: str, create: bool = False) -> _LocalCollection:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is not None and collection.dirty:
+                return collection
+            now = time.monotonic()
+            if collection is not None and now - self._checked_at.get(collection_name, 0.0) < self.check_interval:
+                return collection
+            self._checked_at[collection_name] = now
+            version = self._current_version(collection_name)
+            if collection is not None and collection.version == version:
+                return collection
+            if version is not None:
+                collection = self._load(collection_name, version)
+            elif collection is None:
+                if not create:
+                    raise ValueError(f"Collection {collection_name!r} not found")
+                collection = _LocalCollection()
+            self._collections[collection_name] = collection
+            return collection
+
+    def _load(self, collection_name: str, version: str) -> _LocalCollection:
+        directory = self.path / collection_name / version
+        collection = _LocalCollection()
+        collection.version = version
+        collection.index = IVFIndex.load(directory)
+        with open(directory / CHUNKS_FILE, encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                collection.rows.append(Chunk(id=row["id"], text=row["text"], metadata=row["metadata"]))
+        collection.row_of = {chunk.id: i for i, chunk in enumerate(collection.rows)}
+        collection.deleted = np.zeros(len(collection.rows), dtype=bool)
+        return collection
+
+    def _write(self, collection_name: str, collection: _LocalCollection):
+        live = np.array(sorted(collection.row_of.values()), dtype=np.int64)
+        chunks = [collection.rows[i] for i in live]
+        parts = []
+        if collection.index is not None and len(live):
+            parts.append(np.asarray(collection.index.vectors[live]))
+        pending_chunks, pending_matrix = collection.pending_snapshot()
+        if pending_chunks:
+            chunks += pending_chunks
+            parts.append(pending_matrix)
+        vectors = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+        index, order = IVFIndex.build(vectors, self.n_lists or None, quantization=self.quantization)
+        version = f"v{time.time_ns()}"
+        directory = self.path / collection_name / version
+        index.save(directory)
+        with open(directory / CHUNKS_FILE, "w", encoding="utf-8") as f:
+            for i in order:
+                chunk = chunks[i]
+                f.write(json.dumps({"id": chunk.id, "text": chunk.text, "metadata": chunk.metadata}) + "\n")
+
+        # Publish atomically, then drop all but the previous version (a reader
+        # may have just read the old CURRENT)
+        current = self.path / collection_name / CURRENT_FILE
+        tmp = current.with_suffix(".tmp")
+        tmp.write_text(version)
+        os.replace(tmp, current)
+        for old in (self.path / collection_name).glob("v*"):
+            if old.name not in (version, collection.version):
+                shutil.rmtree(old, ignore_errors=True)
+
+        self._collections[collection_name] = self._load(collection_name, version)
+
+    def _top_k(self, collection_name: str, query_vector, k: int) -> list[tuple[Chunk, float]]:
+        return self._top_k_batch(collection_name, [query_vector], k)[0]
+
+    def _top_k_batch(
+        self, collection_name: str, query_vectors, k: int
+    ) -> list[list[tuple[Chunk, float]]]:
+        with self._lock:
+            collection = self._get(collection_name)
+            index, rows = collection.index, collection.rows
+            exclude = collection.deleted if collection.n_deleted else None
+            pending_chunks, pending_matrix = collection.pending_snapshot()
+
+        queries = normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        results = [[] for _ in queries]
+        if index is not None:
+            found_batch = index.search_batch(
+                queries, k, self.nprobe, exclude=exclude, oversampling=self.oversampling
+            )
+            for q, (found, scores) in enumerate(found_batch):
+                results[q] += [(rows[i], float(score)) for i, score in zip(found, scores)]
+        if pending_chunks:
+            scores = pending_matrix @ queries.T
+            for q in range(len(queries)):
+                top = np.argsort(-scores[:, q])[:k]
+                results[q] += [(pending_chunks[i], float(scores[i, q])) for i in top]
+        for q_results in results:
+            q_results.sort(key=lambda item: -item[1])
+        return [q_results[:k] for q_results in results]
+
+    def _dense_vector(self, chunk: Chunk) -> list[float]:
+        dense = [e for e in chunk.embeddings if isinstance(e, DenseEmbedding)]
+        if not dense:
+            raise ValueError(f"Chunk {chunk.id} has no dense embedding")
+        for embedding in dense:
+            if embedding.name == self.vector_name:
+                return embedding.vector
+        return dense[0].vector
+
+
+def _matches(payload: dict, points_filter: models.Filter | None) -> bool:
+    """Evaluate a Qdrant filter made of `must` MatchValue conditions (all the repo uses)."""
+    if points_filter is None:
+        return True
+    if points_filter.should or points_filter.must_not or points_filter.min_should:
+        raise ValueError("LocalVectorstore only supports `must` filters")
+    conditions = points_filter.must or []
+    if not isinstance(conditions, list):
+        conditions = [conditions]
+    for condition in conditions:
+        if not (isinstance(condition, models.FieldCondition) and isinstance(condition.match, models.MatchValue)):
+            raise ValueError("LocalVectorstore only supports MatchValue conditions")
+        if payload.get(condition.key) != condition.match.value:
+            return False
+    return True
+
+
+class _LocalClient:
+    """Subset of QdrantClient used by the rewrite policy and the ingestion script."""
+
+    def __init__(self, store: LocalVectorstore):
+        self._store = store
+
+    def query_points(self, collection_name: str, query, using: str | None = None, limit: int = 10, **kwargs):
+        points = [
+            models.ScoredPoint(id=chunk.id, version=0, score=score, payload=chunk.metadata)
+            for chunk, score in self._store._top_k(collection_name, query, limit)
+        ]
+        return models.QueryResponse(points=points)
+
+    def upsert(self, collection_name: str, points: list[models.PointStruct], wait: bool = True, **kwargs):
+        chunks = []
+        for point in points:
+            payload = dict(point.payload or {})
+            vector = point.vector
+            if isinstance(vector, dict):
+                vector = vector.get(self._store.vector_name, next(iter(vector.values())))
+            chunks.append(Chunk(
+                id=str(point.id),
+                text=payload.pop("text", ""),
+                metadata=payload,
+                embeddings=[DenseEmbedding(name=self._store.vector_name, vector=vector)],
+            ))
+        self._store.add(chunks, collection_name)
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs):
+        if isinstance(points_selector, models.PointIdsList):
+            ids = [str(i) for i in points_selector.points]
+        elif isinstance(points_selector, models.FilterSelector):
+            ids = [c.id for c in self._chunks(collection_name, points_selector.filter)]
+        else:
+            raise ValueError(f"Unsupported points selector {type(points_selector).__name__}")
+        self._store.remove(collection_name, ids)
+
+    def count(self, collection_name: str, count_filter: models.Filter | None = None, exact: bool = True, **kwargs):
+        return models.CountResult(count=len(self._chunks(collection_name, count_filter)))
+
+    def create_payload_index(self, *args, **kwargs):
+        # Filters are evaluated by scanning the payloads: nothing to index
+        pass
+
+    def _chunks(self, collection_name: str, points_filter: models.Filter | None) -> list[Chunk]:
+        with self._store._lock:
+            chunks = self._store._get(collection_name).chunks()
+        return [c for c in chunks if _matches(c.metadata, points_filter)]
+
+
+# --- Qdrant quantization -------------------------------------------------------
+
+def qdrant_quantization_config(quantization: str = VECTOR_QUANTIZATION):
+    if quantization == "none":
+        return None
+    if quantization == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+
+
+def apply_qdrant_quantization(store: QdrantVectorstore, collection_name: str, vector_name: str):
+    """
+    Quantize a Qdrant collection as configured by VECTOR_QUANTIZATION.
+
+    The compact vectors stay in RAM and the originals move to disk, where they
+    are only read to rescore. Idempotent: safe on every ingestion run.
+    """
+    quantization_config = qdrant_quantization_config()
+    if quantization_config is None:
+        return
+    store.get_client().update_collection(
+        collection_name=collection_name,
+        vectors_config={vector_name: models.VectorParamsDiff(on_disk=True)},
+        quantization_config=quantization_config,
+    )
+
+
+class BatchQdrantVectorstore(QdrantVectorstore):
+    """QdrantVectorstore whose search_batch sends all the query vectors in one request."""
+
+    # Search parameters of every request (see RescoringQdrantVectorstore)
+    search_params = None
+
+    def _batch_requests(self, query_vectors, k: int, vector_name: str) -> list[models.QueryRequest]:
+        return [
+            models.QueryRequest(
+                query=[float(v) for v in vector],
+                using=vector_name,
+                limit=k,
+                with_payload=True,
+                params=self.search_params,
+            )
+            for vector in query_vectors
+        ]
+
+    def search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        vector_name: str = "embedding",
+        **kwargs,
+    ) -> list[list[Chunk]]:
+        responses = self.get_client().query_batch_points(
+            collection_name=collection_name,
+            requests=self._batch_requests(query_vectors, k, vector_name),
+            **kwargs,
+        )
+        return [self._point_to_chunk(response.points) for response in responses]
+
+    async def a_search_batch(
+        self,
+        collection_name: str,
+        query_vectors: list[list[float]],
+        k: int = 10,
+        vector_name: str = "embedding",
+        **kwargs,
+    ) -> list[list[Chunk]]:
+        responses = await self._get_a_client().query_batch_points(
+            collection_name=collection_name,
+            requests=self._batch_requests(query_vectors, k, vector_name),
+            **kwargs,
+        )
+        return [self._point_to_chunk(response.points) for response in responses]
+
+
+class RescoringQdrantVectorstore(BatchQdrantVectorstore):
+    """
+    QdrantVectorstore for quantized collections: every search fetches
+    k * oversampling candidates on the compact vectors and rescores them with
+    the originals.
+    """
+
+    def __init__(self, *args, oversampling: float = 4.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.search_params = models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
+        )
+
+    def search(self, collection_name: str, query_vector, k: int = 10, vector_name: str | None = None, **kwargs):
+        kwargs.setdefault("search_params", self.search_params)
+        return super().search(collection_name, query_vector, k, vector_name, **kwargs)
+
+    async def a_search(self, collection_name: str, query_vector, k: int = 10, vector_name: str | None = None, **kwargs):
+        kwargs.setdefault("search_params", self.search_params)
+        return await super().a_search(collection_name, query_vector, k, vector_name, **kwargs)
+
+
+def build_vectorstore() -> Vectorstore:
+    """Create the vector store selected by VECTORSTORE_BACKEND."""
+    if VECTORSTORE_BACKEND == "memory":
+        return InMemoryVectorstore(VECTORSTORE_MEMORY_PATH)
+    if VECTORSTORE_BACKEND == "local":
+        return LocalVectorstore(
+            VECTORSTORE_LOCAL_PATH,
+            n_lists=VECTORSTORE_IVF_LISTS,
+            nprobe=VECTORSTORE_IVF_NPROBE,
+            quantization=VECTOR_QUANTIZATION,
+            oversampling=VECTOR_RESCORE_OVERSAMPLING,
+        )
+    if VECTORSTORE_BACKEND == "qdrant":
+        if VECTOR_QUANTIZATION != "none":
+            return RescoringQdrantVectorstore(
+                host=QDRANT_HOST,
+                port=QDRANT_PORT,
+                api_key=QDRANT_API_KEY,
+                https=True,
+                oversampling=VECTOR_RESCORE_OVERSAMPLING,
+                **qdrant_client_options(),
+            )
+        # Use the same qdrant of ingestion (prefer host and port instead of location when possible)
+        return BatchQdrantVectorstore(
+            host=QDRANT_HOST,
+            port=QDRANT_PORT,
+            api_key=QDRANT_API_KEY,
+            https=True,   # importante perché l’endpoint è https
+            # Keep-alive connection pool, or the gRPC transport (http_pool.py)
+            **qdrant_client_options(),
+        )
+    raise ValueError(
+        f"Unknown VECTORSTORE_BACKEND {VECTORSTORE_BACKEND!r}, expected one of {VECTORSTORE_BACKENDS}"
+    )
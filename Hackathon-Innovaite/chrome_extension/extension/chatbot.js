@@ -6,6 +6,10 @@ const sendBtn = document.getElementById("sendBtn");
 const userInput = document.getElementById("userInput");
 const chatMessages = document.getElementById("chatMessages");
 
+// Use the streaming endpoint (/api/chat/stream, Server-Sent Events) so the answer
+// appears token by token. Set to false to use the classic /api/chat request.
+const USE_STREAMING = true;
+
 // When the opener is clicked (large button), show the chat window and hide the opener
 openBtn.addEventListener("click", () => {
     chatWindow.classList.remove("hidden");
@@ -35,6 +39,11 @@ sendBtn.addEventListener("click", () => {
     addMessage("You", question);
     userInput.value = "";
 
+    if (USE_STREAMING) {
+        askStreaming(question);
+        return;
+    }
+
     // Mostra "sto pensando..."
     addMessage("Assistant", "🤔 Searching for an answer...");
 
@@ -73,6 +82,105 @@ sendBtn.addEventListener("click", () => {
         });
 });
 
+async function askStreaming(question) {
+    // Mostra "sto pensando..."
+    addMessage("Assistant", "🤔 Searching for an answer...");
+
+    let answer = "";
+    let answerDiv = null;
+
+    try {
+        const response = await fetch("http://127.0.0.1:8000/api/chat/stream", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ query: question })
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error(`Server error: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE events are separated by a blank line
+            let sep;
+            while ((sep = buffer.indexOf("\n\n")) !== -1) {
+                const evt = parseSseEvent(buffer.slice(0, sep));
+                buffer = buffer.slice(sep + 2);
+
+                if (evt.event === "retrieval") {
+                    const lastMsg = chatMessages.lastChild;
+                    if (!answerDiv && lastMsg && lastMsg.textContent.includes("🤔")) {
+                        updateMessage(lastMsg, "Assistant", "🤔 Found the relevant documents, writing the answer...");
+                    }
+                } else if (evt.event === "token") {
+                    if (!answerDiv) {
+                        removeThinkingMessage();
+                        answerDiv = addMessage("Assistant", "");
+                    }
+                    answer += evt.data.delta;
+                    updateMessage(answerDiv, "Assistant", answer);
+                } else if (evt.event === "done") {
+                    answer = evt.data.answer || answer;
+                } else if (evt.event === "error") {
+                    throw new Error(evt.data.detail);
+                }
+            }
+        }
+
+        if (!answerDiv) {
+            removeThinkingMessage();
+            answerDiv = addMessage("Assistant", answer);
+        } else {
+            updateMessage(answerDiv, "Assistant", answer);
+        }
+
+        // After each agent answer, ask user if they want to escalate to helpdesk
+        showEscalationPrompt(answer, question);
+    } catch (err) {
+        removeThinkingMessage();
+        addMessage("Assistant", `❌ Error: ${err.message}`);
+    }
+}
+
+function parseSseEvent(raw) {
+    let event = "message";
+    const dataLines = [];
+    for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith("data:")) {
+            dataLines.push(line.slice(5).trim());
+        }
+    }
+    let data = {};
+    try {
+        data = JSON.parse(dataLines.join("\n") || "{}");
+    } catch (e) {
+        // Ignore malformed events
+    }
+    return { event, data };
+}
+
+function removeThinkingMessage() {
+    const lastMsg = chatMessages.lastChild;
+    if (lastMsg && lastMsg.textContent.includes("🤔")) {
+        lastMsg.remove();
+    }
+}
+
+function updateMessage(msgDiv, sender, message) {
+    msgDiv.innerHTML = `<strong>${sender}:</strong><br>${formatMessage(message)}`;
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
 function addMessage(sender, message) {
     const msgDiv = document.createElement("div");
     msgDiv.style.cssText =
@@ -92,6 +200,7 @@ function addMessage(sender, message) {
 
     chatMessages.appendChild(msgDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return msgDiv;
 }
 
 function formatMessage(message) {
@@ -0,0 +1,374 @@
+# admission.py
+# Admission control in front of the chat endpoints.
+#
+# Without it every request is accepted and waits in the thread pool (or on the
+# OpenAI connection pool) until the upstream rate limits turn the backlog into
+# 500s. AdmissionController sheds the excess early instead:
+#   - at most `max_concurrent` generations run at once (a batch holds as many
+#     slots as it runs generations in parallel)
+#   - up to `max_queue` more wait for a slot, first come first served, each
+#     until its own deadline (`queue_timeout` seconds after it arrived)
+#   - optionally, every client has a token bucket (`rate_per_minute` sustained,
+#     `burst` at once, a batch costing one token per question); off unless
+#     `rate_per_minute` is set
+# A request that is not admitted gets AdmissionRejected, turned into a 429 with
+# a Retry-After header by AdmissionMiddleware.
+#
+# The limits are per process: with N uvicorn workers the service admits N times
+# as many requests.
+
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from metrics import Counter, Gauge, Histogram
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "rag_admission_in_flight",
+    "Requests currently holding an admission slot",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "rag_admission_queue_depth",
+    "Requests waiting for an admission slot",
+)
+ADMISSION_REJECTIONS = Counter(
+    "rag_admission_rejections_total",
+    "Requests turned away with a 429 by reason (rate_limited, queue_full, queue_timeout)",
+    ("reason",),
+)
+ADMISSION_WAIT = Histogram(
+    "rag_admission_wait_seconds",
+    "Time spent in the admission queue by admitted requests",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+class AdmissionRejected(Exception):
+    """
+    The request was not admitted.
+
+    Args:
+        reason: "rate_limited", "queue_full" or "queue_timeout"
+        retry_after: Seconds after which a retry is likely to be admitted
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """
+    One token bucket per client, refilled at `rate_per_minute`, holding at most
+    `burst` tokens. The least recently seen clients are forgotten beyond
+    `max_clients` (they come back with a full bucket).
+
+    A request costing more than `burst` (a large batch) is let through on a full
+    bucket and leaves it in debt: the client then waits until the whole cost is
+    paid back.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_clients: int = 10_000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client: str, cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens for a request of `client`.
+
+        Returns:
+            0.0 if the request is allowed, else the seconds until it would be
+        """
+        needed = min(float(cost), float(self.burst))
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= needed:
+                tokens -= cost
+            else:
+                wait = (needed - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """
+    Global concurrency limit, bounded wait queue and per-client rate limit.
+
+    A request costs one token and holds one slot by default; a batch is charged
+    one token per question and holds as many slots as generations it runs at
+    once (see AdmissionLease).
+
+    Args:
+        max_concurrent: Slots, i.e. generations running at once (0: no limit, no queue)
+        max_queue: Requests waiting for a slot; beyond, rejected at once
+        queue_timeout: Seconds a request waits for a slot before being rejected
+        rate_per_minute: Sustained requests per minute of one client (0: no limit)
+        burst: Requests a client can send at once
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 32,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        rate_per_minute: float = 0.0,
+        burst: int = 20,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.buckets = TokenBuckets(rate_per_minute, burst) if rate_per_minute > 0 else None
+
+        self._active = 0
+        self._waiters: deque[tuple[asyncio.Future, int]] = deque()
+        # Moving average of the time a request holds its slot (Retry-After estimate)
+        self._service_seconds = 1.0
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+
+    @asynccontextmanager
+    async def admit(self, client: str, cost: int = 1, slots: int = 1):
+        """
+        Hold `slots` admission slots for the duration of the block.
+
+        Raises:
+            AdmissionRejected: Rate limit exceeded, queue full, or no slot freed
+                up before the request's deadline
+        """
+        held = await self.acquire(client, cost, slots)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(held, time.perf_counter() - start)
+
+    async def acquire(self, client: str, cost: int = 1, slots: int = 1) -> int:
+        """
+        Admit a request of `client` costing `cost` tokens and holding `slots`
+        slots (at most max_concurrent); release() must follow.
+
+        Returns:
+            The slots held, to give back to release()
+
+        Raises:
+            AdmissionRejected: Rate limit exceeded, queue full, or no slot freed
+                up before the request's deadline
+        """
+        if self.buckets is not None:
+            wait = self.buckets.take(client, cost)
+            if wait > 0:
+                self._reject("rate_limited", wait)
+
+        held = 0
+        if self.max_concurrent > 0:
+            held = min(max(1, slots), self.max_concurrent)
+            await self._acquire(held)
+        self.admitted += 1
+        ADMISSION_IN_FLIGHT.inc()
+        return held
+
+    def release(self, slots: int, service_seconds: float):
+        """Give back the slots of an admitted request that held them `service_seconds`."""
+        self._service_seconds += 0.1 * (service_seconds - self._service_seconds)
+        ADMISSION_IN_FLIGHT.dec()
+        if slots:
+            self._active -= slots
+            self._grant()
+
+    async def _acquire(self, slots: int):
+        if self._active + slots <= self.max_concurrent and not self._waiters:
+            self._active += slots
+            ADMISSION_WAIT.observe(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full", self._estimated_wait(len(self._waiters)))
+
+        # Waiting: _grant hands the slots over in arrival order
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter, slots))
+        self.queued += 1
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self._reject("queue_timeout", self._estimated_wait(len(self._waiters)))
+        except BaseException:
+            # Client gone: give back the slots if they were handed over meanwhile
+            if waiter.done() and not waiter.cancelled():
+                self._active -= slots
+                self._grant()
+            else:
+                self._forget(waiter)
+            raise
+        ADMISSION_WAIT.observe(time.perf_counter() - start)
+
+    def _grant(self):
+        """Hand the free slots to the waiters at the head of the queue that fit in them."""
+        while self._waiters:
+            waiter, slots = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if self._active + slots > self.max_concurrent:
+                break
+            self._waiters.popleft()
+            self._active += slots
+            waiter.set_result(None)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+    def _forget(self, waiter: asyncio.Future):
+        for entry in self._waiters:
+            if entry[0] is waiter:
+                self._waiters.remove(entry)
+                break
+        # A large request leaving the head of the queue may unblock the next ones
+        self._grant()
+
+    def _estimated_wait(self, queued: int) -> float:
+        # Time for the requests ahead to go through the slots
+        return self._service_seconds * (queued + 1) / max(1, self.max_concurrent)
+
+    def _reject(self, reason: str, wait_seconds: float):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        raise AdmissionRejected(reason, max(1, math.ceil(wait_seconds)))
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self._active,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "avg_service_ms": round(self._service_seconds * 1000, 1),
+            "clients": len(self.buckets) if self.buckets is not None else 0,
+        }
+
+
+class AdmissionLease:
+    """
+    Admission of a request whose weight is only known to its endpoint (a batch:
+    the number of questions), granted by the endpoint and released by
+    AdmissionMiddleware once the response is fully sent.
+
+    The endpoint reads it from `request.state.admission` and awaits
+    `acquire(cost, slots)` after validating the request body.
+    """
+
+    def __init__(self, controller: AdmissionController, client: str):
+        self.controller = controller
+        self.client = client
+        self._held: int | None = None
+        self._start = 0.0
+
+    async def acquire(self, cost: int = 1, slots: int = 1):
+        """
+        Raises:
+            AdmissionRejected: See AdmissionController.acquire
+        """
+        if self._held is not None:
+            raise RuntimeError("Admission already acquired")
+        self._held = await self.controller.acquire(self.client, cost, slots)
+        self._start = time.perf_counter()
+
+    def release(self):
+        if self._held is not None:
+            self.controller.release(self._held, time.perf_counter() - self._start)
+            self._held = None
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting the requests of `paths` through a controller.
+
+    The slot is held until the response is fully sent, streamed answers
+    included. The requests of `weighted_paths` are admitted by their endpoint,
+    through the AdmissionLease found in `request.state.admission`, and released
+    here the same way. Rejected requests get a JSON 429 with a Retry-After header.
+
+    Args:
+        controller: The shared AdmissionController
+        paths: Request paths admitted as one request each
+        weighted_paths: Request paths admitted by the endpoint (AdmissionLease)
+        client_header: Header identifying the client behind a reverse proxy
+            (its first comma-separated value); empty: the peer address
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths, weighted_paths=(), client_header: str = ""):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+        self.weighted_paths = frozenset(weighted_paths)
+        self.client_header = client_header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if scope["path"] in self.weighted_paths:
+            return await self._call_weighted(scope, receive, send)
+        if scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        try:
+            async with self.controller.admit(self._client(scope)):
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            await self._reject(send, e)
+
+    async def _call_weighted(self, scope, receive, send):
+        lease = AdmissionLease(self.controller, self._client(scope))
+        scope.setdefault("state", {})["admission"] = lease
+        try:
+            await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            await self._reject(send, e)
+        finally:
+            lease.release()
+
+    def _client(self, scope) -> str:
+        if self.client_header:
+            for name, value in scope.get("headers", []):
+                if name == self.client_header:
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @staticmethod
+    async def _reject(send, rejection: AdmissionRejected):
+        body = json.dumps({
+            "detail": "Too many requests, retry later",
+            "reason": rejection.reason,
+            "retry_after": rejection.retry_after,
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejection.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,135 @@
+# concurrency_benchmark.py
+# Compares the two ways the API can run the RAG pipeline under concurrent load:
+#
+#   thread: asyncio.to_thread(answer_question, ...)   (blocking DAG, default executor)
+#   async:  await a_answer_question(...)              (async-native DAG)
+#
+# The DAG modules are replaced by stand-ins that only sleep for a configurable
+# latency, so the benchmark measures the serving path and not OpenAI/Qdrant.
+#
+# Usage (from the backend folder):
+#   python -m benchmarks.concurrency_benchmark --concurrency 10 50 200
+
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import threading
+import time
+
+# Dummy settings so that the pipeline module can be imported offline
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("QDRANT_HOST", "localhost")
+os.environ["ANSWER_CACHE_ENABLED"] = "false"
+
+from datapizza.core.clients import ClientResponse  # noqa: E402
+from datapizza.core.models import PipelineComponent  # noqa: E402
+from datapizza.type import Chunk, TextBlock  # noqa: E402
+
+import retrieval_pipeline  # noqa: E402
+
+
+class SleepStage(PipelineComponent):
+    """DAG stand-in: waits `latency` seconds (blocking or awaiting) and returns a fixed result."""
+
+    def __init__(self, latency: float, result):
+        self.latency = latency
+        self.result = result
+
+    def _run(self, **kwargs):
+        time.sleep(self.latency)
+        return self.result(**kwargs)
+
+    async def _a_run(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.result(**kwargs)
+
+
+def install_stand_ins(rewrite_s: float, embed_s: float, search_s: float, generate_s: float):
+    chunk = Chunk(id="1", text="Exchange programs are managed by the International Office.")
+    nodes = retrieval_pipeline.dag_pipeline.nodes
+    nodes["rewriter"] = SleepStage(rewrite_s, lambda user_prompt, **_: user_prompt)
+    nodes["embedder"] = SleepStage(embed_s, lambda text, **_: [0.0] * 1536)
+    nodes["retriever"] = SleepStage(search_s, lambda **_: [chunk])
+    nodes["generator"] = SleepStage(
+        generate_s,
+        lambda **_: ClientResponse(content=[TextBlock(content="Benchmark answer")]),
+    )
+
+
+async def run_mode(mode: str, concurrency: int) -> dict:
+    latencies = []
+    peak_threads = threading.active_count()
+    stop = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not stop.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async def one_request(i: int):
+        query = f"How does the exchange program work? #{i}"
+        start = time.perf_counter()
+        if mode == "thread":
+            await asyncio.to_thread(retrieval_pipeline.answer_question, query)
+        else:
+            await retrieval_pipeline.a_answer_question(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    sampler = asyncio.create_task(sample_threads())
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await sampler
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "wall_s": wall,
+        "throughput_rps": concurrency / wall,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        "peak_threads": peak_threads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thread-offload vs async pipeline benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--rewrite-ms", type=float, default=400)
+    parser.add_argument("--embed-ms", type=float, default=100)
+    parser.add_argument("--search-ms", type=float, default=50)
+    parser.add_argument("--generate-ms", type=float, default=1200)
+    args = parser.parse_args()
+
+    install_stand_ins(
+        args.rewrite_ms / 1000,
+        args.embed_ms / 1000,
+        args.search_ms / 1000,
+        args.generate_ms / 1000,
+    )
+
+    print(f"Default executor size: {min(32, (os.cpu_count() or 1) + 4)} threads")
+    print(
+        f"{'mode':<8}{'conc':>6}{'wall s':>9}{'req/s':>9}"
+        f"{'p50 ms':>10}{'p99 ms':>10}{'threads':>9}"
+    )
+    for concurrency in args.concurrency:
+        for mode in ("thread", "async"):
+            r = asyncio.run(run_mode(mode, concurrency))
+            print(
+                f"{r['mode']:<8}{r['concurrency']:>6}{r['wall_s']:>9.2f}"
+                f"{r['throughput_rps']:>9.1f}{r['p50_ms']:>10.0f}"
+                f"{r['p99_ms']:>10.0f}{r['peak_threads']:>9}"
+            )
+
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak RSS: {max_rss_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# import_time.py
+# Cold-start budget of the API: import time of main.py, measured with
+# `python -X importtime` in fresh interpreters.
+#
+# Importing main must stay cheap so that uvicorn binds at once: the RAG pipeline
+# (datapizza, OpenAI and Qdrant client stacks, the DAG) is loaded by the startup
+# task. The check fails (exit code 1) when:
+#   - the import takes longer than --budget-ms (best of --runs), or
+#   - one of the DEFERRED modules is imported by main
+#
+# Usage (from the backend folder, e.g. as a CI step):
+#   python -m benchmarks.import_time [--module main] [--budget-ms 1000] [--runs 3] [--top 15]
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Top-level packages that main must only import on demand
+DEFERRED = (
+    "retrieval_pipeline",
+    "datapizza",
+    "openai",
+    "qdrant_client",
+    "httpx",
+    "docling",
+    "onnxruntime",
+    "sentence_transformers",
+    "tiktoken",
+)
+
+
+def profile_import(module: str) -> list[tuple[str, int, int]]:
+    """
+    Import `module` in a fresh interpreter with -X importtime.
+
+    Returns:
+        (module name, self us, cumulative us) in import order
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "PYTHONPATH": str(BACKEND_DIR)},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget of the API module")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters; the fastest counts")
+    parser.add_argument("--top", type=int, default=15, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(max(1, args.runs))]
+    totals = [next(c for name, _, c in rows if name == args.module) for rows in runs]
+    best = min(range(len(runs)), key=lambda i: totals[i])
+    rows = runs[best]
+    total_ms = totals[best] / 1000
+
+    # Imports made by the module itself (not already loaded by the interpreter)
+    start = next(i for i, (name, _, _) in enumerate(rows) if name == args.module)
+    imported = {name for name, _, _ in rows[: start + 1]}
+    print(f"import {args.module}: {total_ms:.0f} ms (best of {len(runs)}: "
+          f"{', '.join(f'{t / 1000:.0f}' for t in totals)} ms), {len(imported)} modules")
+
+    slowest = {}
+    for name, _, cumulative in rows[: start]:
+        top = name.split(".")[0]
+        slowest[top] = max(slowest.get(top, 0), cumulative)
+    print(f"\n{'cumulative ms':>14}  top-level package")
+    for top, cumulative in sorted(slowest.items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"{cumulative / 1000:>14.1f}  {top}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.0f} ms, budget {args.budget_ms:.0f} ms")
+    loaded = sorted({name.split(".")[0] for name in imported} & set(DEFERRED))
+    if loaded:
+        failures.append(f"modules that must be imported on demand: {', '.join(loaded)}")
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"\nOK: within {args.budget_ms:.0f} ms, no deferred module imported")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# load_test.py
+# Offline load test of the FastAPI backend (main.py), end to end over HTTP.
+#
+# Starts two local processes and drives the real API against them:
+#   - benchmarks/fake_openai.py: OpenAI-compatible server with configurable latency
+#     and token rate (OPENAI_BASE_URL points the backend to it)
+#   - uvicorn main:app with VECTORSTORE_BACKEND=memory, on a synthetic corpus
+#     embedded with the same deterministic embeddings as the fake server
+#
+# For each endpoint and concurrency level it reports throughput, p50/p99 latency,
+# errors and the event-loop lag of the API process during that run (from the
+# rag_event_loop_lag_seconds histogram on /metrics).
+#
+# Usage (from the backend folder):
+#   python -m benchmarks.load_test --concurrency 1 10 50 --requests 200
+#   python -m benchmarks.load_test --endpoints escalate --pipeline-mode thread --output results.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_openai import fake_embedding
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+QUESTIONS = [
+    "How does the exchange program work?",
+    "When is the deadline for the tuition fee payment?",
+    "How do I apply for a scholarship?",
+    "Where can I find the exam calendar?",
+    "How can I change my study plan?",
+    "What documents are needed for the Erasmus application?",
+    "How do I book a meeting with the student office?",
+    "How are credits recognized after a semester abroad?",
+    "What is the procedure to withdraw from an exam?",
+    "How do I get a certificate of enrollment?",
+]
+
+TOPICS = [
+    "exchange program", "tuition fees", "scholarships", "exam calendar", "study plan",
+    "Erasmus application", "student office", "credit recognition", "exam withdrawal",
+    "enrollment certificate", "internships", "graduation", "library services", "housing",
+]
+
+ENDPOINTS = ("chat", "ask-agent", "escalate")
+
+
+# --- setup -----------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_corpus(path: Path, collection: str, n_chunks: int, dimensions: int, seed: int = 0):
+    """Synthetic chunks about university topics, in the InMemoryVectorstore snapshot format."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n_chunks):
+            topic = rng.choice(TOPICS)
+            other = rng.choice(TOPICS)
+            text = (
+                f"Section {i} about {topic}. Students interested in the {topic} should read "
+                f"the rules published by the university; see also the notes on {other}."
+            )
+            f.write(json.dumps({
+                "collection": collection,
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "text": text,
+                "metadata": {"source": f"synthetic_{i % 50}.pdf"},
+                "embedding": fake_embedding(text, dimensions).tolist(),
+            }) + "\n")
+
+
+def start_process(args: list[str], env: dict, log_path: Path) -> subprocess.Popen:
+    # Logs go to a file: a pipe nobody reads would block the server once full
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(url: str, process: subprocess.Popen, log_path: Path, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited early:\n{log_path.read_text()}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+# --- metrics scraping ----------------------------------------------------------
+
+def scrape_histogram(text: str, name: str) -> tuple[list[tuple[float, float]], float, float]:
+    """Return ([(le, cumulative count)], sum, count) of an unlabelled histogram."""
+    buckets, total, count = [], 0.0, 0.0
+    for line in text.splitlines():
+        if line.startswith(f"{name}_bucket"):
+            le = line.split('le="', 1)[1].split('"', 1)[0]
+            buckets.append((float("inf") if le == "+Inf" else float(le), float(line.rsplit(" ", 1)[1])))
+        elif line.startswith(f"{name}_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(f"{name}_count"):
+            count = float(line.rsplit(" ", 1)[1])
+    return buckets, total, count
+
+
+def histogram_quantile(q: float, buckets: list[tuple[float, float]]) -> float | None:
+    """Same estimate as PromQL histogram_quantile (linear interpolation in the bucket)."""
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if le == float("inf"):
+                return prev_le
+            if count == prev_count:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_count) / (count - prev_count)
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def lag_between(before: str, after: str) -> dict:
+    name = "rag_event_loop_lag_seconds"
+    b_buckets, b_sum, b_count = scrape_histogram(before, name)
+    a_buckets, a_sum, a_count = scrape_histogram(after, name)
+    delta = [(le, a - b) for (le, a), (_, b) in zip(a_buckets, b_buckets)]
+    samples = a_count - b_count
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "lag_mean_ms": ms((a_sum - b_sum) / samples) if samples else None,
+        "lag_p50_ms": ms(histogram_quantile(0.50, delta)),
+        "lag_p99_ms": ms(histogram_quantile(0.99, delta)),
+    }
+
+
+# --- load ------------------------------------------------------------------
+
+def build_request(endpoint: str, i: int, unique: bool) -> tuple[str, dict]:
+    question = QUESTIONS[i % len(QUESTIONS)]
+    if unique:
+        # defeats the answer cache and request coalescing: every request runs the pipeline
+        question = f"{question} (request {i})"
+    if endpoint == "chat":
+        return "/api/chat", {"query": question}
+    if endpoint == "ask-agent":
+        return "/ask-agent", {"question": question}
+    return "/api/escalate", {
+        "query": question,
+        "name": "Mario",
+        "surname": "Rossi",
+        "student_id": str(100000 + i),
+        "email": "mario.rossi@example.com",
+        "rag_answer": "The answer given by the chatbot.",
+    }
+
+
+async def run_load(base_url: str, endpoint: str, concurrency: int, n_requests: int, unique: bool) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(n_requests))
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=300.0,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    ) as client:
+        before = (await client.get("/metrics")).text
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                path, payload = build_request(endpoint, i, unique)
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=payload)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+        after = (await client.get("/metrics")).text
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))], 1) if latencies else None,
+        **lag_between(before, after),
+    }
+
+
+def print_table(results: list[dict]):
+    header = (
+        f"{'endpoint':<10}{'conc':>6}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'lag mean':>10}{'lag p50':>9}{'lag p99':>9}"
+    )
+    print(header)
+    for r in results:
+        print(
+            f"{r['endpoint']:<10}{r['concurrency']:>6}{r['errors']:>8}{r['rps']:>9}"
+            f"{r['p50_ms'] if r['p50_ms'] is not None else '-':>10}"
+            f"{r['p99_ms'] if r['p99_ms'] is not None else '-':>10}"
+            f"{r['lag_mean_ms'] if r['lag_mean_ms'] is not None else '-':>10}"
+            f"{r['lag_p50_ms'] if r['lag_p50_ms'] is not None else '-':>9}"
+            f"{r['lag_p99_ms'] if r['lag_p99_ms'] is not None else '-':>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the FastAPI backend")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="fake LLM output rate")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--chunks", type=int, default=2000, help="synthetic corpus size")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--pipeline-mode", choices=["async", "thread"], default="async")
+    parser.add_argument("--rewrite-mode", default="always")
+    parser.add_argument("--escalation-mode", choices=["template", "llm"], default="template")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on")
+    parser.add_argument("--max-concurrent", type=int, default=0,
+                        help="admission slots of the API (0: no admission control)")
+    parser.add_argument("--repeat-queries", action="store_true",
+                        help="reuse the same 10 questions (exercises cache and coalescing)")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-load-test-"))
+    collection = "load_test"
+    corpus = workdir / "corpus.jsonl"
+    write_corpus(corpus, collection, args.chunks, args.dimensions)
+
+    fake_port, api_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "QDRANT_HOST": "unused",
+        "VECTORSTORE_BACKEND": "memory",
+        "VECTORSTORE_MEMORY_PATH": str(corpus),
+        "COLLECTION_NAME": collection,
+        "EMBEDDING_DIMENSIONS": str(args.dimensions),
+        "CACHE_DIR": str(workdir / "cache"),
+        "PIPELINE_MODE": args.pipeline_mode,
+        "REWRITE_MODE": args.rewrite_mode,
+        "ESCALATION_EMAIL_MODE": args.escalation_mode,
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "EMBEDDING_CACHE_ENABLED": "false",
+        # Every request comes from 127.0.0.1: no per-client rate limit
+        "ADMISSION_RATE_PER_MINUTE": "0",
+        "ADMISSION_MAX_CONCURRENT": str(args.max_concurrent),
+    }
+
+    fake = start_process([
+        "-m", "benchmarks.fake_openai",
+        "--port", str(fake_port),
+        "--latency-ms", str(args.latency_ms),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--answer-tokens", str(args.answer_tokens),
+        "--embed-latency-ms", str(args.embed_latency_ms),
+        "--dimensions", str(args.dimensions),
+    ], env, workdir / "fake_openai.log")
+    api = start_process(
+        ["-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+        env,
+        workdir / "api.log",
+    )
+
+    results = []
+    try:
+        wait_ready(f"http://127.0.0.1:{fake_port}/health", fake, workdir / "fake_openai.log")
+        wait_ready(f"http://127.0.0.1:{api_port}/health", api, workdir / "api.log")
+        print(
+            f"pipeline={args.pipeline_mode} rewrite={args.rewrite_mode} escalation={args.escalation_mode} "
+            f"llm={args.latency_ms:.0f}ms+{args.tokens_per_second:.0f}tok/s chunks={args.chunks}"
+        )
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                results.append(asyncio.run(run_load(
+                    f"http://127.0.0.1:{api_port}",
+                    endpoint,
+                    concurrency,
+                    args.requests,
+                    unique=not args.repeat_queries,
+                )))
+        print_table(results)
+    finally:
+        for process in (api, fake):
+            process.terminate()
+            process.wait(timeout=10)
+
+    print(f"logs: {workdir}")
+    if args.output:
+        args.output.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# queries.py
+# Exchange-program questions shared by the benchmarks.
+#
+# A query file has one {"query": "...", "expected_source": "data/exchange1.pdf"}
+# per line ("expected_source" is optional).
+
+import json
+
+DEFAULT_QUERIES = [
+    {"query": "Tell me how the exchange program works at Bocconi"},
+    {"query": "exchange deadline"},
+    {"query": "What documents do I need to submit for the exchange application?"},
+    {"query": "Can I take courses in another department during my semester abroad?"},
+    {"query": "how do I apply for it"},
+    {"query": "Which language certificates are accepted for the exchange selection?"},
+    {"query": "ranking criteria"},
+    {"query": "Is there a scholarship for students going on exchange outside Europe?"},
+]
+
+
+def load_queries(path: str | None) -> list[dict]:
+    if not path:
+        return DEFAULT_QUERIES
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,210 @@
+# vector_index_benchmark.py
+# Search latency and recall of the embedded IVF index (VECTORSTORE_BACKEND=local)
+# against exact search and against Qdrant.
+#
+# The vectors are either the corpus snapshot written for the "memory" backend or
+# a synthetic clustered set. The ground truth is exact cosine search and
+# recall@k is the overlap of each backend's top-k with it. The local index is
+# queried through LocalVectorstore.search, the code path used by the API.
+#
+# Usage (from the backend folder):
+#   python -m benchmarks.vector_index_benchmark [--n 50000] [--nprobe 1 4 8 16 32]
+#       [--snapshot .cache/memory_vectorstore.jsonl] [--qdrant local|remote]
+#       [--quantization none int8 binary]
+#
+# --qdrant remote uploads the vectors to a temporary collection of the Qdrant
+# configured in .env (deleted afterwards); --qdrant local uses the in-process
+# mode of qdrant-client.
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+# Dummy settings so that the modules can be imported offline
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from datapizza.type import Chunk, DenseEmbedding  # noqa: E402
+from qdrant_client import QdrantClient  # noqa: E402
+from qdrant_client.http import models  # noqa: E402
+
+from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY  # noqa: E402
+from vector_index import QUANTIZATIONS, normalize  # noqa: E402
+from vectorstores import LocalVectorstore  # noqa: E402
+
+COLLECTION = "benchmark"
+
+
+def synthetic_vectors(n: int, dims: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    # Topics as random directions, chunks scattered around them (noise of norm
+    # ~0.8: two chunks of the same topic have a cosine similarity around 0.6)
+    centers = normalize(rng.standard_normal((clusters, dims)))
+    assignment = rng.integers(clusters, size=n)
+    noise = 0.8 / np.sqrt(dims) * rng.standard_normal((n, dims))
+    return normalize(centers[assignment] + noise)
+
+
+def snapshot_vectors(path: Path) -> np.ndarray:
+    with open(path, encoding="utf-8") as f:
+        return normalize(np.array([json.loads(line)["embedding"] for line in f if line.strip()]))
+
+
+def make_queries(vectors: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    # A question lands near, not on, the chunk that answers it
+    picked = vectors[rng.integers(len(vectors), size=count)]
+    return normalize(picked + 0.4 / np.sqrt(vectors.shape[1]) * rng.standard_normal(picked.shape))
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> list[set[int]]:
+    truth = []
+    for query in queries:
+        scores = vectors @ query
+        truth.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    return truth
+
+
+def measure(search, queries: np.ndarray, truth: list[set[int]], k: int) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(set(found) & expected) / k)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "recall": round(statistics.fmean(recalls), 4),
+    }
+
+
+def bench_exact(vectors, queries, truth, k) -> dict:
+    def search(query):
+        scores = vectors @ query
+        return np.argpartition(-scores, k - 1)[:k].tolist()
+
+    return {"backend": "numpy exact", **measure(search, queries, truth, k)}
+
+
+def bench_local(vectors, queries, truth, k, nprobes, n_lists, quantization="none") -> list[dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LocalVectorstore(Path(tmp), n_lists=n_lists, quantization=quantization)
+        store.add(
+            [
+                Chunk(id=str(i), text="", embeddings=[DenseEmbedding(name="embedding", vector=v)])
+                for i, v in enumerate(vectors)
+            ],
+            COLLECTION,
+        )
+        start = time.perf_counter()
+        store.flush()
+        build_s = time.perf_counter() - start
+        disk_mb = sum(f.stat().st_size for f in Path(tmp).rglob("*") if f.is_file()) / 2**20
+
+        # Cold open, as at API startup: chunks.jsonl parsed, vectors memory-mapped
+        store = LocalVectorstore(Path(tmp), n_lists=n_lists, quantization=quantization)
+        start = time.perf_counter()
+        store.count(COLLECTION)
+        load_ms = (time.perf_counter() - start) * 1000
+        lists = store._collections[COLLECTION].index.n_lists
+        print(
+            f"local index ({quantization}): {lists} lists, build {build_s:.1f}s, open {load_ms:.0f}ms, "
+            f"{disk_mb:.0f} MB on disk"
+        )
+
+        rows = []
+        for nprobe in nprobes:
+            store.nprobe = nprobe
+
+            def search(query):
+                return [int(c.id) for c in store.search(COLLECTION, query, k)]
+
+            rows.append({
+                "backend": f"local ivf {quantization} nprobe={nprobe}",
+                **measure(search, queries, truth, k),
+                "lists": lists,
+                "build_s": round(build_s, 2),
+                "open_ms": round(load_ms, 1),
+            })
+        return rows
+
+
+def bench_qdrant(vectors, queries, truth, k, where: str) -> dict:
+    if where == "remote":
+        client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, api_key=QDRANT_API_KEY, https=True)
+    else:
+        client = QdrantClient(location=":memory:")
+    collection = f"benchmark_{uuid.uuid4().hex[:8]}"
+    client.create_collection(
+        collection,
+        vectors_config={"embedding": models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE)},
+    )
+    try:
+        for i in range(0, len(vectors), 256):
+            client.upsert(
+                collection_name=collection,
+                points=[
+                    models.PointStruct(id=j, vector={"embedding": vectors[j].tolist()})
+                    for j in range(i, min(i + 256, len(vectors)))
+                ],
+                wait=True,
+            )
+
+        def search(query):
+            hits = client.query_points(
+                collection_name=collection, query=query.tolist(), using="embedding", limit=k
+            )
+            return [int(p.id) for p in hits.points]
+
+        return {"backend": f"qdrant {where}", **measure(search, queries, truth, k)}
+    finally:
+        client.delete_collection(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded IVF index vs exact search vs Qdrant")
+    parser.add_argument("--snapshot", type=Path, help="JSONL corpus snapshot (memory backend format)")
+    parser.add_argument("--n", type=int, default=50000, help="synthetic vectors")
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200, help="synthetic topics")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists (0 = about sqrt(n))")
+    parser.add_argument("--qdrant", choices=["local", "remote"])
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATIONS, default=["none"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.snapshot:
+        vectors = snapshot_vectors(args.snapshot)
+    else:
+        vectors = synthetic_vectors(args.n, args.dims, args.clusters, rng)
+    queries = make_queries(vectors, args.queries, rng)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    rows = [bench_exact(vectors, queries, truth, args.k)]
+    for quantization in args.quantization:
+        rows += bench_local(vectors, queries, truth, args.k, args.nprobe, args.lists, quantization)
+    if args.qdrant:
+        rows.append(bench_qdrant(vectors, queries, truth, args.k, args.qdrant))
+
+    print(f"\n{'backend':<32}{'p50 ms':>10}{'p99 ms':>10}{'recall@' + str(args.k):>12}")
+    for row in rows:
+        print(f"{row['backend']:<32}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['recall']:>12}")
+
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,115 +1,226 @@
-# email_utils.py
-
-import json
-import re
-from datapizza.clients.openai import OpenAIClient
-
-from config import (
-    OPENAI_API_KEY,
-    HELPDESK_EMAIL,
-)
-
-# LLM client dedicated to writing formal emails
-email_client = OpenAIClient(
-    model="gpt-4o-mini",
-    api_key=OPENAI_API_KEY,
-    system_prompt=(
-        "You are an assistant that writes formal emails in English to the university helpdesk. "
-        "You must be polite, clear, and concise. "
-        "Always include the student's name, surname, and student ID (matricola)."
-    ),
-)
-
-
-def build_helpdesk_email(
-    first_name: str,
-    last_name: str,
-    student_id: str,
-    student_email: str,
-    user_question: str,
-    rag_answer: str,
-) -> dict:
-    """
-    Does NOT send any email: it only generates a ready-to-use email payload.
-
-    Returns a dict:
-    {
-        "to": ...,
-        "cc": ...,
-        "subject": ...,
-        "body": ...
-    }
-    which the frontend can show to the user or turn into a `mailto:` link.
-    """
-
-    prompt = f"""
-    Student data:
-    - First name: {first_name}
-    - Last name: {last_name}
-    - Student ID (matricola): {student_id}
-    - Email: {student_email}
-
-    Original student question:
-    {user_question}
-
-    Answer given by the chatbot (based on official documents):
-    {rag_answer}
-
-    Write a formal email in English to the university helpdesk to ask for clarifications.
-
-    The email must:
-    - start with a formal greeting (e.g. "Dear Student Services Office,")
-    - briefly explain the context
-    - restate the student's doubt / question
-    - politely ask for an answer or operational guidance
-    - end with a polite closing formula
-    - be signed with the student's name, surname, student ID, and email.
-
-    Respond in JSON with EXACTLY these keys:
-    - "subject": a short and clear subject line (string)
-    - "body": the full email text (string)
-    """
-
-    resp = email_client.invoke(prompt)
-
-    raw = resp.text.strip()
-
-    # 1) Se il modello ha messo i ```json ... ``` li togliamo
-    if raw.startswith("```"):
-        lines = raw.splitlines()
-        # rimuovi la prima e l’ultima linea se iniziano/finiscono con ```
-        if lines and lines[0].startswith("```"):
-            lines = lines[1:]
-        if lines and lines[-1].startswith("```"):
-            lines = lines[:-1]
-        raw = "\n".join(lines).strip()
-
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
-        # Fallback se proprio non ci riesce
-        data = {
-            "subject": "Information request",
-            "body": resp.text,
-        }
-
-    # Post-process subject and body to ensure consistent formatting
-    subject = data.get("subject", "Information request")
-    body_raw = data.get("body", "")
-
-    # Normalize newlines and trim
-    body = body_raw.replace("\r\n", "\n").strip()
-
-    # If the model didn't include a formal greeting, add one
-    if not re.match(r"(?i)^(dear|hello|hi)\b", body):
-        body = "Dear Student Services Office,\n\n" + body
-
-    # Final payload that the frontend can directly use
-    email_payload = {
-        "to": HELPDESK_EMAIL,
-        "cc": student_email,
-        "subject": subject.strip(),
-        "body": body,
-    }
-
-    return email_payload
+# email_utils.py
+
+import json
+import re
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    HELPDESK_EMAIL,
+)
+
+# LLM client dedicated to writing formal emails (shares the connection pool of the
+# RAG pipeline), built on first use: the template path never loads the OpenAI stack
+_email_client = None
+
+
+def get_email_client():
+    global _email_client
+    if _email_client is None:
+        from http_pool import PooledOpenAIClient
+
+        _email_client = PooledOpenAIClient(
+            model="gpt-4o-mini",
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            system_prompt=(
+                "You are an assistant that writes formal emails in English to the university helpdesk. "
+                "You must be polite, clear, and concise. "
+                "Always include the student's name, surname, and student ID (matricola)."
+            ),
+        )
+    return _email_client
+
+
+# Longest question quoted in a template subject line
+SUBJECT_MAX_CHARS = 70
+
+
+def build_helpdesk_email_template(
+    first_name: str,
+    last_name: str,
+    student_id: str,
+    student_email: str,
+    user_question: str,
+    rag_answer: str,
+    helpdesk_email: str | None = None,
+) -> dict:
+    """
+    Fast path of build_helpdesk_email: fills a fixed template, no LLM call.
+
+    Same arguments and same payload as build_helpdesk_email; the output only
+    depends on the inputs.
+    """
+    question = " ".join(user_question.split())
+    subject = f"Information request: {question}"
+    if len(subject) > SUBJECT_MAX_CHARS:
+        subject = subject[: SUBJECT_MAX_CHARS - 3].rstrip() + "..."
+
+    answer = rag_answer.strip()
+    if answer:
+        context = (
+            "The university chatbot gave me the following answer, based on the official documents:\n\n"
+            f"\"{answer}\"\n\n"
+            "Could you please confirm this information or give me operational guidance on how to proceed?"
+        )
+    else:
+        context = (
+            "The university chatbot could not give me a conclusive answer. "
+            "Could you please help me or give me operational guidance on how to proceed?"
+        )
+
+    signature = "\n".join(
+        line
+        for line in (
+            f"{first_name} {last_name}".strip(),
+            f"Student ID (matricola): {student_id}" if student_id else "",
+            f"Email: {student_email}" if student_email else "",
+        )
+        if line
+    )
+
+    body = (
+        "Dear Student Services Office,\n\n"
+        "I am writing to ask for clarification about the following question:\n\n"
+        f"\"{question}\"\n\n"
+        f"{context}\n\n"
+        "Thank you in advance for your help.\n\n"
+        "Kind regards,\n"
+        f"{signature}"
+    )
+
+    return {
+        "to": helpdesk_email or HELPDESK_EMAIL,
+        "cc": student_email,
+        "subject": subject,
+        "body": body,
+    }
+
+
+def _email_prompt(
+    first_name: str,
+    last_name: str,
+    student_id: str,
+    student_email: str,
+    user_question: str,
+    rag_answer: str,
+) -> str:
+    return f"""
+    Student data:
+    - First name: {first_name}
+    - Last name: {last_name}
+    - Student ID (matricola): {student_id}
+    - Email: {student_email}
+
+    Original student question:
+    {user_question}
+
+    Answer given by the chatbot (based on official documents):
+    {rag_answer}
+
+    Write a formal email in English to the university helpdesk to ask for clarifications.
+
+    The email must:
+    - start with a formal greeting (e.g. "Dear Student Services Office,")
+    - briefly explain the context
+    - restate the student's doubt / question
+    - politely ask for an answer or operational guidance
+    - end with a polite closing formula
+    - be signed with the student's name, surname, student ID, and email.
+
+    Respond in JSON with EXACTLY these keys:
+    - "subject": a short and clear subject line (string)
+    - "body": the full email text (string)
+    """
+
+
+def _payload_from_llm_text(text: str, student_email: str, helpdesk_email: str | None) -> dict:
+    raw = text.strip()
+
+    # 1) Se il modello ha messo i ```json ... ``` li togliamo
+    if raw.startswith("```"):
+        lines = raw.splitlines()
+        # rimuovi la prima e l’ultima linea se iniziano/finiscono con ```
+        if lines and lines[0].startswith("```"):
+            lines = lines[1:]
+        if lines and lines[-1].startswith("```"):
+            lines = lines[:-1]
+        raw = "\n".join(lines).strip()
+
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        # Fallback se proprio non ci riesce
+        data = {
+            "subject": "Information request",
+            "body": text,
+        }
+
+    # Post-process subject and body to ensure consistent formatting
+    subject = data.get("subject", "Information request")
+    body_raw = data.get("body", "")
+
+    # Normalize newlines and trim
+    body = body_raw.replace("\r\n", "\n").strip()
+
+    # If the model didn't include a formal greeting, add one
+    if not re.match(r"(?i)^(dear|hello|hi)\b", body):
+        body = "Dear Student Services Office,\n\n" + body
+
+    # Final payload that the frontend can directly use
+    email_payload = {
+        "to": helpdesk_email or HELPDESK_EMAIL,
+        "cc": student_email,
+        "subject": subject.strip(),
+        "body": body,
+    }
+
+    return email_payload
+
+
+def build_helpdesk_email(
+    first_name: str,
+    last_name: str,
+    student_id: str,
+    student_email: str,
+    user_question: str,
+    rag_answer: str,
+    helpdesk_email: str | None = None,
+) -> dict:
+    """
+    Does NOT send any email: it only generates a ready-to-use email payload.
+
+    Returns a dict:
+    {
+        "to": ...,
+        "cc": ...,
+        "subject": ...,
+        "body": ...
+    }
+    which the frontend can show to the user or turn into a `mailto:` link.
+    The email goes to `helpdesk_email` (the tenant's helpdesk), HELPDESK_EMAIL if None.
+
+    Blocking LLM call: from async code use a_build_helpdesk_email.
+    """
+    prompt = _email_prompt(
+        first_name, last_name, student_id, student_email, user_question, rag_answer
+    )
+    resp = get_email_client().invoke(prompt)
+    return _payload_from_llm_text(resp.text, student_email, helpdesk_email)
+
+
+async def a_build_helpdesk_email(
+    first_name: str,
+    last_name: str,
+    student_id: str,
+    student_email: str,
+    user_question: str,
+    rag_answer: str,
+    helpdesk_email: str | None = None,
+) -> dict:
+    """Async variant of build_helpdesk_email (AsyncOpenAI, does not block the event loop)."""
+    prompt = _email_prompt(
+        first_name, last_name, student_id, student_email, user_question, rag_answer
+    )
+    resp = await get_email_client().a_invoke(prompt)
+    return _payload_from_llm_text(resp.text, student_email, helpdesk_email)
@@ -0,0 +1,244 @@
+# embedding_cache.py
+# Disk-backed embedding cache shared by all the backend processes.
+#
+# Vectors are stored as float32 blobs in a SQLite database (WAL mode, so the
+# uvicorn workers and the ingestion script can read and write it concurrently),
+# keyed by (model_name, dimensions, sha256(text)). When the table grows past
+# `max_entries` the least recently used rows are deleted.
+#
+# Reads stay reads: the `last_used` time of the rows found is buffered and
+# written in one transaction every TOUCH_FLUSH_EVERY hits or TOUCH_FLUSH_SECONDS,
+# so hits do not compete for the WAL write lock with the other processes.
+#
+# stats() runs no query: the entry count is counted once at start, kept up to
+# date by put_many and recounted at every eviction check (the rows written by
+# the other processes show up there).
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from datapizza.core.embedder import BaseEmbedder
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed store of embeddings.
+
+    Args:
+        path: Database file (created if missing)
+        max_entries: Maximum number of cached vectors before LRU eviction
+    """
+
+    # Eviction is checked once every this many inserted rows
+    EVICTION_CHECK_EVERY = 500
+    # Buffered `last_used` updates are written after this many hits or seconds
+    TOUCH_FLUSH_EVERY = 256
+    TOUCH_FLUSH_SECONDS = 30.0
+
+    def __init__(self, path: Path, max_entries: int = 200_000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inserts_since_check = 0
+        self._touched: dict[str, float] = {}
+        self._last_touch_flush = time.monotonic()
+        # Approximate row count (see the module comment)
+        self._entries = 0
+        self.hits = 0
+        self.misses = 0
+
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    dims INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+            )
+            (self._entries,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread: sqlite3 connections are not thread-safe
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, dims: int | None, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{dims or 0}:{digest}"
+
+    def get_many(self, model: str, dims: int | None, texts: list[str]) -> dict[int, list[float]]:
+        """
+        Look up many texts at once.
+
+        Returns:
+            {index in `texts`: vector} for the texts found in the cache
+        """
+        keys = [self.make_key(model, dims, t) for t in texts]
+        found: dict[str, list[float]] = {}
+        conn = self._connect()
+
+        unique_keys = list(dict.fromkeys(keys))
+        # SQLite limits the number of bound parameters per statement
+        for i in range(0, len(unique_keys), 500):
+            batch = unique_keys[i : i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch,
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        result = {i: found[k] for i, k in enumerate(keys) if k in found}
+        now = time.time()
+        with self._lock:
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+            self._touched.update((k, now) for k in found)
+            flush = len(self._touched) >= self.TOUCH_FLUSH_EVERY or (
+                self._touched
+                and time.monotonic() - self._last_touch_flush >= self.TOUCH_FLUSH_SECONDS
+            )
+        if flush:
+            self.flush_touched()
+        return result
+
+    def flush_touched(self):
+        """Write the buffered `last_used` times of the rows read since the last flush."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._last_touch_flush = time.monotonic()
+        if touched:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(ts, k) for k, ts in touched.items()],
+                )
+
+    def put_many(self, model: str, dims: int | None, texts: list[str], vectors: list):
+        now = time.time()
+        rows = [
+            (
+                self.make_key(model, dims, text),
+                model,
+                dims or 0,
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dims, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+        with self._lock:
+            # Replaced rows are counted too: corrected by the next eviction check
+            self._entries += len(rows)
+            self._inserts_since_check += len(rows)
+            check = self._inserts_since_check >= self.EVICTION_CHECK_EVERY
+            if check:
+                self._inserts_since_check = 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used rows above `max_entries`."""
+        self.flush_touched()
+        conn = self._connect()
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            with conn:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,),
+                )
+            count = self.max_entries
+        with self._lock:
+            self._entries = count
+
+    def stats(self) -> dict:
+        """Entry count (approximate, no query), hits and misses of this process."""
+        with self._lock:
+            return {"entries": self._entries, "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbedder(BaseEmbedder):
+    """
+    Embedder wrapper that only calls the API for texts missing from the cache.
+
+    Works both as the `embedder` node of the retrieval DAG and as the client of
+    `ChunkEmbedder` during ingestion (re-ingesting unchanged chunks costs no API call).
+
+    Args:
+        embedder: The wrapped embedder (e.g. OpenAIEmbedder)
+        cache: The shared EmbeddingCache
+        dimensions: Embedding size, part of the cache key
+    """
+
+    def __init__(self, embedder: BaseEmbedder, cache: EmbeddingCache, dimensions: int | None = None):
+        self.embedder = embedder
+        self.cache = cache
+        self.dimensions = dimensions
+        self.model_name = embedder.model_name
+        self.client = None
+        self.a_client = None
+
+    def embed(self, text: str | list[str], model_name: str | None = None):
+        texts = [text] if isinstance(text, str) else list(text)
+        model = model_name or self.model_name
+
+        vectors = self.cache.get_many(model, self.dimensions, texts)
+        missing = [i for i in range(len(texts)) if i not in vectors]
+        if missing:
+            fresh = self.embedder.embed([texts[i] for i in missing], model_name)
+            self.cache.put_many(model, self.dimensions, [texts[i] for i in missing], fresh)
+            vectors.update(zip(missing, fresh))
+
+        result = [vectors[i] for i in range(len(texts))]
+        return result[0] if isinstance(text, str) else result
+
+    async def a_embed(self, text: str | list[str], model_name: str | None = None):
+        # SQLite calls can wait on the write lock held by another process (up to
+        # the connection timeout): they run in a worker thread, not on the loop
+        texts = [text] if isinstance(text, str) else list(text)
+        model = model_name or self.model_name
+
+        vectors = await asyncio.to_thread(self.cache.get_many, model, self.dimensions, texts)
+        missing = [i for i in range(len(texts)) if i not in vectors]
+        if missing:
+            fresh = await self.embedder.a_embed([texts[i] for i in missing], model_name)
+            await asyncio.to_thread(
+                self.cache.put_many, model, self.dimensions, [texts[i] for i in missing], fresh
+            )
+            vectors.update(zip(missing, fresh))
+
+        result = [vectors[i] for i in range(len(texts))]
+        return result[0] if isinstance(text, str) else result
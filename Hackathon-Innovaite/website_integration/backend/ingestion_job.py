@@ -0,0 +1,222 @@
+# ingestion_job.py
+# Crash safety and progress for long ingestion runs (used by ingestion_pipeline.py).
+#
+# - IngestionCheckpoint: append-only journal of the chunks whose upsert completed,
+#   fsynced after every batch. The manifest is only saved at the end of a run;
+#   after a crash the next run merges the journal into it, so the committed
+#   chunks are neither embedded nor upserted again.
+# - retry: exponential backoff with jitter around embedding and upsert requests.
+# - ProgressReporter: periodic progress line with throughput and ETA.
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import openai
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+from ingestion_manifest import IngestionManifest, chunk_sha256
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+class IngestionCheckpoint:
+    """
+    JSONL journal of committed chunks: a header line, then one
+    {"source": ..., "chunks": {chunk id: chunk hash}} line per committed batch.
+
+    Args:
+        path: Journal file (created on the first commit)
+        collection_name: Collection of the run; a journal of another collection is ignored
+    """
+
+    def __init__(self, path: Path, collection_name: str):
+        self.path = Path(path)
+        self.collection_name = collection_name
+        self.committed: dict[str, dict[str, str]] = {}
+        self.committed_chunks = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except ValueError:
+            header = {}
+        if header.get("version") != CHECKPOINT_VERSION or header.get("collection") != self.collection_name:
+            return
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Last line cut by the crash: that batch is simply redone
+                continue
+            self.committed.setdefault(entry["source"], {}).update(entry["chunks"])
+        self.committed_chunks = sum(len(chunks) for chunks in self.committed.values())
+
+    def resume_into(self, manifest: IngestionManifest) -> int:
+        """
+        Add the committed chunks of an interrupted run to the manifest.
+
+        The files are recorded without a file hash: the plan sees them as
+        changed, and diffing them only embeds the chunks not committed yet
+        (committed chunks of edited or deleted files are cleaned up as usual).
+
+        Returns:
+            Number of chunks resumed
+        """
+        for source, chunks in self.committed.items():
+            previous = manifest.files.get(source, {}).get("chunks", {})
+            manifest.record(source, None, {**previous, **chunks})
+        return self.committed_chunks
+
+    def commit(self, chunks: list):
+        """Record upserted chunks (durable when this returns)."""
+        by_source: dict[str, dict[str, str]] = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk.metadata.get("source"), {})[str(chunk.id)] = chunk_sha256(chunk.text)
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # Rewritten on the first commit of a run, starting with the chunks
+                # resumed from the previous journal: they stay until the manifest is saved
+                self._file = open(self.path, "w", encoding="utf-8")
+                header = {"version": CHECKPOINT_VERSION, "collection": self.collection_name}
+                self._file.write(json.dumps(header) + "\n")
+                for source, committed in self.committed.items():
+                    self._file.write(json.dumps({"source": source, "chunks": committed}) + "\n")
+            for source, committed in by_source.items():
+                self._file.write(json.dumps({"source": source, "chunks": committed}) + "\n")
+                self.committed.setdefault(source, {}).update(committed)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.committed_chunks += len(chunks)
+
+    def clear(self):
+        """Delete the journal once the manifest of the run is saved."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.path.unlink(missing_ok=True)
+            self.committed.clear()
+            self.committed_chunks = 0
+
+
+def is_transient(e: Exception) -> bool:
+    """Network errors, timeouts, rate limits and 5xx: worth retrying."""
+    if isinstance(e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(e, (httpx.TransportError, ResponseHandlingException, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(e, UnexpectedResponse):
+        return e.status_code == 429 or e.status_code >= 500
+    return False
+
+
+def retry(
+    fn,
+    *args,
+    attempts: int = 5,
+    backoff: float = 1.0,
+    max_backoff: float = 60.0,
+    what: str = "request",
+    **kwargs,
+):
+    """
+    Call fn(*args, **kwargs), retrying transient failures with exponential
+    backoff (backoff, 2 * backoff, ... capped at max_backoff, with jitter).
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            delay = min(max_backoff, backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            logger.warning(f"{what} failed ({str(e)}), retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class ProgressReporter:
+    """
+    Prints the progress of a run every `interval` seconds, from a background thread.
+
+    Args:
+        report: IngestionReport updated by the run
+        total_documents: Documents the run has to process
+        checkpoint: Optional checkpoint, for the committed chunk count
+        interval: Seconds between two lines
+    """
+
+    def __init__(
+        self,
+        report,
+        total_documents: int,
+        checkpoint: IngestionCheckpoint | None = None,
+        interval: float = 10.0,
+    ):
+        self.report = report
+        self.total_documents = total_documents
+        self.checkpoint = checkpoint
+        self.interval = interval
+        self._start = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        if self.interval > 0 and self.total_documents:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self._start
+        report = self.report
+        done = report.documents + len(report.failed_documents)
+        parts = [
+            f"[progress] {done}/{self.total_documents} documents",
+            f"{report.embeddings} chunks embedded ({report.embeddings / max(elapsed, 1e-9):.0f}/s)",
+        ]
+        if self.checkpoint is not None:
+            parts.append(f"{self.checkpoint.committed_chunks} committed")
+
+        # Share of the work done: embedded chunks out of the chunks the whole run
+        # should embed (extrapolated from the documents parsed so far), else documents
+        fraction = done / self.total_documents
+        to_embed = report.chunks - report.unchanged_chunks
+        if done and to_embed:
+            fraction = min(1.0, report.embeddings / (to_embed * self.total_documents / done))
+        eta = f", ETA {_format_duration(elapsed * (1 - fraction) / fraction)}" if fraction else ""
+        parts.append(f"elapsed {_format_duration(elapsed)}{eta}")
+        return ", ".join(parts)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            print(self.line(), flush=True)
@@ -0,0 +1,114 @@
+# ingestion_manifest.py
+# Content-hash manifest for incremental ingestion.
+#
+# For every ingested file the manifest keeps the sha256 of the file and, for
+# each of its chunks, {chunk id: sha256 of the chunk text}. Chunk ids are derived
+# from (source, chunk hash), so an unchanged chunk keeps its point id across runs:
+# re-ingesting a modified file only embeds and upserts the chunks whose text
+# changed, and deletes the points of the chunks that disappeared.
+#
+# Each file also records the splitter settings it was chunked with: changing
+# them marks every file as changed (re-split from the parse cache, see parse_cache.py).
+
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+# Namespace of the deterministic chunk ids (uuid5)
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c1d2e-8a53-4c1e-9a43-3f1f1c6b2a10")
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(chunks: list, source: str) -> dict[str, str]:
+    """
+    Give each chunk a deterministic id derived from its source and text.
+
+    Identical texts in the same document are told apart by their occurrence number.
+
+    Returns:
+        {chunk id: chunk hash} for the manifest
+    """
+    hashes = {}
+    seen: dict[str, int] = {}
+    for chunk in chunks:
+        text_hash = chunk_sha256(chunk.text)
+        occurrence = seen.get(text_hash, 0)
+        seen[text_hash] = occurrence + 1
+        chunk.id = str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{source}\x00{text_hash}\x00{occurrence}"))
+        hashes[chunk.id] = text_hash
+    return hashes
+
+
+class IngestionManifest:
+    """
+    JSON manifest of the ingested files of one collection.
+
+    Args:
+        path: Manifest file (created on first save)
+        collection_name: Collection the manifest describes; a manifest written
+            for another collection is ignored
+    """
+
+    def __init__(self, path: Path, collection_name: str):
+        self.path = Path(path)
+        self.collection_name = collection_name
+        self.files: dict[str, dict] = {}
+
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if (
+                data.get("version") == MANIFEST_VERSION
+                and data.get("collection") == collection_name
+            ):
+                self.files = data.get("files", {})
+
+    def file_hash(self, source: str) -> str | None:
+        entry = self.files.get(source)
+        return entry["file_hash"] if entry else None
+
+    def chunk_ids(self, source: str) -> set[str]:
+        entry = self.files.get(source)
+        return set(entry["chunks"]) if entry else set()
+
+    def is_unchanged(self, source: str, file_hash: str, splitter: str | None = None) -> bool:
+        entry = self.files.get(source)
+        if entry is None or entry["file_hash"] != file_hash:
+            return False
+        # Entries written before the splitter was recorded count as current
+        return entry.get("splitter", splitter) == splitter
+
+    def record(
+        self, source: str, file_hash: str, chunk_hashes: dict[str, str], splitter: str | None = None
+    ):
+        self.files[source] = {"file_hash": file_hash, "splitter": splitter, "chunks": chunk_hashes}
+
+    def forget(self, source: str):
+        self.files.pop(source, None)
+
+    def save(self):
+        # Write-then-rename: a crash never leaves a truncated manifest behind
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(
+            json.dumps(
+                {"version": MANIFEST_VERSION, "collection": self.collection_name, "files": self.files},
+                indent=1,
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
@@ -1,67 +1,1041 @@
-from datapizza.clients.openai import OpenAIClient
-from datapizza.core.vectorstore import VectorConfig
-from datapizza.embedders import ChunkEmbedder
-from datapizza.embedders.openai import OpenAIEmbedder
-from datapizza.modules.captioners import LLMCaptioner
-from datapizza.modules.parsers.docling import DoclingParser
-from datapizza.modules.splitters import NodeSplitter
-from datapizza.pipeline import IngestionPipeline
-from datapizza.vectorstores.qdrant import QdrantVectorstore
-
-from pathlib import Path
-
-from config import (
-    OPENAI_API_KEY,
-    QDRANT_HOST,
-    QDRANT_PORT,
-    QDRANT_API_KEY,
-    COLLECTION_NAME,
-)
-
-vectorstore = QdrantVectorstore(
-    host=QDRANT_HOST,
-    port=QDRANT_PORT,
-    api_key=QDRANT_API_KEY,
-    https=True,   
-)
-
-vectorstore.create_collection(
-    COLLECTION_NAME,
-    vector_config=[VectorConfig(name="embedding", dimensions=1536)],
-)
-
-embedder_client = OpenAIEmbedder(
-    api_key=OPENAI_API_KEY,
-    model_name="text-embedding-3-small",
-)
-
-ingestion_pipeline = IngestionPipeline(
-    modules=[
-        DoclingParser(), # choose between Docling, Azure or TextParser to parse plain text
-
-        #LLMCaptioner(
-        #    client=OpenAIClient(api_key="YOUR_API_KEY"),
-        #), # This is optional, add it if you want to caption the media
-
-        NodeSplitter(max_char=1000),             # Split Nodes into Chunks
-        ChunkEmbedder(client=embedder_client),   # Add embeddings to Chunks
-    ],
-    vector_store=vectorstore,
-    collection_name="my_documents"
-)
-
-
-folder = Path("data")
-
-for pdf in folder.rglob("*.pdf"):
-    print("Ingestion:", pdf)
-    ingestion_pipeline.run(str(pdf), metadata={"source": str(pdf)})
-
-
-
-res = vectorstore.search(
-    query_vector = [0.0] * 1536,
-    collection_name="my_documents",
-    k=2,
-)
-print(res)
\ No newline at end of file
+from datapizza.clients.openai import OpenAIClient
+from datapizza.core.vectorstore import VectorConfig
+from datapizza.modules.captioners import LLMCaptioner
+from datapizza.modules.parsers.docling import DoclingParser
+from datapizza.modules.splitters import NodeSplitter
+from datapizza.type import Chunk, DenseEmbedding, Node, NodeType
+from datapizza.vectorstores.qdrant import QdrantVectorstore
+from qdrant_client.http import models
+
+import argparse
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from answer_cache import write_collection_version
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    COLLECTION_NAME,
+    DATA_DIR,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    FAQ_AUTO_REBUILD,
+    FAQ_ENABLED,
+    INGESTION_WORKERS,
+    INGESTION_EMBED_BATCH_SIZE,
+    INGESTION_EMBED_CONCURRENCY,
+    INGESTION_UPSERT_BATCH_SIZE,
+    INGESTION_QUEUE_SIZE,
+    INGESTION_CHECKPOINT_PATH,
+    INGESTION_RETRIES,
+    INGESTION_RETRY_BACKOFF_SECONDS,
+    INGESTION_PROGRESS_SECONDS,
+    INGESTION_MANIFEST_PATH,
+    CHUNK_MAX_CHARS,
+    PARSE_CACHE_ENABLED,
+    PARSE_CACHE_DIR,
+    LEXICAL_INDEX_PATH,
+    VECTORSTORE_BACKEND,
+)
+from embedders import ShortenedOpenAIEmbedder
+from embedding_cache import CachedEmbedder, EmbeddingCache
+from faq_index import build_faq_index
+from ingestion_job import IngestionCheckpoint, ProgressReporter, retry
+from ingestion_manifest import IngestionManifest, assign_chunk_ids, file_sha256
+from lexical_index import LexicalIndex
+from parse_cache import ParseCache, parser_version
+from tenants import UnknownTenantError, tenant_registry
+from vectorstores import LocalVectorstore, apply_qdrant_quantization, build_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Name of the dense vector in the collection (the retrieval side searches it)
+VECTOR_NAME = "embedding"
+
+# Clients only connect on first use: creating them here has no side effect.
+# Qdrant, or the embedded index when VECTORSTORE_BACKEND is "local"
+vectorstore = build_vectorstore()
+
+embedder_client = ShortenedOpenAIEmbedder(
+    api_key=OPENAI_API_KEY,
+    model_name=EMBEDDING_MODEL,
+    base_url=OPENAI_BASE_URL,
+    dimensions=EMBEDDING_DIMENSIONS,
+)
+
+# Unchanged chunks are served from the shared embedding cache: zero API calls
+if EMBEDDING_CACHE_ENABLED:
+    embedder_client = CachedEmbedder(
+        embedder_client,
+        EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES),
+        dimensions=EMBEDDING_DIMENSIONS,
+    )
+
+
+@dataclass
+class ParsedDocument:
+    source: str
+    file_hash: str
+    chunks: list[Chunk]
+    chunk_hashes: dict[str, str]    # {chunk id: sha256 of the text}
+    pages: int
+    parse_seconds: float
+    cached: bool = False            # node tree read from the parse cache
+
+
+@dataclass
+class IngestionPlan:
+    """What an incremental run has to do, from the file hashes alone."""
+    changed: list[Path]             # new or modified: parsed and diffed chunk by chunk
+    unchanged: list[Path]           # skipped (no parsing, no API calls)
+    removed: list[str]              # in the manifest but gone from disk
+    file_hashes: dict[str, str]
+
+
+@dataclass
+class IngestionReport:
+    mode: str
+    workers: int = 1
+    documents: int = 0
+    failed_documents: list[str] = field(default_factory=list)
+    skipped_documents: int = 0
+    cached_parses: int = 0
+    removed_documents: int = 0
+    pages: int = 0
+    chunks: int = 0
+    unchanged_chunks: int = 0
+    deleted_points: int = 0
+    embeddings: int = 0
+    embedding_requests: int = 0
+    upsert_requests: int = 0
+    parse_seconds: float = 0.0      # summed over the workers
+    embed_seconds: float = 0.0      # summed over the concurrent requests
+    upsert_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    peak_rss_mb: float = 0.0        # this process (embedding and upserts)
+    peak_worker_rss_mb: float = 0.0 # largest parser process
+    resumed_chunks: int = 0         # committed by an interrupted run, not redone
+    points: int | None = None       # verification: points in the collection...
+    expected_points: int = 0        # ...and chunks in the manifest
+
+    @property
+    def verified(self) -> bool:
+        return self.points == self.expected_points
+
+    def rates(self) -> dict:
+        wall = self.wall_seconds or float("nan")
+        return {
+            "pages_per_s": round(self.pages / wall, 2),
+            "chunks_per_s": round(self.chunks / wall, 2),
+            "embeddings_per_s": round(self.embeddings / wall, 2),
+        }
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), **self.rates(), "verified": self.verified}
+
+    def print(self):
+        rates = self.rates()
+        print(f"\n=== Ingestion report ({self.mode}, {self.workers} workers) ===")
+        print(
+            f"documents   {self.documents} ({len(self.failed_documents)} failed, "
+            f"{self.skipped_documents} unchanged, {self.removed_documents} removed, "
+            f"{self.cached_parses} parsed from cache)"
+        )
+        print(f"pages       {self.pages:>8}   {rates['pages_per_s']:>10} pages/s")
+        print(f"chunks      {self.chunks:>8}   {rates['chunks_per_s']:>10} chunks/s")
+        print(f"            {self.unchanged_chunks} unchanged, {self.deleted_points} points deleted")
+        print(f"embeddings  {self.embeddings:>8}   {rates['embeddings_per_s']:>10} embeddings/s")
+        print(
+            f"requests    {self.embedding_requests} embedding, {self.upsert_requests} upsert"
+        )
+        print(
+            f"stage time  parse {self.parse_seconds:.1f}s (all workers), "
+            f"embed {self.embed_seconds:.1f}s, upsert {self.upsert_seconds:.1f}s, "
+            f"wall {self.wall_seconds:.1f}s"
+        )
+        print(f"peak memory {self.peak_rss_mb:.0f} MB, parser workers {self.peak_worker_rss_mb:.0f} MB")
+        if self.resumed_chunks:
+            print(f"resumed     {self.resumed_chunks} chunks committed by the interrupted run")
+        if self.points is not None:
+            print(
+                f"verify      {self.points} points in the collection, {self.expected_points} chunks "
+                f"in the manifest: {'OK' if self.verified else 'MISMATCH'}"
+            )
+        for source in self.failed_documents:
+            print(f"failed      {source}")
+
+
+# --- parsing (runs in the worker processes) ---------------------------------
+
+_parser = None
+_splitter = None
+_parse_cache = None
+
+# Chunking settings, recorded per file in the manifest: changing them re-splits
+# every file (from the parse cache)
+SPLITTER_VERSION = f"NodeSplitter(max_char={CHUNK_MAX_CHARS})"
+
+
+def _make_parser():
+    # choose between Docling, Azure or TextParser to parse plain text
+    #
+    # LLMCaptioner(client=OpenAIClient(api_key="YOUR_API_KEY")) can be applied to
+    # the parsed nodes if you want to caption the media
+    return DoclingParser()
+
+
+# Key of the cached parses: update it together with _make_parser
+PARSER_VERSION = parser_version(DoclingParser)
+
+
+def _parse(path: str, file_hash: str, reparse: bool, cache_dir: Path) -> tuple[Node, bool]:
+    """
+    Node tree of a file, from the parse cache in `cache_dir` when possible.
+    Docling is only loaded by the processes that actually parse.
+
+    Returns:
+        (node, whether it came from the cache)
+    """
+    global _parser, _parse_cache
+    if PARSE_CACHE_ENABLED and (_parse_cache is None or _parse_cache.root != Path(cache_dir)):
+        _parse_cache = ParseCache(cache_dir, PARSER_VERSION)
+
+    if _parse_cache is not None and not reparse:
+        node = _parse_cache.get(file_hash)
+        if node is not None:
+            return node, True
+
+    if _parser is None:
+        _parser = _make_parser()
+    node = _parser.parse(path)
+    if _parse_cache is not None:
+        try:
+            _parse_cache.put(file_hash, node)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Could not cache the parse of {path}: {str(e)}")
+    return node, False
+
+
+def _count_pages(node: Node) -> int:
+    """PAGE nodes of the document tree, else distinct page numbers in the metadata."""
+    pages, page_numbers = 0, set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.node_type == NodeType.PAGE:
+            pages += 1
+        page_no = current.metadata.get("page_no") or current.metadata.get("page")
+        if isinstance(page_no, int):
+            page_numbers.add(page_no)
+        stack.extend(current.children)
+    return pages or len(page_numbers) or 1
+
+
+def parse_document(
+    path: str,
+    file_hash: str | None = None,
+    reparse: bool = False,
+    parse_cache_dir: Path = PARSE_CACHE_DIR,
+) -> ParsedDocument:
+    """
+    Parse and split one file (Docling is loaded once per worker process).
+
+    Chunk ids are derived from the source and the chunk text, so re-parsing an
+    unchanged document yields the same point ids.
+
+    Args:
+        path: File to ingest
+        file_hash: sha256 of the file, if already known (key of the parse cache)
+        reparse: Parse with Docling even if the parse cache has the file
+        parse_cache_dir: Parse cache of the tenant (Tenant.parse_cache_dir)
+    """
+    global _splitter
+    if _splitter is None:
+        _splitter = NodeSplitter(max_char=CHUNK_MAX_CHARS)
+
+    start = time.perf_counter()
+    file_hash = file_hash or file_sha256(Path(path))
+    node, cached = _parse(path, file_hash, reparse, parse_cache_dir)
+    chunks = _splitter.split(node)
+    for position, chunk in enumerate(chunks):
+        chunk.metadata["source"] = path
+        # Position in the document: the context packer merges consecutive chunks
+        chunk.metadata["chunk_index"] = position
+    return ParsedDocument(
+        source=path,
+        file_hash=file_hash,
+        chunks=chunks,
+        chunk_hashes=assign_chunk_ids(chunks, path),
+        pages=_count_pages(node),
+        parse_seconds=time.perf_counter() - start,
+        cached=cached,
+    )
+
+
+# --- embedding and upsert ----------------------------------------------------
+
+def embed_chunks(chunks: list[Chunk]) -> list[Chunk]:
+    """Embed a batch of chunks (from any number of documents) with one request."""
+    vectors = _retry(
+        embedder_client.embed, [c.text for c in chunks], EMBEDDING_MODEL, what="embedding request"
+    )
+    for chunk, vector in zip(chunks, vectors):
+        chunk.embeddings.append(DenseEmbedding(name=VECTOR_NAME, vector=vector))
+    return chunks
+
+
+def upsert_chunks(
+    chunks: list[Chunk],
+    collection_name: str,
+    batch_size: int = INGESTION_UPSERT_BATCH_SIZE,
+    checkpoint: IngestionCheckpoint | None = None,
+) -> int:
+    """
+    Bulk upsert (QdrantVectorstore.add sends one request per point).
+    Each request is recorded in the checkpoint once Qdrant has applied it.
+
+    Returns:
+        Number of upsert requests sent
+    """
+    client = vectorstore.get_client()
+    requests = 0
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i : i + batch_size]
+        points = [
+            models.PointStruct(
+                id=str(chunk.id),
+                vector={VECTOR_NAME: chunk.embeddings[-1].vector},
+                payload={"text": chunk.text, **chunk.metadata},
+            )
+            for chunk in batch
+        ]
+        _retry(client.upsert, collection_name=collection_name, points=points, wait=True, what="upsert")
+        if checkpoint is not None:
+            checkpoint.commit(batch)
+        requests += 1
+    return requests
+
+
+def _retry(fn, *args, **kwargs):
+    return retry(
+        fn, *args, attempts=INGESTION_RETRIES, backoff=INGESTION_RETRY_BACKOFF_SECONDS, **kwargs
+    )
+
+
+def delete_points(ids: list[str], collection_name: str) -> int:
+    if ids:
+        _retry(
+            vectorstore.get_client().delete,
+            what="delete",
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=list(ids)),
+            wait=True,
+        )
+    return len(ids)
+
+
+def delete_source(source: str, collection_name: str) -> int:
+    """Delete every point of one file, by the `source` payload field."""
+    client = vectorstore.get_client()
+    source_filter = models.Filter(
+        must=[models.FieldCondition(key="source", match=models.MatchValue(value=source))]
+    )
+    count = _retry(
+        client.count, collection_name=collection_name, count_filter=source_filter, exact=True, what="count"
+    ).count
+    if count:
+        _retry(
+            client.delete,
+            what="delete",
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(filter=source_filter),
+            wait=True,
+        )
+    return count
+
+
+def count_points(collection_name: str) -> int:
+    return _retry(
+        vectorstore.get_client().count, collection_name=collection_name, exact=True, what="count"
+    ).count
+
+
+def collection_dimensions(collection_name: str) -> int | None:
+    if isinstance(vectorstore, LocalVectorstore):
+        return vectorstore.dimensions(collection_name)
+    vectors = vectorstore.get_client().get_collection(collection_name).config.params.vectors
+    return vectors[VECTOR_NAME].size if isinstance(vectors, dict) else vectors.size
+
+
+# --- incremental ingestion -------------------------------------------------
+
+def plan_ingestion(
+    files: list[Path], manifest: IngestionManifest, lexical: LexicalIndex | None = None
+) -> IngestionPlan:
+    file_hashes = {str(path): file_sha256(path) for path in files}
+    indexed = set(manifest.files)
+    # A file missing from the BM25 index is parsed again to add it (its chunks
+    # are in the manifest, so nothing is re-embedded)
+    lexical_sources = lexical.sources() if lexical is not None else None
+    if lexical_sources is not None:
+        indexed |= lexical_sources
+
+    def is_unchanged(path: Path) -> bool:
+        source = str(path)
+        if lexical_sources is not None and source not in lexical_sources:
+            return False
+        return manifest.is_unchanged(source, file_hashes[source], SPLITTER_VERSION)
+
+    changed = [p for p in files if not is_unchanged(p)]
+    unchanged = [p for p in files if is_unchanged(p)]
+    removed = sorted(indexed - set(file_hashes))
+    return IngestionPlan(changed=changed, unchanged=unchanged, removed=removed, file_hashes=file_hashes)
+
+
+def remove_documents(
+    sources: list[str],
+    collection_name: str,
+    manifest: IngestionManifest,
+    report: IngestionReport,
+    lexical: LexicalIndex | None = None,
+):
+    for source in sources:
+        print("Removed:", source)
+        report.deleted_points += delete_source(source, collection_name)
+        report.removed_documents += 1
+        manifest.forget(source)
+        if lexical is not None:
+            lexical.remove_source(source)
+
+
+def diff_document(
+    document: ParsedDocument,
+    collection_name: str,
+    manifest: IngestionManifest | None,
+    report: IngestionReport,
+    lexical: LexicalIndex | None = None,
+) -> list[Chunk]:
+    """
+    Compare a parsed document with the manifest: delete the points of the chunks
+    that disappeared and return the chunks that still have to be embedded.
+
+    Without a manifest every chunk is returned (full ingestion). The BM25 index,
+    if given, gets all the chunks of the document: it needs no embeddings.
+    """
+    if lexical is not None:
+        lexical.replace_source(document.source, document.chunks)
+    if manifest is None:
+        return document.chunks
+
+    previous = manifest.chunk_ids(document.source)
+    if previous:
+        report.deleted_points += delete_points(
+            sorted(previous - set(document.chunk_hashes)), collection_name
+        )
+    else:
+        # Not in the manifest: drop whatever an earlier (non-incremental) run left behind
+        report.deleted_points += delete_source(document.source, collection_name)
+
+    new_chunks = [c for c in document.chunks if c.id not in previous]
+    report.unchanged_chunks += len(document.chunks) - len(new_chunks)
+    # Recorded before the upserts complete: if one fails the manifest is not
+    # saved, and the deterministic ids make the next run redo the same work
+    manifest.record(document.source, document.file_hash, document.chunk_hashes, SPLITTER_VERSION)
+    return new_chunks
+
+
+# --- drivers ---------------------------------------------------------------
+
+def list_documents(data_dir: Path) -> list[Path]:
+    return sorted(data_dir.rglob("*.pdf"))
+
+
+def ingest_serial(
+    files: list[Path],
+    manifest: IngestionManifest | None = None,
+    file_hashes: dict[str, str] | None = None,
+    report: IngestionReport | None = None,
+    lexical: LexicalIndex | None = None,
+    reparse: bool = False,
+    checkpoint: IngestionCheckpoint | None = None,
+    collection_name: str = COLLECTION_NAME,
+    parse_cache_dir: Path = PARSE_CACHE_DIR,
+) -> IngestionReport:
+    """
+    Previous behaviour, kept as a baseline: one document at a time in this
+    process, one embedding request per document, one upsert per point
+    (what IngestionPipeline + ChunkEmbedder + QdrantVectorstore.add do).
+    """
+    report = report or IngestionReport(mode="serial")
+    file_hashes = file_hashes or {}
+    start = time.perf_counter()
+    for pdf in files:
+        print("Ingestion:", pdf)
+        document = parse_document(str(pdf), file_hashes.get(str(pdf)), reparse, parse_cache_dir)
+        report.documents += 1
+        report.cached_parses += document.cached
+        report.pages += document.pages
+        report.chunks += len(document.chunks)
+        report.parse_seconds += document.parse_seconds
+        chunks = diff_document(document, collection_name, manifest, report, lexical)
+        if not chunks:
+            continue
+
+        t0 = time.perf_counter()
+        embed_chunks(chunks)
+        t1 = time.perf_counter()
+        _retry(vectorstore.add, chunks, collection_name, what="upsert")
+        if checkpoint is not None:
+            checkpoint.commit(chunks)
+        t2 = time.perf_counter()
+        report.embeddings += len(chunks)
+        report.embedding_requests += 1
+        report.upsert_requests += len(chunks)
+        report.embed_seconds += t1 - t0
+        report.upsert_seconds += t2 - t1
+
+    report.wall_seconds = time.perf_counter() - start
+    return report
+
+
+def ingest_parallel(
+    files: list[Path],
+    workers: int = INGESTION_WORKERS,
+    embed_batch_size: int = INGESTION_EMBED_BATCH_SIZE,
+    embed_concurrency: int = INGESTION_EMBED_CONCURRENCY,
+    upsert_batch_size: int = INGESTION_UPSERT_BATCH_SIZE,
+    manifest: IngestionManifest | None = None,
+    file_hashes: dict[str, str] | None = None,
+    report: IngestionReport | None = None,
+    lexical: LexicalIndex | None = None,
+    reparse: bool = False,
+    checkpoint: IngestionCheckpoint | None = None,
+    collection_name: str = COLLECTION_NAME,
+    parse_cache_dir: Path = PARSE_CACHE_DIR,
+) -> IngestionReport:
+    """
+    Parallel ingestion, with the three stages overlapping:
+
+    - parsing + splitting in a pool of `workers` processes
+    - chunks of all documents pooled into embedding requests of `embed_batch_size`,
+      `embed_concurrency` requests in flight
+    - each embedded batch upserted in bulk, `upsert_batch_size` points per request
+
+    With a manifest only the chunks it does not know yet are embedded and upserted.
+    With a lexical index every parsed chunk is also added to it.
+    """
+    report = report or IngestionReport(mode="parallel", workers=workers)
+    file_hashes = file_hashes or {}
+    lock = threading.Lock()
+
+    def embed_and_upsert(batch: list[Chunk]):
+        t0 = time.perf_counter()
+        embed_chunks(batch)
+        t1 = time.perf_counter()
+        requests = upsert_chunks(batch, collection_name, upsert_batch_size, checkpoint)
+        t2 = time.perf_counter()
+        with lock:
+            report.embeddings += len(batch)
+            report.embedding_requests += 1
+            report.upsert_requests += requests
+            report.embed_seconds += t1 - t0
+            report.upsert_seconds += t2 - t1
+
+    start = time.perf_counter()
+    buffer: list[Chunk] = []
+    in_flight = set()
+
+    with ProcessPoolExecutor(max_workers=workers) as parse_pool, ThreadPoolExecutor(
+        max_workers=embed_concurrency, thread_name_prefix="embed"
+    ) as embed_pool:
+
+        def submit(batch):
+            # Back-pressure: never more than 2x the concurrency of batches queued
+            while len(in_flight) >= 2 * embed_concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    future.result()
+            in_flight.add(embed_pool.submit(embed_and_upsert, batch))
+
+        futures = {
+            parse_pool.submit(
+                parse_document, str(path), file_hashes.get(str(path)), reparse, parse_cache_dir
+            ): path
+            for path in files
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                document = future.result()
+            except Exception as e:
+                logger.error(f"Failed to parse {path}: {str(e)}")
+                report.failed_documents.append(str(path))
+                continue
+
+            print(
+                f"Parsed: {path} ({document.pages} pages, {len(document.chunks)} chunks, "
+                f"{document.parse_seconds:.1f}s{', cached' if document.cached else ''})"
+            )
+            report.documents += 1
+            report.cached_parses += document.cached
+            report.pages += document.pages
+            report.chunks += len(document.chunks)
+            report.parse_seconds += document.parse_seconds
+
+            buffer.extend(
+                diff_document(document, collection_name, manifest, report, lexical)
+            )
+            while len(buffer) >= embed_batch_size:
+                submit(buffer[:embed_batch_size])
+                buffer = buffer[embed_batch_size:]
+
+        if buffer:
+            submit(buffer)
+        for future in in_flight:
+            future.result()
+
+    report.wall_seconds = time.perf_counter() - start
+    return report
+
+
+# Stage-to-stage hand-off of ingest_streaming: end of input
+_END = object()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up when another stage failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Blocking get that returns _END when another stage failed."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def ingest_streaming(
+    files: list[Path],
+    workers: int = INGESTION_WORKERS,
+    embed_batch_size: int = INGESTION_EMBED_BATCH_SIZE,
+    embed_concurrency: int = INGESTION_EMBED_CONCURRENCY,
+    upsert_batch_size: int = INGESTION_UPSERT_BATCH_SIZE,
+    queue_size: int = INGESTION_QUEUE_SIZE,
+    manifest: IngestionManifest | None = None,
+    file_hashes: dict[str, str] | None = None,
+    report: IngestionReport | None = None,
+    lexical: LexicalIndex | None = None,
+    reparse: bool = False,
+    checkpoint: IngestionCheckpoint | None = None,
+    collection_name: str = COLLECTION_NAME,
+    parse_cache_dir: Path = PARSE_CACHE_DIR,
+) -> IngestionReport:
+    """
+    Streaming ingestion: the stages run concurrently, connected by bounded queues.
+
+    parse + split (`workers` processes, at most 2 documents each in flight)
+      -> chunk batches of `embed_batch_size` (queue of `queue_size` batches)
+      -> embedding (`embed_concurrency` threads)
+      -> embedded batches (queue of `queue_size` batches)
+      -> upsert (one thread, `upsert_batch_size` points per request)
+
+    A full queue blocks the stage before it, so the memory held does not grow
+    with the corpus: at most about (2 * workers documents + (2 * queue_size +
+    embed_concurrency) batches) at any time. Chunks are dropped once upserted.
+    """
+    report = report or IngestionReport(mode="streaming", workers=workers)
+    file_hashes = file_hashes or {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    errors: list[Exception] = []
+    chunk_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    vector_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+    def fail(e: Exception):
+        with lock:
+            errors.append(e)
+        stop.set()
+
+    def embed_stage():
+        try:
+            while True:
+                batch = _get(chunk_queue, stop)
+                if batch is _END:
+                    return
+                t0 = time.perf_counter()
+                embed_chunks(batch)
+                with lock:
+                    report.embeddings += len(batch)
+                    report.embedding_requests += 1
+                    report.embed_seconds += time.perf_counter() - t0
+                if not _put(vector_queue, batch, stop):
+                    return
+        except Exception as e:
+            logger.error(f"Embedding failed: {str(e)}")
+            fail(e)
+
+    def store_stage():
+        try:
+            while True:
+                batch = _get(vector_queue, stop)
+                if batch is _END:
+                    return
+                t0 = time.perf_counter()
+                requests = upsert_chunks(batch, collection_name, upsert_batch_size, checkpoint)
+                with lock:
+                    report.upsert_requests += requests
+                    report.upsert_seconds += time.perf_counter() - t0
+        except Exception as e:
+            logger.error(f"Upsert failed: {str(e)}")
+            fail(e)
+
+    start = time.perf_counter()
+    embedders = [
+        threading.Thread(target=embed_stage, name=f"embed-{i}", daemon=True)
+        for i in range(embed_concurrency)
+    ]
+    store = threading.Thread(target=store_stage, name="upsert", daemon=True)
+    for thread in embedders + [store]:
+        thread.start()
+
+    try:
+        buffer: list[Chunk] = []
+        pending = iter(files)
+        in_flight = {}
+        with ProcessPoolExecutor(max_workers=workers) as parse_pool:
+
+            def submit_next():
+                path = next(pending, None)
+                if path is not None:
+                    future = parse_pool.submit(
+                        parse_document, str(path), file_hashes.get(str(path)), reparse, parse_cache_dir
+                    )
+                    in_flight[future] = path
+
+            for _ in range(2 * workers):
+                submit_next()
+
+            while in_flight and not stop.is_set():
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        document = future.result()
+                    except Exception as e:
+                        logger.error(f"Failed to parse {path}: {str(e)}")
+                        report.failed_documents.append(str(path))
+                        continue
+
+                    print(
+                        f"Parsed: {path} ({document.pages} pages, {len(document.chunks)} chunks, "
+                        f"{document.parse_seconds:.1f}s{', cached' if document.cached else ''})"
+                    )
+                    report.documents += 1
+                    report.cached_parses += document.cached
+                    report.pages += document.pages
+                    report.chunks += len(document.chunks)
+                    report.parse_seconds += document.parse_seconds
+
+                    buffer.extend(
+                        diff_document(document, collection_name, manifest, report, lexical)
+                    )
+                    while len(buffer) >= embed_batch_size:
+                        # Blocks while the embedders are behind
+                        _put(chunk_queue, buffer[:embed_batch_size], stop)
+                        buffer = buffer[embed_batch_size:]
+
+            if stop.is_set():
+                for future in in_flight:
+                    future.cancel()
+        if buffer:
+            _put(chunk_queue, buffer, stop)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for _ in embedders:
+            _put(chunk_queue, _END, stop)
+        for thread in embedders:
+            thread.join()
+        _put(vector_queue, _END, stop)
+        store.join()
+
+    if errors:
+        raise errors[0]
+    report.wall_seconds = time.perf_counter() - start
+    return report
+
+
+def peak_memory_mb() -> tuple[float, float]:
+    """Peak RSS of this process and of the largest child process (0 where unsupported)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0, 0.0
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    unit = 1 / 2**20 if sys.platform == "darwin" else 1 / 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest the PDF corpus into Qdrant")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--mode", choices=["streaming", "parallel", "serial"], default="streaming")
+    parser.add_argument("--workers", type=int, default=INGESTION_WORKERS, help="parser processes")
+    parser.add_argument("--embed-batch-size", type=int, default=INGESTION_EMBED_BATCH_SIZE)
+    parser.add_argument("--embed-concurrency", type=int, default=INGESTION_EMBED_CONCURRENCY)
+    parser.add_argument("--upsert-batch-size", type=int, default=INGESTION_UPSERT_BATCH_SIZE)
+    parser.add_argument(
+        "--queue-size", type=int, default=INGESTION_QUEUE_SIZE, help="batches buffered between stages"
+    )
+    parser.add_argument("--report", type=Path, help="also write the throughput report as JSON")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the manifest and re-ingest every file (the manifest is rewritten)",
+    )
+    parser.add_argument(
+        "--tenant",
+        help="ingest into the collection of this tenant (tenants.py); its manifest, "
+        "BM25 index and checkpoint paths are the defaults of the flags below",
+    )
+    parser.add_argument("--manifest", type=Path, help=f"default: {INGESTION_MANIFEST_PATH}")
+    parser.add_argument(
+        "--reparse",
+        action="store_true",
+        help="parse with Docling even the files in the parse cache (the cache is rewritten)",
+    )
+    parser.add_argument("--lexical-index", type=Path, help=f"default: {LEXICAL_INDEX_PATH}")
+    parser.add_argument("--checkpoint", type=Path, help=f"default: {INGESTION_CHECKPOINT_PATH}")
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard the checkpoint of an interrupted run instead of resuming it",
+    )
+    parser.add_argument(
+        "--no-faq",
+        action="store_true",
+        help="do not rebuild the FAQ index of the tenant after the ingestion (faq_index.py)",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=INGESTION_PROGRESS_SECONDS,
+        help="seconds between progress lines (0: none)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Without --tenant: COLLECTION_NAME and the paths of config.py
+    tenant = tenant_registry.default
+    if args.tenant:
+        try:
+            tenant = tenant_registry.get(args.tenant)
+        except UnknownTenantError:
+            parser.error(f"unknown tenant {args.tenant!r}: register it in {tenant_registry.path}")
+    collection_name = tenant.collection_name
+    args.manifest = args.manifest or tenant.manifest_path
+    args.lexical_index = args.lexical_index or tenant.lexical_index_path
+    args.checkpoint = args.checkpoint or tenant.checkpoint_path
+    print(f"Ingesting tenant {tenant.id} into collection {collection_name}")
+
+    if VECTORSTORE_BACKEND == "memory":
+        parser.error('the "memory" backend is read-only: ingest with VECTORSTORE_BACKEND=qdrant or local')
+
+    vectorstore.create_collection(
+        collection_name,
+        vector_config=[VectorConfig(name=VECTOR_NAME, dimensions=EMBEDDING_DIMENSIONS)],
+    )
+    # Deleting the points of a file filters on `source`
+    vectorstore.get_client().create_payload_index(
+        collection_name=collection_name,
+        field_name="source",
+        field_schema=models.PayloadSchemaType.KEYWORD,
+    )
+
+    # Shortened embeddings cannot be mixed with the existing ones
+    dimensions = collection_dimensions(collection_name)
+    if dimensions not in (None, EMBEDDING_DIMENSIONS):
+        parser.error(
+            f"collection {collection_name} holds {dimensions}-dim vectors but EMBEDDING_DIMENSIONS "
+            f"is {EMBEDDING_DIMENSIONS}: set a new COLLECTION_NAME to ingest at the new size"
+        )
+    if isinstance(vectorstore, QdrantVectorstore):
+        apply_qdrant_quantization(vectorstore, collection_name, VECTOR_NAME)
+
+    manifest = IngestionManifest(args.manifest, collection_name)
+    report = IngestionReport(mode=args.mode, workers=args.workers if args.mode != "serial" else 1)
+
+    # Chunks upserted by an interrupted run are merged into the manifest and not
+    # redone. The local index is only written by flush() at the end of a run, so
+    # there is nothing to resume with it.
+    checkpoint = None
+    if not isinstance(vectorstore, LocalVectorstore):
+        checkpoint = IngestionCheckpoint(args.checkpoint, collection_name)
+        if args.restart or args.full:
+            checkpoint.clear()
+        elif checkpoint.committed:
+            report.resumed_chunks = checkpoint.resume_into(manifest)
+            print(
+                f"Resuming an interrupted run: {report.resumed_chunks} chunks of "
+                f"{len(checkpoint.committed)} documents already committed"
+            )
+
+    # BM25 index for hybrid retrieval, built from the same chunks
+    lexical = LexicalIndex(args.lexical_index, collection_name)
+    plan = plan_ingestion(list_documents(args.data_dir), manifest, lexical)
+
+    remove_documents(plan.removed, collection_name, manifest, report, lexical)
+    files = plan.changed
+    if args.full:
+        files = sorted(plan.changed + plan.unchanged)
+        for path in files:
+            # Forgotten files are re-embedded in full, their old points deleted first
+            manifest.forget(str(path))
+    else:
+        report.skipped_documents = len(plan.unchanged)
+    print(
+        f"{len(files)} documents to ingest, {report.skipped_documents} unchanged, "
+        f"{len(plan.removed)} removed"
+    )
+
+    with ProgressReporter(report, len(files), checkpoint, args.progress_interval):
+        run_ingestion(args, tenant, files, plan, manifest, report, lexical, checkpoint)
+    if isinstance(vectorstore, LocalVectorstore):
+        # Rebuild the IVF index and publish it to the running backends
+        vectorstore.flush()
+    lexical.save()
+    manifest.save()
+    if checkpoint is not None:
+        # Everything committed is in the manifest now
+        checkpoint.clear()
+    if PARSE_CACHE_ENABLED:
+        # Only the current version of the files in the corpus is worth keeping;
+        # the cache is the tenant's own, so other tenants' parses are left alone
+        ParseCache(tenant.parse_cache_dir, PARSER_VERSION).prune(set(plan.file_hashes.values()))
+
+    # Invalidate the answer caches of the running backends
+    if files or plan.removed:
+        write_collection_version(tenant.collection_version_file, collection_name)
+
+    # Every chunk of the manifest must be exactly one point of the collection
+    report.expected_points = sum(len(entry["chunks"]) for entry in manifest.files.values())
+    report.points = count_points(collection_name)
+
+    report.peak_rss_mb, report.peak_worker_rss_mb = peak_memory_mb()
+    report.print()
+    if args.report:
+        args.report.write_text(json.dumps(report.to_dict(), indent=2))
+    if not report.verified:
+        logger.error(
+            f"Verification failed: {report.points} points in {collection_name}, "
+            f"{report.expected_points} chunks in the manifest"
+        )
+        sys.exit(1)
+
+    # The FAQ answers of the previous corpus are stale (no longer served): answer
+    # the canonical questions again from the new one
+    if (files or plan.removed) and FAQ_ENABLED and FAQ_AUTO_REBUILD and not args.no_faq:
+        rebuild_faq_index(tenant)
+
+
+def rebuild_faq_index(tenant):
+    """Rebuild the FAQ index of a tenant; a failure leaves the stale index unserved."""
+    print(f"Rebuilding the FAQ index of tenant {tenant.id}")
+    try:
+        faq_report = build_faq_index(tenant)
+    except Exception as e:
+        logger.error(
+            f"FAQ index rebuild failed: {str(e)} "
+            f"(retry with: python faq_index.py --tenant {tenant.id})"
+        )
+        return
+    print(
+        f"faq         {faq_report['entries']:>8}   entries ({faq_report['vetted']} vetted, "
+        f"{faq_report['generated']} generated, {faq_report['failed']} failed) "
+        f"in {faq_report['seconds']} s"
+    )
+
+
+def run_ingestion(args, tenant, files, plan, manifest, report, lexical, checkpoint):
+    """Run the driver selected by --mode on the files to ingest, into the collection of `tenant`."""
+    if args.mode == "serial":
+        ingest_serial(
+            files,
+            manifest,
+            plan.file_hashes,
+            report,
+            lexical,
+            args.reparse,
+            checkpoint,
+            collection_name=tenant.collection_name,
+            parse_cache_dir=tenant.parse_cache_dir,
+        )
+    elif args.mode == "streaming":
+        ingest_streaming(
+            files,
+            workers=args.workers,
+            embed_batch_size=args.embed_batch_size,
+            embed_concurrency=args.embed_concurrency,
+            upsert_batch_size=args.upsert_batch_size,
+            queue_size=args.queue_size,
+            manifest=manifest,
+            file_hashes=plan.file_hashes,
+            report=report,
+            lexical=lexical,
+            reparse=args.reparse,
+            checkpoint=checkpoint,
+            collection_name=tenant.collection_name,
+            parse_cache_dir=tenant.parse_cache_dir,
+        )
+    else:
+        ingest_parallel(
+            files,
+            workers=args.workers,
+            embed_batch_size=args.embed_batch_size,
+            embed_concurrency=args.embed_concurrency,
+            upsert_batch_size=args.upsert_batch_size,
+            manifest=manifest,
+            file_hashes=plan.file_hashes,
+            report=report,
+            lexical=lexical,
+            reparse=args.reparse,
+            checkpoint=checkpoint,
+            collection_name=tenant.collection_name,
+            parse_cache_dir=tenant.parse_cache_dir,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# lexical_index.py
+# BM25 inverted index over the chunks of the collection, and reciprocal rank fusion.
+#
+# Course codes, office names and form names are retrieved poorly by embeddings
+# but exactly by their terms. The ingestion script keeps this index in sync with
+# the vector store (same chunks, same ids) and saves it as JSON; the API loads
+# it and reloads it when the file changes, in a background thread (searches keep
+# using the previous index until the new one is built).
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from heapq import nlargest
+from pathlib import Path
+
+from datapizza.type import Chunk
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# English and Italian function words: they match everything and rank nothing
+STOPWORDS = frozenset("""
+a an and are as at be by can could do does for from has have how i in is it its
+me my of on or our should so that the their there these this to was we what when
+where which who why will with would you your
+al alla alle allo agli ai che come con cosa da dal dalla dei del della delle dello
+di dove e gli ho i il in la le lo ma mi nel nella non o per perche perché quale
+quando se si sono su sul sulla un una uno
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        token
+        for token in _TOKEN.findall(text.lower())
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+class _Document:
+    __slots__ = ("chunk", "tf", "length")
+
+    def __init__(self, chunk: Chunk):
+        self.chunk = chunk
+        self.tf = Counter(tokenize(chunk.text))
+        self.length = sum(self.tf.values())
+
+
+class LexicalIndex:
+    """
+    BM25 index of the chunks of one collection.
+
+    Args:
+        path: JSON file of the index (chunks only: the postings are rebuilt on load)
+        collection_name: Collection the index describes; a file written for
+            another collection is ignored
+        k1, b: BM25 parameters
+        check_interval: Minimum seconds between two file checks of
+            reload_in_background
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        collection_name: str,
+        k1: float = 1.2,
+        b: float = 0.75,
+        check_interval: float = 1.0,
+    ):
+        self.path = Path(path)
+        self.collection_name = collection_name
+        self.k1 = k1
+        self.b = b
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._docs: dict[str, _Document] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._total_length = 0
+        self._mtime_ns = None
+        self._last_check = 0.0
+        self._reloading = False
+        self.reload_if_changed()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # --- persistence -------------------------------------------------------
+
+    def reload_if_changed(self):
+        """Load the file if it was written since the last load (one stat call)."""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        chunks = []
+        if data.get("version") == INDEX_VERSION and data.get("collection") == self.collection_name:
+            chunks = [
+                Chunk(id=row["id"], text=row["text"], metadata=row.get("metadata", {}))
+                for row in data.get("chunks", [])
+            ]
+        docs, postings, total_length = {}, {}, 0
+        for chunk in chunks:
+            doc = _Document(chunk)
+            docs[chunk.id] = doc
+            total_length += doc.length
+            for term in doc.tf:
+                postings.setdefault(term, set()).add(chunk.id)
+        with self._lock:
+            self._docs, self._postings, self._total_length = docs, postings, total_length
+            self._mtime_ns = mtime_ns
+
+    def reload_in_background(self):
+        """
+        Request-path variant of reload_if_changed: the file is stat'ed at most once
+        every `check_interval` seconds, and a changed file is loaded in a daemon
+        thread while the searches keep using the current index.
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if mtime_ns == self._mtime_ns or self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name="lexical-index-reload", daemon=True).start()
+
+    def _reload(self):
+        try:
+            self.reload_if_changed()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error reloading lexical index {self.path}: {str(e)}")
+        finally:
+            self._reloading = False
+
+    def save(self):
+        # Write-then-rename: the API never reads a half-written index
+        with self._lock:
+            rows = [
+                {"id": doc.chunk.id, "text": doc.chunk.text, "metadata": doc.chunk.metadata}
+                for doc in self._docs.values()
+            ]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(
+            json.dumps({"version": INDEX_VERSION, "collection": self.collection_name, "chunks": rows}),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+        self._mtime_ns = os.stat(self.path).st_mtime_ns
+
+    # --- updates (ingestion) -----------------------------------------------
+
+    def sources(self) -> set[str]:
+        with self._lock:
+            return {doc.chunk.metadata.get("source") for doc in self._docs.values()}
+
+    def replace_source(self, source: str, chunks: list[Chunk]):
+        """Index the chunks of one file, dropping the ones it had before."""
+        with self._lock:
+            self._remove(lambda doc: doc.chunk.metadata.get("source") == source)
+            for chunk in chunks:
+                self._add(Chunk(id=str(chunk.id), text=chunk.text, metadata=dict(chunk.metadata)))
+
+    def remove_source(self, source: str):
+        with self._lock:
+            self._remove(lambda doc: doc.chunk.metadata.get("source") == source)
+
+    def _add(self, chunk: Chunk):
+        if chunk.id in self._docs:
+            self._remove_ids([chunk.id])
+        doc = _Document(chunk)
+        self._docs[chunk.id] = doc
+        self._total_length += doc.length
+        for term in doc.tf:
+            self._postings.setdefault(term, set()).add(chunk.id)
+
+    def _remove(self, predicate):
+        self._remove_ids([i for i, doc in self._docs.items() if predicate(doc)])
+
+    def _remove_ids(self, chunk_ids: list[str]):
+        for chunk_id in chunk_ids:
+            doc = self._docs.pop(chunk_id)
+            self._total_length -= doc.length
+            for term in doc.tf:
+                ids = self._postings.get(term)
+                if ids is not None:
+                    ids.discard(chunk_id)
+                    if not ids:
+                        del self._postings[term]
+
+    # --- search --------------------------------------------------------------
+
+    def search(self, query: str, k: int = 10) -> list[tuple[Chunk, float]]:
+        """Top-k chunks by BM25 score (chunks sharing no term with the query are left out)."""
+        terms = tokenize(query)
+        with self._lock:
+            docs, postings = self._docs, self._postings
+            n_docs = len(docs)
+            if not n_docs or not terms:
+                return []
+            avg_length = self._total_length / n_docs
+
+            scores: dict[str, float] = {}
+            for term in set(terms):
+                ids = postings.get(term)
+                if not ids:
+                    continue
+                idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+                for chunk_id in ids:
+                    doc = docs[chunk_id]
+                    tf = doc.tf[term]
+                    norm = self.k1 * (1 - self.b + self.b * doc.length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            best = nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(docs[chunk_id].chunk, score) for chunk_id, score in best]
+
+    def covers(self, query: str, chunk: Chunk) -> bool:
+        """True when every query term occurs in the chunk."""
+        with self._lock:
+            doc = self._docs.get(chunk.id)
+        terms = tokenize(query)
+        return doc is not None and bool(terms) and all(term in doc.tf for term in terms)
+
+
+def reciprocal_rank_fusion(rankings: list[list[Chunk]], k: int, rrf_k: int = 60) -> list[Chunk]:
+    """
+    Merge ranked lists: each chunk scores sum(1 / (rrf_k + rank)) over the lists
+    it appears in. Only ranks are used, so BM25 and cosine scores need no calibration.
+    """
+    scores: dict[str, float] = {}
+    chunks: dict[str, Chunk] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            chunk_id = str(chunk.id)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+            chunks.setdefault(chunk_id, chunk)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [chunks[chunk_id] for chunk_id in best]
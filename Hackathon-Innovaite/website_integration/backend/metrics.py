@@ -0,0 +1,272 @@
+# metrics.py
+# Lightweight in-process metrics for the backend.
+#
+# - LatencyWindow: rolling latency window with percentile snapshots (JSON stats endpoints)
+# - Counter / Gauge / Histogram / Summary: Prometheus-style metrics rendered in the
+#   text exposition format by `render_metrics()` (served on GET /metrics)
+#
+# Kept dependency-free on purpose: prometheus_client has no quantile support for
+# summaries, and we want p50/p95/p99 per endpoint directly on /metrics.
+
+import math
+import threading
+from collections import deque
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyWindow:
+    """
+    Rolling window of latency observations with percentile snapshots.
+
+    Observations are in milliseconds for the JSON stats endpoints; the Summary
+    metric reuses the window with seconds.
+
+    Args:
+        size: Number of most recent observations kept for the percentiles
+    """
+
+    def __init__(self, size: int = 1000):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+
+    def observe(self, value_ms: float):
+        with self._lock:
+            self._values.append(value_ms)
+            self.count += 1
+            self.total += value_ms
+            self.last = value_ms
+
+    def quantiles(self, qs) -> list:
+        with self._lock:
+            values = sorted(self._values)
+        return [_percentile(values, q) for q in qs]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = sorted(self._values)
+            count, last = self.count, self.last
+        return {
+            "count": count,
+            "last_ms": _round(last),
+            "p50_ms": _round(_percentile(values, 0.50)),
+            "p95_ms": _round(_percentile(values, 0.95)),
+            "p99_ms": _round(_percentile(values, 0.99)),
+        }
+
+
+def _percentile(sorted_values: list, q: float) -> float | None:
+    if not sorted_values:
+        return None
+    # nearest-rank percentile
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+# --- Prometheus-style metrics -------------------------------------------------
+
+_registry: list = []
+_collectors: list = []
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _labels(self, key: tuple, extra: dict | None = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        return _format_labels(pairs)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self.samples(),
+        ]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., sum, count]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                lines.append(f"{self.name}_bucket{self._labels(key, {'le': _fmt(bound)})} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._labels(key, {'le': '+Inf'})} {state[-1]}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_fmt(state[-2])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {state[-1]}")
+        return lines
+
+
+class Summary(_Metric):
+    """Summary with p50/p95/p99 computed over a rolling window per label set."""
+
+    type_name = "summary"
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, name, documentation, labelnames=(), window: int = 2000):
+        super().__init__(name, documentation, labelnames)
+        self.window = window
+        self._values: dict[tuple, LatencyWindow] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            win = self._values.get(key)
+            if win is None:
+                win = self._values[key] = LatencyWindow(self.window)
+        win.observe(value)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        lines = []
+        for key, win in items:
+            for q, v in zip(self.QUANTILES, win.quantiles(self.QUANTILES)):
+                if v is not None:
+                    lines.append(f"{self.name}{self._labels(key, {'quantile': _fmt(q)})} {_fmt(v)}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_fmt(win.total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {win.count}")
+        return lines
+
+
+def register_collector(fn):
+    """
+    Register a scrape-time collector.
+
+    `fn()` returns a list of (name, type, documentation, [(labels_dict, value), ...]);
+    used to export counters that already live in other objects (caches, ...).
+    """
+    with _registry_lock:
+        _collectors.append(fn)
+    return fn
+
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+        collectors = list(_collectors)
+
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in collectors:
+        for name, type_name, documentation, samples in collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.items())} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(pairs) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value) -> str:
+    if value is None:
+        return "NaN"
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
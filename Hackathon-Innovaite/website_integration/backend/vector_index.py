@@ -0,0 +1,380 @@
+# vector_index.py
+# IVF (inverted file) index for cosine search, numpy only.
+#
+# The vectors are L2-normalized and clustered with spherical k-means; they are
+# stored grouped by cluster, so each inverted list is a contiguous slice of one
+# matrix. A query scores the centroids, then only the `nprobe` closest lists.
+#
+# On disk an index is three .npy files, loaded with mmap_mode="r": opening an
+# index is instantaneous and only the probed lists are paged in.
+#
+# Optionally the lists are scanned on compact codes instead of the float32
+# vectors: int8 (scalar quantization, 4x smaller) or binary (sign bits, 32x
+# smaller, Hamming distance). The best k * oversampling candidates are then
+# rescored with the full-precision vectors, of which only those rows are read.
+
+from pathlib import Path
+
+import numpy as np
+
+# Below this size an index has a single list, i.e. exact search
+MIN_VECTORS_PER_LIST = 1024
+
+VECTORS_FILE = "vectors.npy"
+CENTROIDS_FILE = "centroids.npy"
+OFFSETS_FILE = "offsets.npy"
+CODES_FILE = "codes.npy"
+SCALE_FILE = "scale.npy"
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def default_n_lists(n_vectors: int) -> int:
+    if n_vectors < 2 * MIN_VECTORS_PER_LIST:
+        return 1
+    return int(np.sqrt(n_vectors))
+
+
+def _popcount(codes: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(codes)
+    return _POPCOUNT[codes]
+
+
+def quantize(vectors: np.ndarray, quantization: str, scale: np.ndarray | None = None):
+    """
+    Compact codes of normalized vectors.
+
+    Returns:
+        (codes, scale): int8 codes and the per-dimension scale, or packed sign
+        bits (uint8) and None
+    """
+    if quantization == "int8":
+        if scale is None:
+            # Per-dimension range, clipped at the 99th percentile of a sample
+            sample = vectors[:: max(1, len(vectors) // 10000)]
+            scale = np.maximum(np.quantile(np.abs(sample), 0.99, axis=0), 1e-6).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scale * 127), -127, 127).astype(np.int8)
+        return codes, scale
+    if quantization == "binary":
+        return np.packbits(vectors > 0, axis=-1), None
+    raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 16384) -> np.ndarray:
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for i in range(0, len(vectors), batch_size):
+        assignment[i : i + batch_size] = np.argmax(vectors[i : i + batch_size] @ centroids.T, axis=1)
+    return assignment
+
+
+def _spherical_kmeans(
+    vectors: np.ndarray, n_lists: int, iterations: int, rng: np.random.Generator
+) -> np.ndarray:
+    # Trained on a sample: 256 points per list are plenty for the centroids
+    sample_size = min(len(vectors), n_lists * 256)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = _assign(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        for c in range(n_lists):
+            members = order[bounds[c] : bounds[c + 1]]
+            if len(members):
+                centroids[c] = sample[members].sum(axis=0)
+            else:
+                # Empty list: restart it from a random point
+                centroids[c] = sample[rng.integers(sample_size)]
+        centroids = normalize(centroids)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Cosine similarity index over the rows of `vectors` (already grouped by list).
+
+    Args:
+        vectors: (n, d) normalized vectors, list after list
+        centroids: (n_lists, d) normalized centroids
+        offsets: (n_lists + 1,) start of every list in `vectors`
+        codes: Optional quantized `vectors` (see quantize), scanned instead of them
+        scale: Per-dimension scale of int8 codes
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        offsets: np.ndarray,
+        codes: np.ndarray | None = None,
+        scale: np.ndarray | None = None,
+    ):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.codes = codes
+        self.scale = scale
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def quantization(self) -> str:
+        if self.codes is None:
+            return "none"
+        return "int8" if self.codes.dtype == np.int8 else "binary"
+
+    @property
+    def scanned_bytes(self) -> int:
+        """Size of what queries scan: the codes if quantized, else the vectors."""
+        return (self.codes if self.codes is not None else self.vectors).nbytes
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        n_lists: int | None = None,
+        iterations: int = 10,
+        seed: int = 0,
+        quantization: str = "none",
+    ) -> tuple["IVFIndex", np.ndarray]:
+        """
+        Cluster `vectors` into `n_lists` lists (default: about sqrt(n)), and
+        quantize them unless `quantization` is "none".
+
+        Returns:
+            The index and the permutation applied to the rows: row i of the
+            index is row order[i] of `vectors`
+        """
+        vectors = normalize(vectors)
+        if len(vectors) == 0:
+            dims = vectors.shape[1] if vectors.ndim == 2 else 0
+            return cls(
+                np.zeros((0, dims), dtype=np.float32),
+                np.zeros((0, dims), dtype=np.float32),
+                np.zeros(1, dtype=np.int64),
+            ), np.zeros(0, dtype=np.int64)
+
+        n_lists = min(n_lists or default_n_lists(len(vectors)), len(vectors))
+        if n_lists <= 1:
+            centroids = normalize(vectors.mean(axis=0, keepdims=True))
+            offsets = np.array([0, len(vectors)], dtype=np.int64)
+            order = np.arange(len(vectors))
+        else:
+            rng = np.random.default_rng(seed)
+            centroids = _spherical_kmeans(vectors, n_lists, iterations, rng)
+            assignment = _assign(vectors, centroids)
+            order = np.argsort(assignment, kind="stable")
+            offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1)).astype(np.int64)
+            vectors = vectors[order]
+
+        codes = scale = None
+        if quantization != "none":
+            codes, scale = quantize(vectors, quantization)
+        return cls(vectors, centroids, offsets, codes, scale), order
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / VECTORS_FILE, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        np.save(directory / CENTROIDS_FILE, self.centroids.astype(np.float32))
+        np.save(directory / OFFSETS_FILE, self.offsets.astype(np.int64))
+        if self.codes is not None:
+            np.save(directory / CODES_FILE, self.codes)
+        if self.scale is not None:
+            np.save(directory / SCALE_FILE, self.scale)
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "IVFIndex":
+        directory = Path(directory)
+        mmap_mode = "r" if mmap else None
+        codes = scale = None
+        if (directory / CODES_FILE).exists():
+            codes = np.load(directory / CODES_FILE, mmap_mode=mmap_mode)
+        if (directory / SCALE_FILE).exists():
+            scale = np.load(directory / SCALE_FILE)
+        return cls(
+            np.load(directory / VECTORS_FILE, mmap_mode=mmap_mode),
+            np.load(directory / CENTROIDS_FILE),
+            np.load(directory / OFFSETS_FILE),
+            codes,
+            scale,
+        )
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: int = 8,
+        exclude: np.ndarray | None = None,
+        oversampling: float = 4.0,
+        rescore: bool = True,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by cosine similarity.
+
+        Args:
+            query: (d,) query vector (normalized here)
+            k: Number of results
+            nprobe: Lists scanned; nprobe >= n_lists is an exact search
+            exclude: Optional boolean mask of the rows to skip (deleted rows)
+            oversampling: Quantized index: candidates rescored per result
+            rescore: Quantized index: rescore the candidates with the float32
+                vectors (else the scores are the approximate ones)
+
+        Returns:
+            (rows, scores), best first
+        """
+        if len(self.vectors) == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        query = normalize(query)
+        if nprobe >= self.n_lists:
+            lists = range(self.n_lists)
+        else:
+            centroid_scores = self.centroids @ query
+            # In list order, like search_batch: ties between candidates break the same way
+            lists = np.sort(np.argpartition(-centroid_scores, nprobe - 1)[:nprobe])
+
+        score_slice = self._scorer(query)
+        rows, scores = [], []
+        for c in lists:
+            start, end = int(self.offsets[c]), int(self.offsets[c + 1])
+            if start == end:
+                continue
+            rows.append(np.arange(start, end))
+            scores.append(score_slice(start, end))
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        return self._select(
+            query, np.concatenate(rows), np.concatenate(scores), k, exclude, oversampling, rescore
+        )
+
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        k: int,
+        nprobe: int = 8,
+        exclude: np.ndarray | None = None,
+        oversampling: float = 4.0,
+        rescore: bool = True,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        search() for many queries at once: every probed list is scanned once for
+        all the queries probing it, with one matrix product.
+
+        Args:
+            queries: (m, d) query vectors (normalized here)
+            k, nprobe, exclude, oversampling, rescore: As in search()
+
+        Returns:
+            (rows, scores) of every query, in the order of `queries`
+        """
+        queries = normalize(np.atleast_2d(queries))
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if len(self.vectors) == 0 or k <= 0:
+            return [empty for _ in queries]
+
+        probes = np.ones((len(queries), self.n_lists), dtype=bool)
+        if nprobe < self.n_lists:
+            centroid_scores = queries @ self.centroids.T
+            nearest = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+            probes[:] = False
+            np.put_along_axis(probes, nearest, True, axis=1)
+
+        score_block = self._batch_scorer(queries)
+        rows = [[] for _ in queries]
+        scores = [[] for _ in queries]
+        for c in range(self.n_lists):
+            start, end = int(self.offsets[c]), int(self.offsets[c + 1])
+            members = np.flatnonzero(probes[:, c])
+            if start == end or not len(members):
+                continue
+            block = score_block(start, end, members)
+            list_rows = np.arange(start, end)
+            for column, q in enumerate(members):
+                rows[q].append(list_rows)
+                scores[q].append(block[:, column])
+
+        return [
+            self._select(
+                queries[q], np.concatenate(rows[q]), np.concatenate(scores[q]),
+                k, exclude, oversampling, rescore,
+            )
+            if rows[q]
+            else empty
+            for q in range(len(queries))
+        ]
+
+    def _select(self, query, rows, scores, k, exclude, oversampling, rescore):
+        """Top-k of the scanned rows: deleted rows dropped, quantized scores rescored."""
+        if exclude is not None:
+            keep = ~exclude[rows]
+            rows, scores = rows[keep], scores[keep]
+
+        if self.codes is not None and rescore:
+            candidates = _top(scores, int(np.ceil(k * max(oversampling, 1.0))))
+            # Sorted rows: the memory-mapped vectors are read front to back
+            rows = np.sort(rows[candidates])
+            scores = np.asarray(self.vectors[rows]) @ query
+
+        top = _top(scores, k)
+        return rows[top], scores[top]
+
+    def _batch_scorer(self, queries: np.ndarray):
+        """Function scoring rows [start, end) against the `members` queries: (rows, members)."""
+        if self.codes is None:
+            return lambda start, end, members: self.vectors[start:end] @ queries[members].T
+        if self.scale is not None:
+            scaled = (queries * self.scale / 127).astype(np.float32)
+            return lambda start, end, members: (
+                self.codes[start:end].astype(np.float32) @ scaled[members].T
+            )
+        bits = np.packbits(queries > 0, axis=1)
+        dims = queries.shape[1]
+        return lambda start, end, members: np.stack(
+            [
+                1.0 - 2.0 * _popcount(self.codes[start:end] ^ bits[q]).sum(axis=1, dtype=np.int32) / dims
+                for q in members
+            ],
+            axis=1,
+        ).astype(np.float32)
+
+    def _scorer(self, query: np.ndarray):
+        """Function scoring rows [start, end) against the query."""
+        if self.codes is None:
+            return lambda start, end: self.vectors[start:end] @ query
+        if self.scale is not None:
+            # int8: asymmetric dot product, the query stays in float
+            scaled = (query * self.scale / 127).astype(np.float32)
+            return lambda start, end: self.codes[start:end].astype(np.float32) @ scaled
+        # binary: 1 - 2 * hamming / d approximates the cosine of the sign vectors
+        bits = np.packbits(query > 0)
+        dims = len(query)
+        return lambda start, end: (
+            1.0 - 2.0 * _popcount(self.codes[start:end] ^ bits).sum(axis=1, dtype=np.int32) / dims
+        ).astype(np.float32)
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k best scores, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]